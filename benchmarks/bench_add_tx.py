@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+# Per-tx cost of add_tx_to_block as the utxo cache grows
+#
+# Usage: ./benchmarks/bench_add_tx.py [sizes] [txs_per_size]
+#        ./benchmarks/bench_add_tx.py 1000,10000,100000,1000000 200
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import misocoin.utils as mutils
+
+from misocoin.crypto import get_new_priv_key, get_pub_key, get_address, sig_cache
+from misocoin.hashing import sha256
+from misocoin.struct import Vin, Vout, Transaction, Block
+
+
+def build_utxos(size: int, address: str, funded: int):
+    '''
+    Builds a utxo cache with `size` entries, the first `funded`
+    of them belong to address
+    '''
+    utxos = {}
+    for i in range(size):
+        txid = sha256(str(i))
+        utxos[txid] = {
+            0: {
+                'address': address if i < funded else sha256(txid)[:40],
+                'amount': 10
+            }
+        }
+    return utxos
+
+
+def bench(size: int, count: int, priv_key: str, address: str):
+    utxos = build_utxos(size, address, count)
+    txs = {}
+    block = Block('0' * 64, [], 1, int(time.time()), 1, 0)
+
+    # Sign outside of the timed loop
+    signed = []
+    for i in range(count):
+        tx = Transaction([Vin(sha256(str(i)), 0)], [Vout(address, 9)])
+        signed.append(mutils.sign_tx(tx, 0, priv_key))
+
+    # Signatures are deterministic, so the same txs from the
+    # last size would already be in the signature cache
+    sig_cache.clear()
+
+    start = time.perf_counter()
+    for tx in signed:
+        mutils.add_tx_to_block(tx, block, txs, utxos)
+    elapsed = time.perf_counter() - start
+
+    print('utxos={:>8}  txs={:>5}  per tx={:8.3f} ms'.format(
+        size, count, elapsed / count * 1000))
+
+
+if __name__ == '__main__':
+    sizes = [1000, 10000, 100000, 1000000]
+    count = 200
+
+    if len(sys.argv) > 1:
+        sizes = list(map(int, sys.argv[1].split(',')))
+    if len(sys.argv) > 2:
+        count = int(sys.argv[2])
+
+    priv_key = get_new_priv_key()
+    address = get_address(get_pub_key(priv_key))
+
+    for size in sizes:
+        bench(max(size, count), count, priv_key, address)
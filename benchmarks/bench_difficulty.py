@@ -0,0 +1,87 @@
+#! /usr/bin/env python
+# Replays a long chain of headers through the difficulty window,
+# checking each one's difficulty before connecting it, and times
+# every chunk of it. Retargeting only looks at the last few
+# timestamps, so the time per header shouldn't grow with the chain
+#
+# Headers are made up: miners with a fixed hashrate, each block
+# taking (on average) as long as its difficulty needs
+#
+# Usage: ./benchmarks/bench_difficulty.py [headers] [chunks] [hashrate]
+#        ./benchmarks/bench_difficulty.py 100000 10 150
+import os
+import random
+import sys
+import time
+
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from misocoin.blocktree import block_work
+from misocoin.difficulty import DifficultyWindow
+
+Header = namedtuple('Header', ['height', 'timestamp', 'difficulty'])
+
+GENESIS_EPOCH = 1512254915
+
+
+def build_headers(count: int, hashrate: float):
+    random.seed(0)
+    window = DifficultyWindow()
+    headers = []
+    timestamp = GENESIS_EPOCH
+
+    for height in range(1, count + 1):
+        difficulty = window.expected(height)
+        header = Header(height, int(timestamp), difficulty)
+        window.connect(header)
+        headers.append(header)
+        timestamp += random.expovariate(hashrate / block_work(difficulty))
+
+    return headers
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    chunks = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    hashrate = float(sys.argv[3]) if len(sys.argv) > 3 else 150
+
+    headers = build_headers(count, hashrate)
+    window = DifficultyWindow()
+    size = count // chunks
+    times = []
+
+    for i in range(chunks):
+        start = time.perf_counter()
+        for header in headers[i * size:(i + 1) * size]:
+            window.check(header)
+            window.connect(header)
+        times.append((time.perf_counter() - start) / size)
+
+    # Undo and redo the last 1000, like a reorg would
+    start = time.perf_counter()
+    for _ in range(1000):
+        window.disconnect()
+    for header in headers[len(window):chunks * size]:
+        window.check(header)
+        window.connect(header)
+    reorg_time = time.perf_counter() - start
+
+    difficulties = [header.difficulty for header in headers]
+    print('Replayed {} headers (difficulty {} to {}, {:.1f}s a block on average)'.format(
+        chunks * size, min(difficulties), max(difficulties),
+        (headers[-1].timestamp - GENESIS_EPOCH) / count))
+
+    for i, t in enumerate(times):
+        print('  headers {:>7} to {:>7}: {:6.2f} us/header'.format(
+            i * size + 1, (i + 1) * size, t * 1e6))
+    print('  disconnect + reconnect 1000: {:.4f}s'.format(reorg_time))
+
+    # Later headers shouldn't cost more than the first ones
+    # (allowing for timer noise)
+    first, last = min(times[:2]), max(times[-2:])
+    if last > 3 * first:
+        raise Exception('Retarget cost grew from {:.2f} to {:.2f} us/header'.format(
+            first * 1e6, last * 1e6))
+    print('  cost per header is flat ({:.2f}x)'.format(last / first))
@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+# Times txids, preimages with many txids and signature messages
+# (sighashes) with 1 to 10k vins/vouts/txids, against the old
+# preimage building (string concatenation in a reduce, quadratic
+# in the number of items), and checks both give the same digests
+#
+# Usage: ./benchmarks/bench_hashing.py [sizes] [repeat]
+#        ./benchmarks/bench_hashing.py 1,10,100,1000,10000 3
+import os
+import sys
+import time
+
+from functools import reduce
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from misocoin.hashing import sha256, get_hash, get_sighashes
+from misocoin.struct import Transaction, Vin, Vout
+
+
+def old_get_hash(vins=[], vouts=[], txids=[], reward_address='', reward_amount='',
+                 prev_block_hash='', height='', timestamp='', difficulty='', nonce='') -> str:
+    '''
+    get_hash as it used to be
+    '''
+    vins_str = reduce(lambda x, y: x + y.txid + str(y.index), vins, '')
+    vouts_str = reduce(
+        lambda x, y: x + str(getattr(y, 'address', '')) + str(getattr(y, 'value', '')) +
+                        str(getattr(y, 'reward_address', '')) + str(getattr(y, 'reward_amount', '')),
+        vouts, ''
+    )
+    rewards_str = reward_address + str(reward_amount)
+    tx_str = reduce(lambda x, y: x + y, txids, '')
+
+    return sha256(
+        'vins_str' + vins_str + 'rewards_str' + rewards_str + 'tx_str' + tx_str +
+        'block_str' + prev_block_hash + str(height) + str(difficulty) +
+        str(nonce) + str(timestamp) + 'vouts_str' + vouts_str
+    )
+
+
+def best_of(repeat: int, f):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def address(i: int) -> str:
+    return sha256('address' + str(i))[:40]
+
+
+def build_tx(n_vins: int, n_vouts: int) -> Transaction:
+    vins = [Vin(sha256(str(i)), i % 4) for i in range(n_vins)]
+    vouts = [Vout(address(i), i + 1) for i in range(n_vouts)]
+    return Transaction(vins, vouts)
+
+
+def compare(name: str, n: int, repeat: int, new, old):
+    new_digest, new_time = best_of(repeat, new)
+    old_digest, old_time = best_of(repeat, old)
+    if new_digest != old_digest:
+        raise Exception('{} with {} items doesn\'t match the old digest'.format(name, n))
+
+    print('  {:<10} {:>6}: {:10.6f}s  (old {:10.6f}s, {:6.1f}x)'.format(
+        name, n, new_time, old_time, old_time / new_time))
+
+
+if __name__ == '__main__':
+    sizes = [1, 10, 100, 1000, 10000]
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    if len(sys.argv) > 1:
+        sizes = list(map(int, sys.argv[1].split(',')))
+
+    print('Preimage building, best of {} (digests checked against the old code)'.format(repeat))
+    for n in sizes:
+        tx = build_tx(n, n)
+
+        # txid of a tx with n vins and n vouts
+        compare('txid', n, repeat,
+                lambda: get_hash(vins=tx.vins, vouts=tx.vouts),
+                lambda: old_get_hash(vins=tx.vins, vouts=tx.vouts))
+
+        # Preimage with n txids (what block hashes were
+        # before blocks committed to a merkle root instead)
+        txids = [sha256(str(i)) for i in range(n)]
+        compare('txids', n, repeat,
+                lambda: get_hash(txids=txids, prev_block_hash=sha256('prev'), height=n,
+                                 timestamp=1512254915, difficulty=1, nonce=0),
+                lambda: old_get_hash(txids=txids, prev_block_hash=sha256('prev'), height=n,
+                                     timestamp=1512254915, difficulty=1, nonce=0))
+
+        # Signature message of one vin of a tx with n vouts
+        compare('sighash', n, repeat,
+                lambda: get_sighashes(tx.vins[:1], tx.vouts, tx.txid)[0],
+                lambda: old_get_hash(vins=tx.vins[:1], vouts=tx.vouts, txids=[tx.txid]))
+
+        # Every vin's signature message (of a tx with n vins
+        # and 2 vouts, messages include all the vouts)
+        tx2 = build_tx(n, 2)
+        compare('sighashes', n, repeat,
+                lambda: get_sighashes(tx2.vins, tx2.vouts, tx2.txid),
+                lambda: [old_get_hash(vins=[vin], vouts=tx2.vouts, txids=[tx2.txid])
+                         for vin in tx2.vins])
@@ -0,0 +1,91 @@
+#! /usr/bin/env python
+# Throughput of the mempool with a lot of pending txs: inserting
+# them, building a block template, removing a block's worth of
+# confirmed txs and evicting half of them
+#
+# Signatures aren't checked (bench_validation covers those), so
+# this is just the mempool's own bookkeeping
+#
+# Usage: ./benchmarks/bench_mempool.py [pending] [template_txs]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bench_add_tx import build_utxos
+from misocoin.crypto import get_new_priv_key, get_pub_key, get_address
+from misocoin.hashing import sha256
+from misocoin.mempool import Mempool
+from misocoin.struct import Vin, Vout, Transaction
+
+
+def build_txs(count: int, pub_key: str, address: str):
+    '''
+    count txs paying random fees, one in ten spends
+    the output of an earlier one instead of a utxo
+    '''
+    random.seed(0)
+    txs = []
+    for i in range(count):
+        if i % 10 == 9:
+            parent = txs[i - 1]
+            vin, amount = Vin(parent.txid, 0), parent.vouts[0].amount
+        else:
+            vin, amount = Vin(sha256(str(i)), 0), 10
+
+        vin.pub_key = pub_key
+        txs.append(Transaction([vin], [Vout(address, amount - random.randint(0, 3))]))
+    return txs
+
+
+def timed(f):
+    start = time.perf_counter()
+    result = f()
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    pending = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    template_txs = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+
+    pub_key = get_pub_key(get_new_priv_key())
+    address = get_address(pub_key)
+    utxos = build_utxos(pending, address, pending)
+    txs = build_txs(pending, pub_key, address)
+    mempool = Mempool()
+
+    def insert():
+        for tx in txs:
+            mempool.add(tx, utxos, check_sigs=False)
+
+    _, insert_time = timed(insert)
+    (block_txs, fees), template_time = timed(lambda: mempool.select(template_txs))
+    _, select_all_time = timed(lambda: mempool.select())
+
+    # Confirm the template, then another tx spending the same
+    # output as one of the pending txs comes in with the block
+    block_txs = list(block_txs)
+    for tx in block_txs:
+        for vin in tx.vins:
+            utxos.get(vin.txid, {}).pop(vin.index, None)
+
+    pending_tx = mempool.get(mempool.txids()[-1])
+    conflict = Transaction([pending_tx.vins[0]], [Vout(address, 1)])
+    _, remove_time = timed(lambda: mempool.remove_for_block(block_txs + [conflict]))
+
+    left = len(mempool)
+    mempool.max_size = mempool.size // 2
+    evicted, evict_time = timed(mempool.evict)
+
+    print('Mempool with {} pending txs'.format(pending))
+    print('  insert:           {:8.2f}s  ({:.0f} txs/s)'.format(
+        insert_time, pending / insert_time))
+    print('  template of {}: {:8.3f}s  ({} fees)'.format(
+        len(block_txs), template_time, fees))
+    print('  select all:       {:8.3f}s'.format(select_all_time))
+    print('  remove block:     {:8.3f}s  ({} confirmed, {} left)'.format(
+        remove_time, len(block_txs), left))
+    print('  evict to half:    {:8.3f}s  ({} of {} evicted)'.format(
+        evict_time, len(evicted), left))
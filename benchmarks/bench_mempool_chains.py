@@ -0,0 +1,94 @@
+#! /usr/bin/env python
+# Mempool with long chains of unconfirmed txs, each spending
+# the one before it: adding them, building a template (ancestor
+# packages), confirming the first tx of every chain and evicting
+# whole chains, for a few chain lengths
+#
+# Signatures aren't checked, see bench_mempool
+#
+# Usage: ./benchmarks/bench_mempool_chains.py [pending] [lengths] [template_txs]
+#        ./benchmarks/bench_mempool_chains.py 20000 1,10,50,100 5000
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bench_add_tx import build_utxos
+from bench_mempool import timed
+from misocoin.crypto import get_new_priv_key, get_pub_key, get_address
+from misocoin.hashing import sha256
+from misocoin.mempool import Mempool
+from misocoin.struct import Vin, Vout, Transaction
+
+
+def build_chains(count: int, length: int, pub_key: str, address: str):
+    '''
+    count chains of length txs, paying random fees (the
+    last tx of every tenth chain pays for the rest)
+    '''
+    random.seed(0)
+    chains = []
+    for i in range(count):
+        vin, amount = Vin(sha256(str(i)), 0), 10 + 2 * length
+        chain = []
+        for n in range(length):
+            fee = 0 if i % 10 == 0 else random.randint(0, 1)
+            if i % 10 == 0 and n == length - 1:
+                fee = length
+
+            vin.pub_key = pub_key
+            tx = Transaction([vin], [Vout(address, amount - fee)])
+            chain.append(tx)
+            vin, amount = Vin(tx.txid, 0), amount - fee
+        chains.append(chain)
+    return chains
+
+
+def bench(pending: int, length: int, template_txs: int):
+    count = pending // length
+    pub_key = get_pub_key(get_new_priv_key())
+    address = get_address(pub_key)
+
+    utxos = build_utxos(count, address, count)
+    for outputs in utxos.values():
+        outputs[0]['amount'] = 10 + 2 * length
+
+    chains = build_chains(count, length, pub_key, address)
+    mempool = Mempool(max_ancestors=length, max_descendants=length)
+
+    def insert():
+        for chain in chains:
+            for tx in chain:
+                mempool.add(tx, utxos, check_sigs=False)
+
+    _, insert_time = timed(insert)
+    (_, fees), template_time = timed(lambda: mempool.select(template_txs))
+
+    # A block confirms the first tx of every chain
+    roots = [chain[0] for chain in chains]
+    for tx in roots:
+        del utxos[tx.vins[0].txid]
+    _, confirm_time = timed(lambda: mempool.remove_for_block(roots))
+
+    # Then half the chains get evicted
+    mempool.max_size = mempool.size // 2
+    evicted, evict_time = timed(mempool.evict)
+
+    print('length={:>4}  insert={:7.2f}s ({:6.0f} txs/s)  template={:6.3f}s ({} fees)  '
+          'confirm roots={:6.3f}s  evict={:6.3f}s ({} txs)'.format(
+              length, insert_time, count * length / insert_time, template_time, fees,
+              confirm_time, evict_time, len(evicted)))
+
+
+if __name__ == '__main__':
+    pending = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    lengths = [1, 10, 50, 100]
+    template_txs = int(sys.argv[3]) if len(sys.argv) > 3 else 5000
+
+    if len(sys.argv) > 2:
+        lengths = list(map(int, sys.argv[2].split(',')))
+
+    print('Mempool with {} pending txs in chains'.format(pending))
+    for length in lengths:
+        bench(pending, length, template_txs)
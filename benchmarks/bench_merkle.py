@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+# Merkle roots and tx proofs for blocks of 1 to 10k txs: time to
+# build the root, to build and check a proof, the proof's size
+# next to the block's, and the time per nonce when mining (the
+# header is the same size for any number of txs)
+#
+# Usage: ./benchmarks/bench_merkle.py [tx_counts] [nonces]
+#        ./benchmarks/bench_merkle.py 1,10,100,1000,10000 20000
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from misocoin.hashing import sha256
+from misocoin.merkle import merkle_root, merkle_branch, verify_merkle_branch, \
+    header_hash, verify_tx_proof
+from misocoin.struct import Vin, Vout, Transaction, Block
+
+
+def make_block(tx_count: int) -> Block:
+    txs = [
+        Transaction([Vin(sha256(str(i)), 0)], [Vout(sha256(str(i))[:40], 10)])
+        for i in range(tx_count)
+    ]
+    block = Block('0' * 64, txs, 2, 1512254915, 1, 0)
+    while not block.mined:
+        block.nonce += 1
+    return block
+
+
+def timed(f):
+    start = time.perf_counter()
+    result = f()
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    tx_counts = [1, 10, 100, 1000, 10000]
+    nonces = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+
+    if len(sys.argv) > 1:
+        tx_counts = list(map(int, sys.argv[1].split(',')))
+
+    print('{:>6} {:>10} {:>10} {:>10} {:>8} {:>11} {:>10}'.format(
+        'txs', 'root', 'proof', 'verify', 'proof B', 'block B', 'per nonce'))
+    for n in tx_counts:
+        block = make_block(n)
+        txids = block.txids()
+        position = n // 2
+
+        root, root_time = timed(lambda: merkle_root(txids))
+        branch, proof_time = timed(lambda: merkle_branch(txids, position))
+        valid, verify_time = timed(lambda: verify_merkle_branch(txids[position], branch, root))
+
+        proof = {'txid': txids[position], 'block_hash': block.block_hash,
+                 'header': block.header(), 'branch': branch}
+        proof = json.loads(json.dumps(proof))
+        if not (valid and verify_tx_proof(proof) and header_hash(proof['header']) == block.block_hash):
+            raise Exception('Proof for block of {} txs doesn\'t check out'.format(n))
+
+        hasher = block.mining_hasher()
+        start = time.perf_counter()
+        for nonce in range(nonces):
+            hasher.hash(nonce, block.timestamp)
+        per_nonce = (time.perf_counter() - start) / nonces
+
+        print('{:>6} {:9.5f}s {:9.6f}s {:9.6f}s {:>8} {:>11} {:8.2f}us'.format(
+            n, root_time, proof_time, verify_time, len(json.dumps(proof)),
+            len(json.dumps(block.toJSON())), per_nonce * 1e6))
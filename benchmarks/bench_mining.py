@@ -0,0 +1,67 @@
+#! /usr/bin/env python
+# Hashes per second when mining, rebuilding the whole block
+# hash per nonce (Block.mined) vs Block.mining_hasher
+#
+# Usage: ./benchmarks/bench_mining.py [tx_counts] [seconds]
+#        ./benchmarks/bench_mining.py 0,100,1000 2
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from misocoin.hashing import sha256
+from misocoin.struct import Vin, Vout, Transaction, Block
+
+
+def make_block(tx_count: int) -> Block:
+    txs = [
+        Transaction([Vin(sha256(str(i)), 0)], [Vout(sha256(str(i))[:40], 10)])
+        for i in range(tx_count)
+    ]
+    # Difficulty high enough that we never actually find a block
+    return Block('0' * 64, txs, 2, int(time.time()), 64, 0)
+
+
+def old_path(block: Block, seconds: float) -> float:
+    hashes = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        block.nonce += 1
+        block.mined
+        hashes += 1
+    return hashes / (time.perf_counter() - start)
+
+
+def new_path(block: Block, seconds: float) -> float:
+    hashes = 0
+    start = time.perf_counter()
+    hasher = block.mining_hasher()
+    target = '0' * block.difficulty
+    while time.perf_counter() - start < seconds:
+        block.nonce += 1
+        hasher.hash(block.nonce, block.timestamp)[:block.difficulty] == target
+        hashes += 1
+    return hashes / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    tx_counts = [0, 100, 1000]
+    seconds = 2.0
+
+    if len(sys.argv) > 1:
+        tx_counts = list(map(int, sys.argv[1].split(',')))
+    if len(sys.argv) > 2:
+        seconds = float(sys.argv[2])
+
+    # Sanity check, both paths must agree
+    block = make_block(10)
+    assert block.mining_hasher().hash(block.nonce, block.timestamp) == block.block_hash
+
+    print('{:>6} {:>14} {:>14} {:>8}'.format('txs', 'old H/s', 'new H/s', 'speedup'))
+    for tx_count in tx_counts:
+        block = make_block(tx_count)
+        old = old_path(block, seconds)
+        new = new_path(block, seconds)
+        print('{:>6} {:>14.0f} {:>14.0f} {:>7.1f}x'.format(
+            tx_count, old, new, new / old))
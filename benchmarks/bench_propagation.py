@@ -0,0 +1,106 @@
+#! /usr/bin/env python
+# Time for a block to reach every node of a local network
+# (every node connected to every other), relaying serially
+# vs in the background. Also with one frozen node, which
+# never answers (the others give up after -read_timeout)
+#
+# Usage: ./benchmarks/bench_propagation.py [nodes] [blocks] [port]
+import io
+import os
+import signal
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import misocoind
+
+from misocoin.struct import Coinbase
+from misocoin.sync import RPCClient
+
+
+def start_network(n: int, port: int, broadcast: str, frozen: bool):
+    script = os.path.join(os.path.dirname(__file__), '..', 'misocoind.py')
+    ports = list(range(port, port + n))
+    nodes = []
+
+    for p in ports:
+        peers = ','.join('localhost:{}'.format(x) for x in ports if x != p)
+        nodes.append(subprocess.Popen(
+            [sys.executable, script, '-port={}'.format(p), '-miners=0',
+             '-nodes={}'.format(peers), '-broadcast={}'.format(broadcast),
+             '-read_timeout=2'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ))
+
+    clients = [RPCClient(port=p, read_timeout=5) for p in ports]
+    for client in clients:
+        for _ in range(600):
+            try:
+                client.call('get_info', [])
+                break
+            except Exception:
+                time.sleep(0.1)
+
+    if frozen:
+        nodes[-1].send_signal(signal.SIGSTOP)
+        clients = clients[:-1]
+
+    return nodes, clients
+
+
+def next_block():
+    block = misocoind.global_best_block
+    block.timestamp = misocoind.genesis_epoch + 40 * block.height
+    while not block.mined:
+        block.nonce += 1
+
+    block.coinbase = Coinbase(
+        block.prev_block_hash, misocoind.account_address, 15)
+    misocoind.add_to_blockchain(block)
+    return block
+
+
+def propagate(clients, block) -> float:
+    start = time.perf_counter()
+    clients[0].call('receive_mined_block', [misocoind.encode_block(block)])
+
+    waiting = list(clients)
+    while len(waiting) > 0:
+        waiting = [c for c in waiting if c.call('get_info', [])['height'] < block.height]
+        time.sleep(0.001)
+    return time.perf_counter() - start
+
+
+def run(n: int, blocks: int, port: int, broadcast: str, frozen: bool) -> float:
+    nodes, clients = start_network(n, port, broadcast, frozen)
+
+    try:
+        return max(propagate(clients, misocoind.global_blockchain[h])
+                   for h in range(1, blocks + 1))
+    finally:
+        for node in nodes:
+            node.send_signal(signal.SIGCONT)
+            node.kill()
+            node.wait()
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    blocks = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    port = int(sys.argv[3]) if len(sys.argv) > 3 else 4910
+
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    for _ in range(blocks):
+        next_block()
+    sys.stdout = stdout
+
+    print('Worst time for a block to reach all {} nodes ({} blocks)'.format(n, blocks))
+    for frozen in (False, True):
+        for broadcast in ('serial', 'background'):
+            elapsed = run(n, blocks, port, broadcast, frozen)
+            print('  {:10} {:18} {:8.3f}s'.format(
+                broadcast, 'one frozen node' if frozen else '', elapsed))
+            port += n
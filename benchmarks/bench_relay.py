@@ -0,0 +1,175 @@
+#! /usr/bin/env python
+# Bytes on the wire between the nodes of a local network
+# (every node connected to every other) relaying txs, pushing
+# every tx to every node vs announcing txids (inv/get_data)
+#
+# Only JSON-RPC bodies are counted, not HTTP headers
+#
+# Usage: ./benchmarks/bench_relay.py [nodes] [txs] [port]
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import misocoind
+import misocoin.utils as mutils
+
+from misocoin.struct import Vin, Vout, Coinbase, Transaction
+from misocoin.sync import RPCClient
+
+
+class CountingClient(RPCClient):
+    '''
+    Counts the bytes of our own calls,
+    so we can leave them out
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bytes = 0
+
+    def _post(self, payload):
+        data = json.dumps(payload)
+        response = self.session.post(
+            self.url, data=data, headers={'content-type': 'application/json'},
+            timeout=self.timeout
+        )
+        self.bytes += len(data) + len(response.content)
+        return response.json()
+
+
+def mine(block):
+    block.timestamp = misocoind.genesis_epoch + 40 * block.height
+    while not block.mined:
+        block.nonce += 1
+
+    block.coinbase = Coinbase(
+        block.prev_block_hash, misocoind.account_address, 15)
+    misocoind.add_to_blockchain(block)
+
+
+def build_chain(txs: int, datadir: str):
+    '''
+    Chain with (at least) txs unspent outputs of 1 misocoin,
+    returns (txid, index) of each of them
+    '''
+    misocoind.load_chain(datadir)
+
+    coinbases = []
+    while len(coinbases) * 15 < txs:
+        mine(misocoind.global_best_block)
+        coinbases.append(misocoind.global_blockchain[len(
+            misocoind.global_blockchain)].coinbase.txid)
+
+    # Split every coinbase into 15 outputs
+    outputs = []
+    for txid in coinbases:
+        tx = Transaction([Vin(txid, 0)], [Vout(misocoind.account_address, 1)] * 15)
+        tx = mutils.sign_tx(tx, 0, misocoind.account_priv_key)
+        misocoind.send_raw_tx(json.dumps(tx.toJSON()))
+        outputs += [(tx.txid, i) for i in range(15)]
+
+    mine(misocoind.refresh_template())
+    misocoind.global_store.close()
+    return outputs[:txs]
+
+
+def start_network(n: int, port: int, relay: str, datadir: str, workdir: str):
+    script = os.path.join(os.path.dirname(__file__), '..', 'misocoind.py')
+    ports = list(range(port, port + n))
+    nodes = []
+
+    for p in ports:
+        node_datadir = os.path.join(workdir, '{}-{}'.format(relay, p))
+        shutil.copytree(datadir, node_datadir)
+
+        peers = ','.join('localhost:{}'.format(x) for x in ports if x != p)
+        nodes.append(subprocess.Popen(
+            [sys.executable, script, '-port={}'.format(p), '-miners=0',
+             '-nodes={}'.format(peers), '-relay={}'.format(relay),
+             '-datadir={}'.format(node_datadir)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ))
+
+    clients = [CountingClient(port=p, read_timeout=60) for p in ports]
+    for client in clients:
+        for _ in range(600):
+            try:
+                client.call('get_info', [])
+                break
+            except Exception:
+                time.sleep(0.1)
+
+    return nodes, clients
+
+
+def net_bytes(clients) -> int:
+    totals = [c.call('get_net_totals', []) for c in clients]
+    return sum(t['bytes_recv'] + t['bytes_sent'] for t in totals)
+
+
+def run(n: int, port: int, relay: str, raw_txs, datadir: str, workdir: str):
+    nodes, clients = start_network(n, port, relay, datadir, workdir)
+
+    try:
+        # Let the nodes introduce themselves
+        time.sleep(2)
+        before = net_bytes(clients)
+        ours = sum(c.bytes for c in clients)
+        start = time.perf_counter()
+
+        for i in range(0, len(raw_txs), 100):
+            clients[0].batch([('send_raw_tx', [tx]) for tx in raw_txs[i:i + 100]])
+
+        waiting = list(clients)
+        while len(waiting) > 0:
+            time.sleep(1)
+            waiting = [c for c in waiting if len(
+                c.call('get_mempool', [])) < len(raw_txs)]
+
+        elapsed = time.perf_counter() - start
+        ours = sum(c.bytes for c in clients) - ours
+        after = net_bytes(clients)
+
+        # get_net_totals counts the previous get_net_totals calls
+        return after - before - ours, elapsed
+    finally:
+        for node in nodes:
+            node.kill()
+            node.wait()
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    txs = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    port = int(sys.argv[3]) if len(sys.argv) > 3 else 4930
+
+    workdir = tempfile.mkdtemp()
+    datadir = os.path.join(workdir, 'chain')
+
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    outputs = build_chain(txs, datadir)
+    sys.stdout = stdout
+
+    raw_txs = []
+    for txid, index in outputs:
+        tx = Transaction([Vin(txid, index)], [Vout(
+            '7b13fb41e910a1b022639f8463ce02596b8c9d4b', 1)])
+        tx = mutils.sign_tx(tx, 0, misocoind.account_priv_key)
+        raw_txs.append(json.dumps(tx.toJSON()))
+
+    try:
+        print('{} nodes relaying {} txs'.format(n, txs))
+        for relay in ('push', 'inv'):
+            total, elapsed = run(n, port, relay, raw_txs, datadir, workdir)
+            print('  {:5} {:8.2f} MB  {:6.1f}s'.format(relay, total / 1e6, elapsed))
+            port += n
+    finally:
+        shutil.rmtree(workdir)
@@ -0,0 +1,85 @@
+#! /usr/bin/env python
+# Latency of sequential calls to a local daemon, a new
+# connection per call vs the pooled keep-alive client
+#
+# Usage: ./benchmarks/bench_rpc_client.py [calls] [port]
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import shutil
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from misocoin.sync import RPCClient
+
+
+def old_cli(m, args, host='localhost', port=4000):
+    # What misocoin_cli used to do
+    url = "http://{}:{}/jsonrpc".format(host, port)
+    headers = {'content-type': 'application/json'}
+    payload = {"method": m, "params": args, "jsonrpc": "2.0", "id": 0}
+    return requests.post(url, data=json.dumps(payload), headers=headers).json()['result']
+
+
+def start_daemon(datadir: str, port: int):
+    script = os.path.join(os.path.dirname(__file__), '..', 'misocoind.py')
+    daemon = subprocess.Popen(
+        [sys.executable, script, '-port={}'.format(port),
+         '-miners=0', '-datadir={}'.format(datadir)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    for _ in range(600):
+        try:
+            old_cli('get_info', [], port=port)
+            return daemon
+        except Exception:
+            time.sleep(0.1)
+
+    daemon.kill()
+    raise Exception('Daemon didn\'t start')
+
+
+def timed(f, calls: int):
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(calls):
+        t = time.perf_counter()
+        f()
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+if __name__ == '__main__':
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 4901
+    datadir = tempfile.mkdtemp()
+    daemon = start_daemon(datadir, port)
+
+    try:
+        old = timed(lambda: old_cli('get_info', [], port=port), calls)
+
+        client = RPCClient(port=port)
+        new = timed(lambda: client.call('get_info', []), calls)
+
+        # Same number of calls, 100 per request
+        batches = calls // 100
+        batch = timed(lambda: client.batch([('get_info', [])] * 100), batches)
+    finally:
+        daemon.kill()
+        shutil.rmtree(datadir)
+
+    print('{} sequential get_info calls to a local daemon'.format(calls))
+    print('  new connection per call: {:6.2f}s  p50 {:6.2f}ms  p99 {:6.2f}ms'.format(
+        old[0], old[1] * 1000, old[2] * 1000))
+    print('  pooled keep-alive:       {:6.2f}s  p50 {:6.2f}ms  p99 {:6.2f}ms'.format(
+        new[0], new[1] * 1000, new[2] * 1000))
+    print('  batches of 100:          {:6.2f}s'.format(batch[0]))
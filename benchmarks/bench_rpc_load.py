@@ -0,0 +1,131 @@
+#! /usr/bin/env python
+# Latency and throughput of the RPC server under load from
+# concurrent clients, werkzeug (thread per request) vs -rpc=async
+#
+# Usage: ./benchmarks/bench_rpc_load.py [clients] [calls] [port]
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import misocoind
+import misocoin.utils as mutils
+
+from bench_relay import build_chain
+from misocoin.struct import Vin, Vout, Transaction
+from misocoin.sync import RPCClient
+
+
+def start_daemon(datadir: str, port: int, rpc: str):
+    script = os.path.join(os.path.dirname(__file__), '..', 'misocoind.py')
+    daemon = subprocess.Popen(
+        [sys.executable, script, '-port={}'.format(port), '-miners=0',
+         '-datadir={}'.format(datadir), '-rpc={}'.format(rpc)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    client = RPCClient(port=port)
+    for _ in range(600):
+        try:
+            client.call('get_info', [])
+            return daemon
+        except Exception:
+            time.sleep(0.1)
+
+    daemon.kill()
+    raise Exception('Daemon didn\'t start')
+
+
+def load(port: int, clients: int, calls):
+    '''
+    Makes calls (a list of (method, params)) split
+    between clients threads, returns the latencies
+    '''
+    latencies = []
+    lock = threading.Lock()
+
+    def run(my_calls):
+        client = RPCClient(port=port)
+        mine = []
+        for m, args in my_calls:
+            start = time.perf_counter()
+            result = client.call(m, args)
+            mine.append(time.perf_counter() - start)
+
+            if isinstance(result, dict) and 'error' in result:
+                raise Exception('{} failed: {}'.format(m, result))
+
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=run, args=(calls[i::clients],))
+               for i in range(clients)]
+
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return (
+        len(latencies) / elapsed,
+        latencies[len(latencies) // 2],
+        latencies[int(len(latencies) * 0.99)]
+    )
+
+
+if __name__ == '__main__':
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    calls = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    port = int(sys.argv[3]) if len(sys.argv) > 3 else 4960
+
+    workdir = tempfile.mkdtemp()
+    datadir = os.path.join(workdir, 'chain')
+
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    outputs = build_chain(calls, datadir)
+    sys.stdout = stdout
+    height = len(misocoind.global_blockchain)
+
+    raw_txs = []
+    for txid, index in outputs:
+        tx = Transaction([Vin(txid, index)], [Vout(
+            '7b13fb41e910a1b022639f8463ce02596b8c9d4b', 1)])
+        tx = mutils.sign_tx(tx, 0, misocoind.account_priv_key)
+        raw_txs.append(json.dumps(tx.toJSON()))
+
+    workloads = [
+        ('get_info', [('get_info', [])] * calls),
+        ('get_block', [('get_block', [random.randint(1, height)]) for _ in range(calls)]),
+        ('send_raw_tx', [('send_raw_tx', [tx]) for tx in raw_txs]),
+    ]
+
+    print('{} clients, {} calls of each method'.format(clients, calls))
+    try:
+        for rpc in ('werkzeug', 'async'):
+            rpc_datadir = os.path.join(workdir, rpc)
+            shutil.copytree(datadir, rpc_datadir)
+            daemon = start_daemon(rpc_datadir, port, rpc)
+
+            try:
+                for name, workload in workloads:
+                    rps, p50, p99 = load(port, clients, workload)
+                    print('  {:9} {:12} {:7.0f} req/s  p50 {:7.2f}ms  p99 {:7.2f}ms'.format(
+                        rpc, name, rps, p50 * 1000, p99 * 1000))
+            finally:
+                daemon.kill()
+                daemon.wait()
+            port += 1
+    finally:
+        shutil.rmtree(workdir)
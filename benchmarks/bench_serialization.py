@@ -0,0 +1,84 @@
+#! /usr/bin/env python
+# Serialize/deserialize throughput of blocks, JSON vs the
+# compact binary format. The wire columns include the JSON-RPC
+# envelope the block travels in between nodes
+#
+# Usage: ./benchmarks/bench_serialization.py [tx_counts] [seconds]
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import misocoin.utils as mutils
+
+from misocoin.crypto import get_new_priv_key, get_pub_key, get_address
+from misocoin.hashing import sha256
+from misocoin.struct import Vin, Vout, Coinbase, Transaction, Block
+
+
+def make_block(tx_count: int, priv_key: str, address: str) -> Block:
+    txs = []
+    for i in range(tx_count):
+        tx = Transaction([Vin(sha256(str(i)), 0), Vin(sha256(str(i + 1)), 1)],
+                         [Vout(address, 10), Vout(sha256(str(i))[:40], 5)])
+        for idx in range(len(tx.vins)):
+            tx = mutils.sign_tx(tx, idx, priv_key)
+        txs.append(tx)
+
+    block = Block(sha256('prev'), txs, 100, int(time.time()), 4, 123456)
+    block.coinbase = Coinbase(block.prev_block_hash, address, 15)
+    return block
+
+
+def rate(fn, seconds: float) -> float:
+    n = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        fn()
+        n += 1
+    return n / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    tx_counts = [1, 100, 1000]
+    seconds = 1.0
+
+    if len(sys.argv) > 1:
+        tx_counts = list(map(int, sys.argv[1].split(',')))
+    if len(sys.argv) > 2:
+        seconds = float(sys.argv[2])
+
+    priv_key = get_new_priv_key()
+    address = get_address(get_pub_key(priv_key))
+
+    print('{:>5} {:>9} {:>9} {:>11} {:>11} {:>11} {:>11} {:>11} {:>11}'.format(
+        'txs', 'json B', 'bin B', 'json enc/s', 'bin enc/s', 'json dec/s',
+        'bin dec/s', 'json wire/s', 'bin wire/s'))
+
+    for tx_count in tx_counts:
+        block = make_block(tx_count, priv_key, address)
+        json_str = json.dumps(block.toJSON())
+        raw = block.toBytes()
+
+        # Must round trip
+        assert Block.fromBytes(raw).toJSON() == Block.fromJSON(json.loads(json_str)).toJSON()
+
+        # What a peer receives from get_block / get_block_raw
+        json_envelope = json.dumps({'jsonrpc': '2.0', 'id': 0, 'result': json_str})
+        bin_envelope = json.dumps(
+            {'jsonrpc': '2.0', 'id': 0, 'result': base64.b64encode(raw).decode()})
+
+        print('{:>5} {:>9} {:>9} {:>11.0f} {:>11.0f} {:>11.0f} {:>11.0f} {:>11.0f} {:>11.0f}'.format(
+            tx_count, len(json_str), len(raw),
+            rate(lambda: json.dumps(block.toJSON()), seconds),
+            rate(lambda: block.toBytes(), seconds),
+            rate(lambda: Block.fromJSON(json.loads(json_str)), seconds),
+            rate(lambda: Block.fromBytes(raw), seconds),
+            rate(lambda: Block.fromJSON(json.loads(
+                json.loads(json_envelope)['result'])), seconds),
+            rate(lambda: Block.fromBytes(base64.b64decode(
+                json.loads(bin_envelope)['result'])), seconds)
+        ))
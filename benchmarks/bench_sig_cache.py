@@ -0,0 +1,69 @@
+#! /usr/bin/env python
+# Time to accept a block when most of its txs were already
+# verified on their way into the best block (as relayed txs),
+# with and without the signature cache
+#
+# Usage: ./benchmarks/bench_sig_cache.py [txs] [seen_percent]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import misocoin.utils as mutils
+
+from misocoin.crypto import get_new_priv_key, get_pub_key, get_address, sig_cache, pub_key_to_point
+from misocoin.hashing import sha256
+from misocoin.struct import Vin, Vout, Transaction, Block
+from misocoin.validation import connect_txs
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    seen = int(sys.argv[2]) if len(sys.argv) > 2 else 90
+
+    # A handful of wallets
+    keys = [get_new_priv_key() for _ in range(10)]
+    addresses = [get_address(get_pub_key(k)) for k in keys]
+
+    block_txs = []
+    utxos = {}
+    for i in range(count):
+        txid = sha256(str(i))
+        owner = i % len(keys)
+        utxos[txid] = {0: {'address': addresses[owner], 'amount': 10}}
+
+        tx = Transaction([Vin(txid, 0)], [Vout(addresses[0], 10)])
+        block_txs.append(mutils.sign_tx(tx, 0, keys[owner]))
+
+    def fresh_utxos():
+        return {txid: {0: dict(outputs[0])} for txid, outputs in utxos.items()}
+
+    # Cold: nothing seen before
+    sig_cache.clear()
+    block = Block('0' * 64, [], 1, int(time.time()), 1, 0)
+    start = time.perf_counter()
+    connect_txs(block_txs, block, {}, fresh_utxos())
+    cold = time.perf_counter() - start
+
+    # Warm: seen% of the txs went through add_tx_to_block first
+    sig_cache.clear()
+    mempool_utxos = fresh_utxos()
+    template = Block('0' * 64, [], 1, int(time.time()), 1, 0)
+    for tx in random.sample(block_txs, count * seen // 100):
+        mutils.add_tx_to_block(tx, template, {}, mempool_utxos)
+
+    sig_cache.hits = sig_cache.misses = 0
+    block = Block('0' * 64, [], 1, int(time.time()), 1, 0)
+    start = time.perf_counter()
+    connect_txs(block_txs, block, {}, fresh_utxos())
+    warm = time.perf_counter() - start
+
+    print('Block of {} txs, {}% of them seen before'.format(count, seen))
+    print('  no cache:  {:8.3f}s'.format(cold))
+    print('  cache:     {:8.3f}s  ({:.1f}% hit rate, {:.2f}x)'.format(
+        warm, sig_cache.hit_rate() * 100, cold / warm))
+
+    info = pub_key_to_point.cache_info()
+    print('  pub key cache: {} hits, {} misses'.format(info.hits, info.misses))
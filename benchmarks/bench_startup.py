@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+# Startup time of a node with an on-disk block store, loading
+# the last snapshot vs replaying the whole chain
+#
+# Usage: ./benchmarks/bench_startup.py [blocks] [datadir]
+import importlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import misocoind
+
+from misocoin.struct import Coinbase
+
+
+def build_chain(blocks: int, datadir: str):
+    # Short chains still get a snapshot to start from
+    misocoind.global_snapshot_every = min(misocoind.global_snapshot_every, blocks)
+    misocoind.load_chain(datadir)
+
+    for height in range(1, blocks + 1):
+        block = misocoind.global_best_block
+
+        # Space blocks out so the difficulty stays at 1
+        block.timestamp = misocoind.genesis_epoch + 40 * height
+        while not block.mined:
+            block.nonce += 1
+
+        block.coinbase = Coinbase(
+            block.prev_block_hash, misocoind.account_address, 15)
+        misocoind.add_to_blockchain(block)
+
+    misocoind.global_store.close()
+
+
+def boot(datadir: str) -> float:
+    importlib.reload(misocoind)
+    start = time.perf_counter()
+    misocoind.load_chain(datadir)
+    elapsed = time.perf_counter() - start
+
+    assert len(misocoind.global_blockchain) == blocks
+    misocoind.global_store.close()
+    return elapsed
+
+
+if __name__ == '__main__':
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    datadir = sys.argv[2] if len(sys.argv) > 2 else tempfile.mkdtemp()
+
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+
+    start = time.perf_counter()
+    build_chain(blocks, datadir)
+    build_time = time.perf_counter() - start
+
+    with_snapshot = boot(datadir)
+    os.remove(os.path.join(datadir, 'chainstate.pkl'))
+    full_replay = boot(datadir)
+
+    sys.stdout = stdout
+    print('Chain of {} blocks (built in {:.1f}s)'.format(blocks, build_time))
+    print('  startup from snapshot:  {:8.3f}s'.format(with_snapshot))
+    print('  startup, full replay:   {:8.3f}s'.format(full_replay))
+
+    if len(sys.argv) <= 2:
+        shutil.rmtree(datadir)
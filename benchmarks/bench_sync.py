@@ -0,0 +1,87 @@
+#! /usr/bin/env python
+# Time to catch up with a local peer, one block per round
+# trip vs the batched headers-first catch_up
+#
+# Usage: ./benchmarks/bench_sync.py [blocks] [port]
+import importlib
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import misocoind
+
+from bench_startup import build_chain
+from misocoin.sync import misocoin_cli
+
+
+def start_peer(datadir: str, port: int):
+    script = os.path.join(os.path.dirname(__file__), '..', 'misocoind.py')
+    peer = subprocess.Popen(
+        [sys.executable, script, '-port={}'.format(port),
+         '-miners=0', '-datadir={}'.format(datadir)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    # Wait for it to come up
+    for _ in range(600):
+        try:
+            misocoin_cli('get_info', [], port=port)
+            return peer
+        except Exception:
+            time.sleep(0.1)
+
+    peer.kill()
+    raise Exception('Peer didn\'t start')
+
+
+def one_by_one(node, blocks: int) -> float:
+    importlib.reload(misocoind)
+    start = time.perf_counter()
+    for height in range(1, blocks + 1):
+        block_str = misocoin_cli('get_block_raw', [height], **node)
+        misocoind.add_to_blockchain(
+            misocoind.decode_block(block_str), broadcast=False)
+    elapsed = time.perf_counter() - start
+
+    assert len(misocoind.global_blockchain) == blocks
+    return elapsed
+
+
+def batched(node, blocks: int) -> float:
+    importlib.reload(misocoind)
+    start = time.perf_counter()
+    misocoind.catch_up(node, blocks)
+    elapsed = time.perf_counter() - start
+
+    assert len(misocoind.global_blockchain) == blocks
+    return elapsed
+
+
+if __name__ == '__main__':
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 4900
+    datadir = tempfile.mkdtemp()
+
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    build_chain(blocks, datadir)
+    peer = start_peer(datadir, port)
+
+    try:
+        node = {'host': 'localhost', 'port': port}
+        old = one_by_one(node, blocks)
+        new = batched(node, blocks)
+    finally:
+        peer.kill()
+        shutil.rmtree(datadir)
+
+    sys.stdout = stdout
+    print('Catching up {} blocks from a local peer'.format(blocks))
+    print('  one get_block per round trip:  {:8.2f}s'.format(old))
+    print('  batched headers-first:         {:8.2f}s'.format(new))
@@ -0,0 +1,82 @@
+#! /usr/bin/env python
+# Memory used by the utxo cache on a synthetic chain, with spent
+# outputs kept inline (old layout) vs pruned into a SpentArchive
+#
+# Usage: ./benchmarks/bench_utxo_memory.py [num_txs] [spent_db_path]
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from misocoin.hashing import sha256
+from misocoin.utxo import UTXOJournal, AddressIndex, SpentArchive
+
+
+def synthetic_chain(num_txs: int):
+    '''
+    Yields (txid, vins, vouts), every tx after the first
+    spends both outputs of the previous one, and creates
+    two new outputs
+    '''
+    prev = None
+    for i in range(num_txs):
+        txid = sha256(str(i))
+        vins = [] if prev is None else [(prev, 0), (prev, 1)]
+        vouts = [(txid[:40], 5), (txid[24:64], 5)]
+        yield txid, vins, vouts
+        prev = txid
+
+
+def build_old(num_txs: int):
+    # Every output ever created, with a 'spent' field
+    utxos = {}
+    for txid, vins, vouts in synthetic_chain(num_txs):
+        utxos[txid] = {}
+        for idx, (address, amount) in enumerate(vouts):
+            utxos[txid][idx] = {
+                'address': address, 'amount': amount, 'spent': None}
+        for vin_txid, vin_index in vins:
+            utxos[vin_txid][vin_index]['spent'] = txid
+    return utxos
+
+
+def build_new(num_txs: int, spent_path: str = None):
+    utxos = {}
+    address_index = AddressIndex()
+    spent = SpentArchive(spent_path)
+    for txid, vins, vouts in synthetic_chain(num_txs):
+        journal = UTXOJournal(utxos, address_index, spent)
+        for idx, (address, amount) in enumerate(vouts):
+            journal.create(txid, idx, address, amount)
+        for vin_txid, vin_index in vins:
+            journal.spend(vin_txid, vin_index, txid)
+    return utxos, address_index, spent
+
+
+def measure(name: str, build):
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('{:<32} {:>10.1f} MB'.format(name, current / 1024 / 1024))
+    return result
+
+
+if __name__ == '__main__':
+    num_txs = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    spent_path = sys.argv[2] if len(sys.argv) > 2 else None
+
+    print('Synthetic chain of {} txs'.format(num_txs))
+    old = measure('before (all outputs + spent)',
+                  lambda: build_old(num_txs))
+    del old
+
+    new = measure('after (utxos + in memory archive)',
+                  lambda: build_new(num_txs))
+    del new
+
+    if spent_path is not None:
+        new = measure('after (utxos + on disk archive)',
+                      lambda: build_new(num_txs, spent_path))
+        new[2].close()
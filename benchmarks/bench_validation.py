@@ -0,0 +1,86 @@
+#! /usr/bin/env python
+# Time to validate the txs of a block, one add_tx_to_block at
+# a time vs connect_txs (signatures verified in one batch, on
+# a pool of worker processes)
+#
+# Usage: ./benchmarks/bench_validation.py [inputs] [workers]
+#        ./benchmarks/bench_validation.py 100,1000,5000 4
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import misocoin.utils as mutils
+
+from bench_add_tx import build_utxos
+from misocoin.crypto import get_new_priv_key, get_pub_key, get_address, sig_cache
+from misocoin.hashing import sha256
+from misocoin.struct import Vin, Vout, Transaction, Block
+from misocoin.validation import SignatureVerifier, connect_txs
+
+
+def make_block(inputs: int, priv_key: str, address: str):
+    '''
+    Txs spending inputs utxos, 10 vins per tx
+    '''
+    txs = []
+    for i in range(0, inputs, 10):
+        vins = [Vin(sha256(str(j)), 0) for j in range(i, min(i + 10, inputs))]
+        tx = Transaction(vins, [Vout(address, 10 * len(vins))])
+        for idx in range(len(vins)):
+            tx = mutils.sign_tx(tx, idx, priv_key)
+        txs.append(tx)
+    return txs
+
+
+def serial(block_txs, inputs: int, address: str) -> float:
+    utxos = build_utxos(inputs, address, inputs)
+    block = Block('0' * 64, [], 1, int(time.time()), 1, 0)
+
+    # Both runs verify every signature, none of them are cached
+    sig_cache.clear()
+
+    start = time.perf_counter()
+    txs = {}
+    for tx in block_txs:
+        mutils.add_tx_to_block(tx, block, txs, utxos)
+    return time.perf_counter() - start
+
+
+def batched(block_txs, inputs: int, address: str, verifier: SignatureVerifier) -> float:
+    utxos = build_utxos(inputs, address, inputs)
+    block = Block('0' * 64, [], 1, int(time.time()), 1, 0)
+    sig_cache.clear()
+
+    start = time.perf_counter()
+    connect_txs(block_txs, block, {}, utxos, verifier=verifier)
+    elapsed = time.perf_counter() - start
+
+    assert len(block.transactions) == len(block_txs)
+    return elapsed
+
+
+if __name__ == '__main__':
+    sizes = [100, 1000, 5000]
+    workers = os.cpu_count()
+
+    if len(sys.argv) > 1:
+        sizes = [int(x) for x in sys.argv[1].split(',')]
+    if len(sys.argv) > 2:
+        workers = int(sys.argv[2])
+
+    priv_key = get_new_priv_key()
+    address = get_address(get_pub_key(priv_key))
+    verifier = SignatureVerifier(workers)
+
+    print('{} worker process(es), {} CPU(s)'.format(workers, os.cpu_count()))
+    try:
+        for inputs in sizes:
+            block_txs = make_block(inputs, priv_key, address)
+            old = serial(block_txs, inputs, address)
+            new = batched(block_txs, inputs, address, verifier)
+            print('inputs={:>5}  add_tx_to_block={:8.3f}s  connect_txs={:8.3f}s  ({:.2f}x)'.format(
+                inputs, old, new, old / new))
+    finally:
+        verifier.close()
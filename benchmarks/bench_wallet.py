@@ -0,0 +1,63 @@
+#! /usr/bin/env python
+# Time to sign txs with many inputs, mutils.sign_tx once per vin
+# (a deep copy, a txid and a pub key derivation each time) vs
+# wallet.sign_all with a keystore key (one pass over one copy)
+#
+# Usage: ./benchmarks/bench_wallet.py [inputs] [outputs]
+#        ./benchmarks/bench_wallet.py 1,10,100,500 2
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import misocoin.utils as mutils
+
+from misocoin.crypto import get_new_priv_key, is_sig_valid
+from misocoin.hashing import sha256
+from misocoin.struct import Vin, Vout, Transaction
+from misocoin.validation import sig_jobs
+from misocoin.wallet import Keystore, sign_all
+
+
+def per_vin(tx: Transaction, priv_key: str) -> Transaction:
+    for idx in range(len(tx.vins)):
+        tx = mutils.sign_tx(tx, idx, priv_key)
+    return tx
+
+
+def check(tx: Transaction):
+    if not all(is_sig_valid(*job) for job in sig_jobs(tx, tx.txid)):
+        raise Exception('Invalid signature')
+
+
+if __name__ == '__main__':
+    inputs = [1, 10, 100, 500]
+    outputs = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+
+    if len(sys.argv) > 1:
+        inputs = list(map(int, sys.argv[1].split(',')))
+
+    keystore = Keystore()
+    key = keystore.add(get_new_priv_key())
+
+    print('Signing txs with {} outputs'.format(outputs))
+    for n in inputs:
+        tx = Transaction([Vin(sha256(str(i)), 0) for i in range(n)],
+                         [Vout(key.address, 1)] * outputs)
+
+        start = time.perf_counter()
+        old = per_vin(tx, key.priv_key)
+        old_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        new = sign_all(tx, keystore.add(key.priv_key))
+        new_time = time.perf_counter() - start
+
+        check(old)
+        check(new)
+        if new.txid != old.txid:
+            raise Exception('Signing changed the txid')
+
+        print('inputs={:>4}  sign_tx per vin={:8.4f}s  sign_all={:8.4f}s  ({:5.2f}x)'.format(
+            n, old_time, new_time, old_time / new_time))
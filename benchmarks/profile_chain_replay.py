@@ -0,0 +1,72 @@
+#! /usr/bin/env python
+# Profiles replaying a chain through receive_mined_block and
+# reports how many times the hash functions were called
+#
+# Usage: ./benchmarks/profile_chain_replay.py [blocks] [txs_per_block]
+import cProfile
+import importlib
+import io
+import json
+import os
+import pstats
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import misocoind
+
+from misocoin.crypto import get_new_priv_key, get_pub_key, get_address
+from misocoin.mining import Miner
+
+
+def build_chain(blocks: int, txs_per_block: int):
+    misocoind.global_miner = Miner(1)
+    address = misocoind.account_address
+    others = [get_address(get_pub_key(get_new_priv_key())) for _ in range(4)]
+
+    for height in range(blocks):
+        for i in range(txs_per_block):
+            misocoind.send_misocoin(others[i % len(others)], 1)
+        misocoind.mine_block(misocoind.global_best_block, address)
+
+    misocoind.global_miner.close()
+    return [json.dumps(misocoind.global_blockchain[h].toJSON())
+            for h in sorted(misocoind.global_blockchain)]
+
+
+def replay(chain):
+    for block_str in chain:
+        result = misocoind.receive_mined_block(block_str)
+        if 'error' in result:
+            raise Exception(result['error'])
+
+
+if __name__ == '__main__':
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    txs_per_block = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    # Keep the daemon quiet
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    chain = build_chain(blocks, txs_per_block)
+
+    # Fresh node state
+    importlib.reload(misocoind)
+
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.runcall(replay, chain)
+    elapsed = time.perf_counter() - start
+    sys.stdout = stdout
+
+    stats = pstats.Stats(profiler).stats
+    counts = {}
+    for (filename, _, name), (_, ncalls, _, _, _) in stats.items():
+        if filename.endswith(os.path.join('misocoin', 'hashing.py')):
+            counts[name] = counts.get(name, 0) + ncalls
+
+    print('Replayed {} blocks ({} txs per block) in {:.3f}s (profiled)'.format(
+        blocks, txs_per_block, elapsed))
+    for name in sorted(counts):
+        print('  {:<24} {:>8} calls'.format(name, counts[name]))
@@ -0,0 +1,86 @@
+#! /usr/bin/env python
+# A wallet holding lots of coinbase outputs makes the same
+# payments with each coin selection strategy. Reports the average
+# inputs per tx, how long verifying all their signatures takes
+# (what every node pays for them) and how many coins are left
+#
+# Usage: ./benchmarks/sim_coin_selection.py [coinbases] [payments] [max_amount]
+#        ./benchmarks/sim_coin_selection.py 10000 100 300
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from misocoin.coinselect import STRATEGIES, select_coins
+from misocoin.crypto import get_new_priv_key, is_sig_valid
+from misocoin.hashing import sha256
+from misocoin.struct import Vin, Vout, Transaction
+from misocoin.validation import sig_jobs
+from misocoin.wallet import Keystore, sign_all
+
+PAYEE = 'b' * 40
+
+
+def coinbases(count: int):
+    '''
+    15 misocoin plus a few in fees each
+    '''
+    random.seed(0)
+    return [(sha256('coinbase' + str(i)), 0, 15 + random.randint(0, 5))
+            for i in range(count)]
+
+
+def simulate(strategy: str, coins, amounts, key):
+    coins = list(coins)
+    inputs, changes = 0, 0
+    select_time, sign_time, verify_time = 0, 0, 0
+
+    for amount in amounts:
+        start = time.perf_counter()
+        selected = select_coins(coins, amount, strategy)
+        select_time += time.perf_counter() - start
+
+        total = sum(coin[2] for coin in selected)
+        vouts = [Vout(PAYEE, amount)]
+        if total > amount:
+            vouts.append(Vout(key.address, total - amount))
+            changes += 1
+
+        start = time.perf_counter()
+        tx = sign_all(Transaction([Vin(txid, index) for txid, index, _ in selected], vouts), key)
+        sign_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        if not all(is_sig_valid(*job) for job in sig_jobs(tx, tx.txid)):
+            raise Exception('Invalid signature')
+        verify_time += time.perf_counter() - start
+
+        # Spent coins are gone, the change is a new one
+        spent = set(selected)
+        coins = [coin for coin in coins if coin not in spent]
+        if total > amount:
+            coins.append((tx.txid, 1, total - amount))
+        inputs += len(selected)
+
+    print('{:<12} {:8.1f} {:8} {:10.2f}s {:10.2f}s {:10.3f}s {:8} {:8}'.format(
+        strategy, inputs / len(amounts), inputs, verify_time, sign_time,
+        select_time, changes, len(coins)))
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    payments = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    max_amount = int(sys.argv[3]) if len(sys.argv) > 3 else 300
+
+    coins = coinbases(count)
+    amounts = [random.randint(1, max_amount) for _ in range(payments)]
+    key = Keystore().add(get_new_priv_key())
+
+    print('{} payments of 1-{} misocoin from a wallet with {} coinbase outputs'.format(
+        payments, max_amount, count))
+    print('{:<12} {:>8} {:>8} {:>11} {:>11} {:>11} {:>8} {:>8}'.format(
+        'strategy', 'inputs', 'total', 'verify', 'sign', 'select', 'changes', 'coins'))
+    for strategy in STRATEGIES:
+        simulate(strategy, coins, amounts, key)
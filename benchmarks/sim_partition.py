@@ -0,0 +1,168 @@
+#! /usr/bin/env python
+# Two groups of local nodes get partitioned and both keep mining
+# (with txs spending some of the same outputs), then rejoin. Times
+# how long the group on the shorter fork takes to reorg over to
+# the longer one, for a few fork depths
+#
+# Usage: ./benchmarks/sim_partition.py [depths] [nodes_per_group] [txs_per_block] [port]
+#        ./benchmarks/sim_partition.py 1,10,50 2 4 5100
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import misocoind
+import misocoin.utils as mutils
+
+from bench_relay import build_chain
+from misocoin.struct import Block, Coinbase, Transaction, Vin, Vout
+from misocoin.sync import RPCClient
+
+ADDRESS_A = '7b13fb41e910a1b022639f8463ce02596b8c9d4b'
+ADDRESS_B = '3fa99d6a624547040b10012127e10fa67f2be667'
+
+
+def start_group(ports, datadir: str, workdir: str):
+    '''
+    Nodes on ports, only connected to each other
+    '''
+    script = os.path.join(os.path.dirname(__file__), '..', 'misocoind.py')
+    nodes = []
+
+    for p in ports:
+        node_datadir = os.path.join(workdir, str(p))
+        shutil.copytree(datadir, node_datadir)
+
+        peers = ','.join('localhost:{}'.format(x) for x in ports if x != p)
+        nodes.append(subprocess.Popen(
+            [sys.executable, script, '-port={}'.format(p), '-miners=0',
+             '-nodes={}'.format(peers), '-datadir={}'.format(node_datadir)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ))
+
+    clients = [RPCClient(port=p, read_timeout=120) for p in ports]
+    for client in clients:
+        for _ in range(600):
+            try:
+                client.call('get_info', [])
+                break
+            except Exception:
+                time.sleep(0.1)
+
+    return nodes, clients
+
+
+def tip(client) -> str:
+    return client.call('get_best_block', [])['prev_block_hash']
+
+
+def wait_for(clients, block_hash: str, timeout: float = 600):
+    deadline = time.time() + timeout
+    while any(tip(c) != block_hash for c in clients):
+        if time.time() > deadline:
+            raise Exception('Nodes didn\'t converge on {}'.format(block_hash))
+        time.sleep(0.05)
+
+
+def mine_on(client, raw_txs, address: str, offset: int) -> Block:
+    '''
+    Sends raw_txs to the node, mines its template and hands
+    it the block. offset keeps the groups' blocks apart
+    '''
+    if len(raw_txs) > 0:
+        client.batch([('send_raw_tx', [tx]) for tx in raw_txs])
+
+    block_json = client.call('get_block_template', [])
+    block = Block.fromJSON(block_json)
+    block.timestamp = misocoind.genesis_epoch + 40 * block.height + offset
+    while not block.mined:
+        block.nonce += 1
+
+    block.coinbase = Coinbase(block.prev_block_hash, address, 15)
+    result = client.call('receive_mined_block', [misocoind.encode_block(block)])
+    if 'error' in result:
+        raise Exception(result['error'])
+    return block
+
+
+def make_txs(outputs, address: str):
+    raw_txs = []
+    for txid, index in outputs:
+        tx = Transaction([Vin(txid, index)], [Vout(address, 1)])
+        tx = mutils.sign_tx(tx, 0, misocoind.account_priv_key)
+        raw_txs.append(json.dumps(tx.toJSON()))
+    return raw_txs
+
+
+def run(depth: int, n: int, k: int, port: int, outputs, datadir: str, workdir: str):
+    ports_a = list(range(port, port + n))
+    ports_b = list(range(port + n, port + 2 * n))
+    nodes_a, clients_a = start_group(ports_a, datadir, workdir)
+    nodes_b, clients_b = start_group(ports_b, datadir, workdir)
+
+    try:
+        # A mines depth blocks, B mines one more. B's txs spend
+        # the second half of A's outputs (and more), so half of
+        # A's txs conflict with B's and half go back in the mempool
+        txs_a = make_txs(outputs[:depth * k], ADDRESS_A)
+        txs_b = make_txs(outputs[depth * k // 2:depth * k // 2 + (depth + 1) * k], ADDRESS_B)
+
+        for i in range(depth):
+            block = mine_on(clients_a[0], txs_a[i * k:(i + 1) * k], ADDRESS_A, 0)
+        wait_for(clients_a, block.block_hash)
+
+        for i in range(depth + 1):
+            block = mine_on(clients_b[0], txs_b[i * k:(i + 1) * k], ADDRESS_B, 1)
+        wait_for(clients_b, block.block_hash)
+
+        # Rejoin: A hears about B's tip from a B node
+        start = time.perf_counter()
+        result = clients_a[0].call('receive_mined_block', [
+            misocoind.encode_block(block), 'localhost:{}'.format(ports_b[0])])
+        if 'error' in result:
+            raise Exception(result['error'])
+        wait_for(clients_a, block.block_hash)
+        elapsed = time.perf_counter() - start
+
+        mempool = clients_a[0].call('get_info', [])['mempool']
+        return elapsed, mempool
+
+    finally:
+        for node in nodes_a + nodes_b:
+            node.kill()
+            node.wait()
+
+
+if __name__ == '__main__':
+    depths = [1, 10, 50]
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    k = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    port = int(sys.argv[4]) if len(sys.argv) > 4 else 5100
+
+    if len(sys.argv) > 1:
+        depths = list(map(int, sys.argv[1].split(',')))
+
+    workdir = tempfile.mkdtemp()
+    datadir = os.path.join(workdir, 'chain')
+
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    outputs = build_chain(max(depths) * k * 2 + k, datadir)
+    sys.stdout = stdout
+
+    try:
+        print('2 groups of {} nodes rejoining, {} txs per block'.format(n, k))
+        for depth in depths:
+            run_dir = os.path.join(workdir, 'depth-{}'.format(depth))
+            elapsed, mempool = run(depth, n, k, port, outputs, datadir, run_dir)
+            print('  fork depth {:>4}: {:7.2f}s to reorg every node ({} txs back in the mempool)'.format(
+                depth, elapsed, mempool))
+            port += 2 * n
+    finally:
+        shutil.rmtree(workdir)
@@ -0,0 +1,156 @@
+#! /usr/bin/env python
+# Hammers the chain state with concurrent txs (some of them
+# double spends), mined blocks and read RPCs, then checks the
+# utxo cache is still consistent
+#
+# Usage: ./benchmarks/stress_chainstate.py [txs] [blocks] [threads]
+import importlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import misocoind
+import misocoin.utils as mutils
+
+from bench_relay import build_chain
+from misocoin.mining import Miner
+from misocoin.struct import Vin, Vout, Transaction
+
+ADDRESS_A = '7b13fb41e910a1b022639f8463ce02596b8c9d4b'
+ADDRESS_B = '3fa99d6a624547040b10012127e10fa67f2be667'
+
+
+def make_tx(txid: str, index: int, address: str) -> str:
+    tx = Transaction([Vin(txid, index)], [Vout(address, 1)])
+    tx = mutils.sign_tx(tx, 0, misocoind.account_priv_key)
+    return json.dumps(tx.toJSON())
+
+
+def check_invariants(pairs):
+    utxos = misocoind.global_utxos
+    index = misocoind.global_address_index
+    spent = misocoind.global_spent
+
+    # Address index matches the utxo cache
+    outpoints = {}
+    for txid, outputs in utxos.items():
+        for i, utxo in outputs.items():
+            outpoints.setdefault(utxo['address'], {})[(txid, i)] = utxo['amount']
+    assert outpoints == index.outpoints, 'Address index out of sync'
+    for address, amounts in outpoints.items():
+        assert index.balance(address) == sum(amounts.values()), 'Bad balance'
+
+    # Nothing is both unspent and spent
+    for txid, outputs in utxos.items():
+        for i in outputs:
+            assert (txid, i) not in spent, 'Spent output in utxo cache'
+
+    # No coins created or lost (the txs have no fees)
+    total = sum(u['amount'] for outputs in utxos.values() for u in outputs.values())
+    rewards = sum(misocoind.global_blockchain[h].coinbase.reward_amount
+                  for h in misocoind.global_blockchain)
+    assert total == rewards, 'Supply is {}, expected {}'.format(total, rewards)
+
+    # Exactly one of each double spend got in (mined or not)
+    def known(txid):
+        return txid in misocoind.global_txs or txid in misocoind.global_mempool
+
+    for a, b in pairs:
+        assert known(a) != known(b), 'Double spend'
+
+
+if __name__ == '__main__':
+    txs = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    blocks = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    datadir = tempfile.mkdtemp()
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+
+    outputs = build_chain(txs, datadir)
+    importlib.reload(misocoind)
+    misocoind.load_chain(datadir)
+
+    # Every 4th output is double spent
+    raw_txs, pairs = [], []
+    for n, (txid, index) in enumerate(outputs):
+        a = make_tx(txid, index, ADDRESS_A)
+        raw_txs.append(a)
+        if n % 4 == 0:
+            b = make_tx(txid, index, ADDRESS_B)
+            raw_txs.append(b)
+            pairs.append(tuple(Transaction.fromJSON(json.loads(x)).txid for x in (a, b)))
+    random.shuffle(raw_txs)
+
+    misocoind.global_miner = Miner(1)
+    done = threading.Event()
+    errors = []
+    reads = [0] * threads
+
+    def writer(my_txs):
+        for tx in my_txs:
+            result = misocoind.send_raw_tx(tx)
+            if 'error' in result and 'spent' not in result['error']:
+                errors.append(result['error'])
+
+    def reader(n):
+        height = 0
+        while not done.is_set():
+            try:
+                snapshot = misocoind.global_chain.snapshot
+                assert snapshot.height >= height, 'Height went backwards'
+                assert snapshot.best_block.height == snapshot.height + 1, 'Torn snapshot'
+                height = snapshot.height
+
+                misocoind.get_info()
+                misocoind.get_balance()
+                txid, index = random.choice(outputs)
+                assert 'error' not in misocoind.get_txout(txid, index), 'Lost output'
+                reads[n] += 1
+
+            except Exception as e:
+                errors.append(str(e))
+
+    def miner():
+        for _ in range(blocks):
+            misocoind.mine_block(None, misocoind.account_address)
+
+    workers = [threading.Thread(target=writer, args=(raw_txs[i::threads],)) for i in range(threads)]
+    workers.append(threading.Thread(target=miner))
+    readers = [threading.Thread(target=reader, args=(i,)) for i in range(threads)]
+
+    start = time.perf_counter()
+    for t in workers + readers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    for t in readers:
+        t.join()
+
+    misocoind.global_miner.close()
+    sys.stdout = stdout
+
+    try:
+        if len(errors) > 0:
+            print('Errors: {}'.format(errors[:10]))
+            sys.exit(1)
+        check_invariants(pairs)
+    finally:
+        misocoind.global_store.close()
+        shutil.rmtree(datadir)
+
+    print('{} txs ({} double spends) and {} blocks from {} threads in {:.2f}s'.format(
+        len(raw_txs), len(pairs), blocks, threads, elapsed))
+    print('  {} reads alongside ({:.0f}/s), invariants hold'.format(
+        sum(reads), sum(reads) / elapsed))
@@ -4,7 +4,7 @@ import json
 import sys
 
 from functools import reduce
-from misocoin.sync import misocoin_cli
+from misocoin.sync import RPCClient
 
 
 if __name__ == "__main__":
@@ -18,6 +18,8 @@ if __name__ == "__main__":
 
     params = list(filter(lambda x: x[0] is not '-', sys.argv[1:]))
 
-    result = misocoin_cli(params[0], params[1:], **config_kwargs)
+    # -host, -port, -connect_timeout, -read_timeout
+    client = RPCClient(**config_kwargs)
+    result = client.call(params[0], params[1:])
 
     print(json.dumps(result))
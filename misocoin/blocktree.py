@@ -0,0 +1,161 @@
+# Every block we know of, not just the ones in our chain
+from typing import Dict, List, Set
+
+from misocoin.struct import Block
+
+# prev_block_hash of the first block
+ROOT_HASH = '0' * 64
+
+
+def block_work(difficulty: int) -> int:
+    '''
+    Hashes it takes (on average) to mine a block
+    of difficulty (leading hex zeros)
+    '''
+    return 16 ** difficulty
+
+
+class BlockIndex:
+    '''
+    A block's place in the tree
+
+    chain_work: Total work of the chain ending in it
+    block: The block itself, while it isn't in our chain
+           (the ones in our chain live in global_blockchain)
+    invalid: Connecting it failed
+    '''
+
+    __slots__ = ('block_hash', 'prev_block_hash', 'height', 'difficulty',
+                 'chain_work', 'block', 'invalid')
+
+    def __init__(self, block_hash: str, prev_block_hash: str, height: int,
+                 difficulty: int, chain_work: int, block: Block = None):
+        self.block_hash = block_hash
+        self.prev_block_hash = prev_block_hash
+        self.height = height
+        self.difficulty = difficulty
+        self.chain_work = chain_work
+        self.block = block
+        self.invalid = False
+
+
+class BlockTree:
+    '''
+    Blocks keyed by hash, each one pointing at its parent, so
+    competing chains can be kept around and compared. tip is
+    the end of our chain, the one with the most work we've
+    managed to connect
+
+    side: Hashes of the entries holding on to their block (off
+          our chain). Entries that got connected since are
+          dropped from it on the next prune
+    '''
+
+    def __init__(self):
+        root = BlockIndex(ROOT_HASH, None, 0, 0, 0)
+        self.index: Dict[str, BlockIndex] = {ROOT_HASH: root}
+        self.tip = root
+        self.side: Set[str] = set()
+
+    def __contains__(self, block_hash: str) -> bool:
+        return block_hash in self.index
+
+    def __len__(self):
+        return len(self.index) - 1
+
+    def get(self, block_hash: str) -> BlockIndex:
+        return self.index.get(block_hash)
+
+    def add(self, block: Block) -> BlockIndex:
+        '''
+        Adds a block whose parent we have, returns its entry
+        '''
+        entry = self.index.get(block.block_hash)
+        if entry is not None:
+            return entry
+
+        parent = self.index.get(block.prev_block_hash)
+        if parent is None:
+            raise Exception('Missing parent of block {}'.format(block.height))
+
+        if parent.invalid:
+            raise Exception('Block {} builds on an invalid block'.format(block.height))
+
+        if block.height != parent.height + 1:
+            raise Exception('Block {} doesn\'t follow its parent (block {})'.format(
+                block.height, parent.height))
+
+        entry = BlockIndex(
+            block.block_hash, block.prev_block_hash, block.height, block.difficulty,
+            parent.chain_work + block_work(block.difficulty), block
+        )
+        self.index[entry.block_hash] = entry
+        self.side.add(entry.block_hash)
+        return entry
+
+    def hold(self, entry: BlockIndex, block: Block):
+        '''
+        Keeps block in its entry, e.g. after it's
+        disconnected from our chain
+        '''
+        entry.block = block
+        self.side.add(entry.block_hash)
+
+    def prune(self, min_height: int) -> int:
+        '''
+        Drops the blocks off our chain that fork off it below
+        min_height (too deep to reorg to), along with everything
+        built on them. Returns how many were dropped
+        '''
+        # Fork height of each side entry, its first
+        # ancestor that isn't holding a block
+        forks: Dict[str, int] = {}
+
+        def fork_height(entry: BlockIndex) -> int:
+            path = []
+            while entry.block is not None and entry.block_hash not in forks:
+                path.append(entry.block_hash)
+                entry = self.index[entry.prev_block_hash]
+
+            height = forks.get(entry.block_hash, entry.height)
+            for block_hash in path:
+                forks[block_hash] = height
+            return height
+
+        pruned = []
+        for block_hash in list(self.side):
+            entry = self.index[block_hash]
+            if entry.block is None:
+                # Part of our chain now
+                self.side.discard(block_hash)
+            elif fork_height(entry) < min_height:
+                pruned.append(block_hash)
+
+        for block_hash in pruned:
+            self.side.discard(block_hash)
+            del self.index[block_hash]
+        return len(pruned)
+
+    def fork_point(self, a: BlockIndex, b: BlockIndex) -> BlockIndex:
+        '''
+        Last block the chains ending in a and b have in common
+        '''
+        while a.height > b.height:
+            a = self.index[a.prev_block_hash]
+        while b.height > a.height:
+            b = self.index[b.prev_block_hash]
+
+        while a is not b:
+            a = self.index[a.prev_block_hash]
+            b = self.index[b.prev_block_hash]
+        return a
+
+    def branch(self, fork: BlockIndex, tip: BlockIndex) -> List[BlockIndex]:
+        '''
+        Blocks after fork up to tip, oldest first
+        '''
+        entries = []
+        while tip is not fork:
+            entries.append(tip)
+            tip = self.index[tip.prev_block_hash]
+        return entries[::-1]
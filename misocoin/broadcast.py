@@ -0,0 +1,154 @@
+# Relays txs and blocks to other nodes in the background
+import queue
+import threading
+
+from collections import OrderedDict
+from typing import Callable, Dict, List
+
+from misocoin.sync import misocoin_cli
+
+
+def node_key(node: Dict) -> str:
+    return '{}:{}'.format(node['host'], node['port'])
+
+
+def key_node(key: str) -> Dict:
+    host, port = key.rsplit(':', 1)
+    return {'host': host, 'port': port}
+
+
+class Broadcaster:
+    '''
+    Sends txs and blocks to our nodes without blocking
+    the caller. Every node gets its own bounded queue and
+    sender thread, so a slow node only delays itself, and
+    things reach each node in the order they were queued
+    (blocks before their children).
+
+    Remembers which objects each node has already seen
+    (sent by us, or sent to us by them), so nothing is
+    sent to the same node twice.
+
+    background: If False, sends serially in the caller's thread
+    queue_size: How many calls can be waiting for a node,
+                any more get dropped
+    seen_size: How many (object, node) pairs to remember
+    max_merge: Most items merged into a single call
+    '''
+
+    def __init__(self, background: bool = True, queue_size: int = 1024,
+                 seen_size: int = 100000, max_merge: int = 1000):
+        self.background = background
+        self.queue_size = queue_size
+        self.seen_size = seen_size
+        self.max_merge = max_merge
+
+        self.queues: Dict[str, queue.Queue] = {}
+        self.seen: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def mark_seen(self, key: str, node: str):
+        '''
+        Records that node has object key (e.g. a txid)
+        '''
+        with self.lock:
+            self._mark_seen(key, node)
+
+    def _mark_seen(self, key: str, node: str) -> bool:
+        # Returns True if it was already seen
+        if (key, node) in self.seen:
+            self.seen.move_to_end((key, node))
+            return True
+
+        self.seen[(key, node)] = True
+        if len(self.seen) > self.seen_size:
+            self.seen.popitem(last=False)
+        return False
+
+    def _queue(self, node: Dict) -> queue.Queue:
+        name = node_key(node)
+        q = self.queues.get(name)
+        if q is None:
+            q = self.queues[name] = queue.Queue(self.queue_size)
+            t = threading.Thread(target=self._send_loop, args=(node, q))
+            t.daemon = True
+            t.start()
+        return q
+
+    def broadcast(self, nodes: List[Dict], key: str, m: str, args: List,
+                  origin: str = None, merge: bool = False):
+        '''
+        Calls m(*args) on every node that hasn't seen key yet
+
+        key: Hash of the object being sent (txid, block hash)
+        origin: Node we got it from, won't be sent back to it
+        merge: args[0] is a list, and queued calls to the same
+               method (and other args) can be merged into one
+        '''
+        with self.lock:
+            if origin is not None:
+                self._mark_seen(key, origin)
+
+            targets = [node for node in nodes
+                       if not self._mark_seen(key, node_key(node))]
+
+        for node in targets:
+            self.request(node, m, args, merge=merge)
+
+    def request(self, node: Dict, m: str, args: List, callback: Callable = None, merge: bool = False):
+        '''
+        Calls m(*args) on node. callback gets the
+        result (None if the call failed)
+        '''
+        if not self.background:
+            self._send(node, m, args, callback)
+            return
+
+        with self.lock:
+            q = self._queue(node)
+
+        try:
+            q.put_nowait((m, args, callback, merge))
+        except queue.Full:
+            print('[WARNING] Dropped {} to {}, too many queued'.format(
+                m, node_key(node)))
+            if callback is not None:
+                callback(None)
+
+    def _send(self, node: Dict, m: str, args: List, callback: Callable = None):
+        try:
+            result = misocoin_cli(m, args, **node)
+        except:
+            result = None
+
+        if callback is not None:
+            callback(result)
+
+    def _send_loop(self, node: Dict, q: queue.Queue):
+        held = None
+        while True:
+            m, args, callback, merge = held if held is not None else q.get()
+            held = None
+
+            # Merge whatever else is queued up behind it
+            if merge:
+                args = [list(args[0])] + args[1:]
+                while len(args[0]) < self.max_merge:
+                    try:
+                        held = q.get_nowait()
+                    except queue.Empty:
+                        break
+
+                    if not held[3] or held[0] != m or held[1][1:] != args[1:]:
+                        break
+
+                    args[0] += held[1][0]
+                    held = None
+
+            self._send(node, m, args, callback)
+
+    def pending(self) -> int:
+        '''
+        Number of calls waiting to be sent
+        '''
+        return sum(q.qsize() for q in list(self.queues.values()))
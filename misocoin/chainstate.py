@@ -0,0 +1,98 @@
+# Single writer for the chain state
+import queue
+import threading
+
+from concurrent.futures import Future
+from typing import Callable
+
+from misocoin.struct import Block
+
+
+class ChainSnapshot:
+    '''
+    Read-only view of the chain, taken after a change to it.
+    Readers can hold on to one without any locking, it never
+    changes underneath them
+
+    height: Number of blocks in the chain
+    difficulty: Difficulty of the next block
+    best_block: Copy of the block being built (its
+                transactions tuple is shared, not copied)
+    version: Goes up by one with every change
+    '''
+
+    __slots__ = ('height', 'difficulty', 'best_block', 'version')
+
+    def __init__(self, height: int, difficulty: int, best_block: Block, version: int):
+        object.__setattr__(self, 'height', height)
+        object.__setattr__(self, 'difficulty', difficulty)
+        object.__setattr__(self, 'best_block', best_block)
+        object.__setattr__(self, 'version', version)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ChainSnapshot is read-only')
+
+
+class ChainWriter:
+    '''
+    Runs every change to the chain state, one at a time, on
+    its own thread (commands are queued up), then publishes a
+    new snapshot for readers.
+
+    Commands submitted from the writer thread itself (e.g.
+    adding a block after mining it) run straight away
+
+    The thread starts with the first command, so worker
+    processes can be forked before it exists
+
+    take_snapshot: Returns a ChainSnapshot of the current state,
+                   given the version number
+    '''
+
+    def __init__(self, take_snapshot: Callable[[int], ChainSnapshot]):
+        self.take_snapshot = take_snapshot
+        self.version = 0
+        self.snapshot: ChainSnapshot = None
+        self.commands: queue.Queue = queue.Queue()
+
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.start_lock = threading.Lock()
+
+    def publish(self):
+        self.version += 1
+        self.snapshot = self.take_snapshot(self.version)
+
+    def _run(self):
+        while True:
+            future, f, args, kwargs = self.commands.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                future.set_result(f(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self.publish()
+
+    def submit_nowait(self, f: Callable, *args, **kwargs) -> Future:
+        '''
+        Queues f(*args, **kwargs), returns a Future of its result
+        '''
+        with self.start_lock:
+            if self.thread.ident is None:
+                self.thread.start()
+
+        future: Future = Future()
+        self.commands.put((future, f, args, kwargs))
+        return future
+
+    def submit(self, f: Callable, *args, **kwargs):
+        '''
+        Runs f(*args, **kwargs) on the writer thread and
+        returns its result (or raises its exception)
+        '''
+        if threading.current_thread() is self.thread:
+            return f(*args, **kwargs)
+        return self.submit_nowait(f, *args, **kwargs).result()
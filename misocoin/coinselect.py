@@ -0,0 +1,146 @@
+# Picking which of a wallet's unspent outputs (coins) to spend.
+# Coins are (txid, index, amount) tuples
+from typing import List, Tuple
+
+Coin = Tuple[str, int, int]
+
+# Most inputs consolidate spends in one tx
+CONSOLIDATE_MAX_INPUTS = 100
+
+# Most combinations branch_and_bound tries
+BNB_MAX_TRIES = 100000
+
+
+def first_found(coins: List[Coin], target: int) -> List[Coin]:
+    '''
+    Coins in the order they're given until target is covered
+    (how send_misocoin used to pick them)
+    '''
+    selected, total = [], 0
+    for coin in coins:
+        if total >= target:
+            break
+        selected.append(coin)
+        total += coin[2]
+    return selected
+
+
+def largest_first(coins: List[Coin], target: int) -> List[Coin]:
+    '''
+    Biggest coins first, fewest inputs for a tx
+    that needs change
+    '''
+    return first_found(sorted(coins, key=lambda x: x[2], reverse=True), target)
+
+
+def branch_and_bound(coins: List[Coin], target: int, max_excess: int = 0,
+                     max_tries: int = BNB_MAX_TRIES) -> List[Coin]:
+    '''
+    Depth first search for coins adding up to between target and
+    target + max_excess (exactly target by default), so the tx
+    needs no change output. Of the ones found (within max_tries
+    steps) returns the one with the least excess, then the fewest
+    inputs. Returns None if there isn't one
+
+    Coins are tried biggest first, skipping branches that can't
+    reach target, overshoot it, or can't beat the best one found
+    '''
+    coins = sorted(coins, key=lambda x: x[2], reverse=True)
+    amounts = [coin[2] for coin in coins]
+
+    # Included or not, for each coin decided so far
+    selection: List[bool] = []
+    value, count, available = 0, 0, sum(amounts)
+    best, best_key = None, None
+
+    for _ in range(max_tries):
+        backtrack = False
+
+        if value + available < target or value > target + max_excess:
+            backtrack = True
+        elif value >= target:
+            key = (value - target, count)
+            if best_key is None or key < best_key:
+                best = [coin for coin, included in zip(coins, selection) if included]
+                best_key = key
+            backtrack = True
+        elif best_key is not None and best_key[0] == 0 and count + 1 >= best_key[1]:
+            # Already have an exact match with fewer inputs
+            backtrack = True
+
+        if backtrack:
+            # Undo trailing exclusions, then exclude
+            # the last coin that was included
+            while len(selection) > 0 and not selection[-1]:
+                selection.pop()
+                available += amounts[len(selection)]
+
+            if len(selection) == 0:
+                break
+
+            selection[-1] = False
+            value -= amounts[len(selection) - 1]
+            count -= 1
+
+        else:
+            i = len(selection)
+            available -= amounts[i]
+
+            # Including a coin the same size as one we just left out
+            # gives the same selections again
+            if i > 0 and not selection[-1] and amounts[i] == amounts[i - 1]:
+                selection.append(False)
+            else:
+                selection.append(True)
+                value += amounts[i]
+                count += 1
+
+    return best
+
+
+def consolidate(coins: List[Coin], target: int,
+                max_inputs: int = CONSOLIDATE_MAX_INPUTS) -> List[Coin]:
+    '''
+    Smallest coins first, and more of them than needed (up to
+    max_inputs) so the change merges them into one output.
+    Costs more to verify now, leaves fewer coins for later
+    '''
+    coins = sorted(coins, key=lambda x: x[2])
+    selected = first_found(coins, target)
+    return coins[:max(len(selected), min(max_inputs, len(coins)))]
+
+
+def bnb_or_largest(coins: List[Coin], target: int) -> List[Coin]:
+    '''
+    Exact match if there is one (no change),
+    otherwise largest first
+    '''
+    selected = branch_and_bound(coins, target)
+    if selected is None:
+        selected = largest_first(coins, target)
+    return selected
+
+
+STRATEGIES = {
+    'first': first_found,
+    'largest': largest_first,
+    'bnb': bnb_or_largest,
+    'consolidate': consolidate
+}
+
+
+def select_coins(coins: List[Coin], target: int, strategy: str = 'bnb') -> List[Coin]:
+    '''
+    Coins to spend to send target, picked with strategy
+    (one of STRATEGIES)
+    '''
+    if strategy not in STRATEGIES:
+        raise Exception('Unknown coin selection {}, use one of {}'.format(
+            strategy, ', '.join(STRATEGIES)))
+
+    total = sum(coin[2] for coin in coins)
+    if total < target:
+        raise Exception('You\'re trying to send {} misocoin when you have {} misocoin'.format(
+            target, total))
+
+    return STRATEGIES[strategy](coins, target)
@@ -1,4 +1,9 @@
 
+import hashlib
+import threading
+
+from collections import OrderedDict
+from functools import lru_cache
 from fastecdsa import keys, curve, ecdsa
 from fastecdsa.point import Point
 
@@ -41,6 +46,7 @@ def sign_msg(msg: str, priv_key: str) -> str:
     return '{:x}x{:x}'.format(r, s)
 
 
+@lru_cache(maxsize=4096)
 def pub_key_to_point(pub_key: str) -> Point:
     '''
     Given a public key, return a Point object
@@ -58,3 +64,72 @@ def is_sig_valid(signature: str, pub_key: str, msg: str) -> bool:
     r, s = signature.split('x')
     p = pub_key_to_point(pub_key)
     return ecdsa.verify((int(r, 16), int(s, 16)), msg, p)
+
+
+class SignatureCache:
+    '''
+    Bounded LRU of signatures that have been verified, so
+    a tx seen before (e.g. when it was relayed to us) doesn't
+    have its signatures verified again when it comes in a block.
+    Only valid signatures are remembered
+
+    size: Most signatures to remember
+    '''
+
+    def __init__(self, size: int = 100000):
+        self.size = size
+        self.valid: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(signature: str, pub_key: str, msg: str) -> bytes:
+        # Fixed size, no matter how long the strings are
+        return hashlib.sha256('{}|{}|{}'.format(pub_key, msg, signature).encode()).digest()
+
+    def is_known(self, signature: str, pub_key: str, msg: str) -> bool:
+        key = self._key(signature, pub_key, msg)
+        with self.lock:
+            if key in self.valid:
+                self.valid.move_to_end(key)
+                self.hits += 1
+                return True
+
+            self.misses += 1
+            return False
+
+    def add(self, signature: str, pub_key: str, msg: str):
+        key = self._key(signature, pub_key, msg)
+        with self.lock:
+            self.valid[key] = True
+            self.valid.move_to_end(key)
+            if len(self.valid) > self.size:
+                self.valid.popitem(last=False)
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def clear(self):
+        with self.lock:
+            self.valid.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Shared by everything that verifies signatures
+sig_cache = SignatureCache()
+
+
+def is_sig_valid_cached(signature: str, pub_key: str, msg: str, cache: SignatureCache = sig_cache) -> bool:
+    '''
+    is_sig_valid, but remembers the signatures that are valid
+    '''
+    if cache.is_known(signature, pub_key, msg):
+        return True
+
+    valid = is_sig_valid(signature, pub_key, msg)
+    if valid:
+        cache.add(signature, pub_key, msg)
+    return valid
@@ -0,0 +1,113 @@
+# Difficulty of the blocks in our chain, retargeted
+# from the timestamps of the last few blocks
+from array import array
+
+from misocoin.struct import Block
+
+# Every RETARGET_INTERVAL blocks the difficulty goes up by one
+# if they took less than RETARGET_TIMESPAN seconds (and down
+# by one if they took longer)
+RETARGET_INTERVAL = 10
+RETARGET_TIMESPAN = 300
+
+MIN_DIFFICULTY = 1
+MAX_DIFFICULTY = 64
+
+
+def retarget(difficulty: int, timespan: int, target: int = RETARGET_TIMESPAN) -> int:
+    '''
+    Difficulty after blocks of difficulty took timespan seconds
+    '''
+    if timespan < target:
+        return min(difficulty + 1, MAX_DIFFICULTY)
+
+    if timespan > target:
+        return max(difficulty - 1, MIN_DIFFICULTY)
+
+    return difficulty
+
+
+class DifficultyWindow:
+    '''
+    Timestamp and difficulty of every block in our chain (in
+    arrays, 9 bytes a block), updated as blocks are connected and
+    disconnected. Retargets only look at the last interval + 1
+    timestamps, so connecting, disconnecting and looking up the
+    difficulty a block should have are all O(1)
+
+    next: Difficulty of the block after our tip
+    '''
+
+    def __init__(self, interval: int = RETARGET_INTERVAL, timespan: int = RETARGET_TIMESPAN):
+        self.interval = interval
+        self.timespan = timespan
+        self.timestamps = array('q')
+        self.difficulties = array('B')
+        self.next = MIN_DIFFICULTY
+
+    def __len__(self):
+        return len(self.difficulties)
+
+    def expected(self, height: int) -> int:
+        '''
+        Difficulty the block at height (in our chain,
+        or the one after our tip) should have
+        '''
+        if height == len(self.difficulties) + 1:
+            return self.next
+
+        if height < 1 or height > len(self.difficulties):
+            raise Exception('No difficulty for block {} yet'.format(height))
+
+        return self.difficulties[height - 1]
+
+    def lowest(self, fork_height: int, height: int) -> int:
+        '''
+        Lowest difficulty the block at height can have on a chain
+        that has our blocks up to fork_height (it only goes down
+        by one every interval blocks)
+        '''
+        retargets = (height - 1) // self.interval - fork_height // self.interval
+        return max(self.expected(fork_height + 1) - retargets, MIN_DIFFICULTY)
+
+    def check(self, block: Block):
+        '''
+        Raises if block (the one after our tip)
+        doesn't have the difficulty it should
+        '''
+        if block.height != len(self.difficulties) + 1:
+            raise Exception('Block {} isn\'t the one after block {}'.format(
+                block.height, len(self.difficulties)))
+
+        if block.difficulty != self.next:
+            raise Exception('Block {} has difficulty {}, expected {}'.format(
+                block.height, block.difficulty, self.next))
+
+    def connect(self, block: Block):
+        if block.height != len(self.difficulties) + 1:
+            raise Exception('Block {} isn\'t the one after block {}'.format(
+                block.height, len(self.difficulties)))
+
+        self.timestamps.append(block.timestamp)
+        self.difficulties.append(block.difficulty)
+        self.next = self._next_difficulty()
+
+    def disconnect(self):
+        self.timestamps.pop()
+        self.difficulties.pop()
+        self.next = self._next_difficulty()
+
+    def _next_difficulty(self) -> int:
+        height = len(self.difficulties)
+        if height == 0:
+            return MIN_DIFFICULTY
+
+        difficulty = self.difficulties[-1]
+        if height % self.interval != 0:
+            return difficulty
+
+        # Time between the block before the window and
+        # the last one (the lowest and highest timestamps,
+        # they don't have to be in order)
+        window = self.timestamps[-(self.interval + 1):]
+        return retarget(difficulty, max(window) - min(window), self.timespan)
@@ -0,0 +1,177 @@
+# Helpers for the compact binary format of our structs
+#
+# Hashes, keys and signatures are written as fixed width
+# raw bytes, integers as (LEB128) varints
+from typing import Optional
+
+
+class BytesReader:
+    '''
+    Reads fields sequentially out of a bytes object
+    '''
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def read(self, n: int) -> bytes:
+        if self.pos + n > len(self.data):
+            raise Exception('Unexpected end of data')
+
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return chunk
+
+    def read_byte(self) -> int:
+        if self.pos >= len(self.data):
+            raise Exception('Unexpected end of data')
+
+        byte = self.data[self.pos]
+        self.pos += 1
+        return byte
+
+    def done(self) -> bool:
+        return self.pos == len(self.data)
+
+
+def write_varint(buf: bytearray, n: int):
+    if type(n) != int or n < 0:
+        raise Exception('Can\'t encode {} as a varint'.format(n))
+
+    while n >= 0x80:
+        buf.append((n & 0x7f) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+def read_varint(reader: BytesReader) -> int:
+    # Most of our varints fit in a byte
+    n = reader.read_byte()
+    if n < 0x80:
+        return n
+
+    n &= 0x7f
+    shift = 7
+    while True:
+        byte = reader.read_byte()
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n
+        shift += 7
+
+
+def write_signed_varint(buf: bytearray, n: int):
+    # Zigzag so small negative numbers stay small
+    if type(n) != int:
+        raise Exception('Can\'t encode {} as a varint'.format(n))
+    write_varint(buf, n * 2 if n >= 0 else -n * 2 - 1)
+
+
+def read_signed_varint(reader: BytesReader) -> int:
+    n = read_varint(reader)
+    return n // 2 if n % 2 == 0 else -(n + 1) // 2
+
+
+def write_hex(buf: bytearray, s: str, size: int):
+    '''
+    Writes a fixed width hex string (e.g. a hash) as raw bytes
+    '''
+    # Only lowercase round trips
+    if type(s) != str or len(s) != size * 2 or s != s.lower():
+        raise Exception('Expected {} hex characters, got {}'.format(size * 2, s))
+
+    raw = bytes.fromhex(s)
+    if len(raw) != size:
+        raise Exception('Expected {} hex characters, got {}'.format(size * 2, s))
+    buf += raw
+
+
+def read_hex(reader: BytesReader, size: int) -> str:
+    return reader.read(size).hex()
+
+
+def write_int_hex(buf: bytearray, s: str, size: int):
+    '''
+    Writes a '{:x}' formatted integer (pub key coordinates,
+    signature values) as fixed width raw bytes
+    '''
+    # '{:x}' has no leading zeros and is lowercase
+    if type(s) != str or len(s) == 0 or len(s) > size * 2 or \
+            (s[0] == '0' and s != '0') or s != s.lower():
+        raise Exception('Non canonical hex {}'.format(s))
+
+    raw = bytes.fromhex(s.rjust(size * 2, '0'))
+    if len(raw) != size:
+        raise Exception('Non canonical hex {}'.format(s))
+    buf += raw
+
+
+def read_int_hex(reader: BytesReader, size: int) -> str:
+    return reader.read(size).hex().lstrip('0') or '0'
+
+
+def write_str(buf: bytearray, s: str):
+    data = s.encode()
+    write_varint(buf, len(data))
+    buf += data
+
+
+def read_str(reader: BytesReader) -> str:
+    return reader.read(read_varint(reader)).decode()
+
+
+def write_address(buf: bytearray, address: str):
+    '''
+    Addresses are sha1 hex digests (20 raw bytes), anything
+    else (e.g. in a raw tx) is written as a string
+    '''
+    if type(address) == str and len(address) == 40 and address == address.lower():
+        try:
+            raw = bytes.fromhex(address)
+        except ValueError:
+            raw = b''
+
+        if len(raw) == 20:
+            buf.append(0)
+            buf += raw
+            return
+
+    if type(address) != str:
+        raise Exception('Can\'t encode address {}'.format(address))
+    buf.append(1)
+    write_str(buf, address)
+
+
+def read_address(reader: BytesReader) -> str:
+    if reader.read_byte() == 0:
+        return read_hex(reader, 20)
+    return read_str(reader)
+
+
+def write_pair(buf: bytearray, pair: Optional[str]):
+    '''
+    Writes an 'x' joined pair of '{:x}' integers (pub keys and
+    signatures) as 64 raw bytes. None and '' are kept apart so
+    we round trip with the JSON form
+    '''
+    if pair is None:
+        buf.append(0)
+    elif pair == '':
+        buf.append(1)
+    else:
+        buf.append(2)
+        x, y = pair.split('x')
+        write_int_hex(buf, x, 32)
+        write_int_hex(buf, y, 32)
+
+
+def read_pair(reader: BytesReader) -> Optional[str]:
+    flag = reader.read_byte()
+    if flag == 0:
+        return None
+    if flag == 1:
+        return ''
+
+    # One hex() call for both halves
+    pair = reader.read(64).hex()
+    return (pair[:64].lstrip('0') or '0') + 'x' + (pair[64:].lstrip('0') or '0')
@@ -2,8 +2,6 @@
 
 import hashlib
 
-from functools import reduce
-
 
 def shaX(s: str, hashfunc) -> str:
     hash = hashfunc()
@@ -19,6 +17,45 @@ def sha1(s: str) -> str:
     return shaX(s, hashlib.sha1)
 
 
+def _vins_str(vins) -> str:
+    return ''.join([vin.txid + str(vin.index) for vin in vins])
+
+
+def _vouts_str(vouts) -> str:
+    return ''.join([
+        str(getattr(y, 'address', '')) + str(getattr(y, 'value', '')) +
+        str(getattr(y, 'reward_address', '')) + str(getattr(y, 'reward_amount', ''))
+        for y in vouts
+    ])
+
+
+def _get_preimage_parts(vins, vouts, txids, reward_address, reward_amount,
+                        prev_block_hash, height, difficulty):
+    '''
+    Builds the preimage used by get_hash, split around
+    the nonce and timestamp (the only fields that change
+    while mining)
+
+    Each part is joined in one go, so building it is
+    linear in the number of vins/vouts/txids
+    '''
+    # Use all of the args
+    rewards_str = reward_address + str(reward_amount)
+
+    # Order and prepend was arbitrarily chosen
+    # Done this was so any slight change to the inputs
+    # Will result in a huge difference overall
+    prefix = ''.join([
+        'vins_str', _vins_str(vins),
+        'rewards_str', rewards_str,
+        'tx_str', ''.join(txids),
+        'block_str', prev_block_hash, str(height), str(difficulty)
+    ])
+    suffix = 'vouts_str' + _vouts_str(vouts)
+
+    return prefix, suffix
+
+
 def get_hash(vins=[],
              vouts=[],
              txids=[],
@@ -47,25 +84,72 @@ def get_hash(vins=[],
         difficulty:     Block difficulty (only for Block type)
         nonce:          Block nonce (only for Block type)
     '''
-    # Use all of the args
-    vins_str = reduce(lambda x, y: x + y.txid + str(y.index), vins, '')
-    vouts_str = reduce(
-        lambda x, y: x + str(getattr(y, 'address', '')) + str(getattr(y, 'value', '')) +
-                        str(getattr(y, 'reward_address', '')) + str(getattr(y, 'reward_amount', '')),
-        vouts, ''
+    prefix, suffix = _get_preimage_parts(
+        vins, vouts, txids, reward_address, reward_amount,
+        prev_block_hash, height, difficulty
     )
-    rewards_str = reward_address + str(reward_amount)
-    block_str = prev_block_hash + \
-        str(height) + str(difficulty) + str(nonce) + str(timestamp)
-    tx_str = reduce(lambda x, y: x + y, txids, '')
+    hash = hashlib.sha256(prefix.encode())
+    hash.update((str(nonce) + str(timestamp)).encode())
+    hash.update(suffix.encode())
+    return hash.hexdigest()
 
-    # Order and prepend was arbitrarily chosen
-    # Done this was so any slight change to the inputs
-    # Will result in a huge difference overall
-    return sha256(
-        'vins_str' + vins_str +
-        'rewards_str' + rewards_str +
-        'tx_str' + tx_str +
-        'block_str' + block_str +
-        'vouts_str' + vouts_str
-    )
+
+def get_sighashes(vins, vouts, txid: str):
+    '''
+    Signature message of each of vins, same as
+    get_hash(vins=[vin], vouts=vouts, txids=[txid])
+    for every vin, but the vouts (the bulk of
+    every message) are only built once
+    '''
+    suffix = ('vouts_str' + _vouts_str(vouts)).encode()
+    hashes = []
+    for vin in vins:
+        hash = hashlib.sha256(
+            ('vins_str' + vin.txid + str(vin.index) + 'rewards_str' +
+             'tx_str' + txid + 'block_str').encode())
+        hash.update(suffix)
+        hashes.append(hash.hexdigest())
+    return hashes
+
+
+class MiningHasher:
+    '''
+    Same hash as get_hash, but everything in the preimage
+    except the nonce and timestamp is computed (and fed to
+    sha256) once. Each attempt then only hashes the nonce,
+    timestamp and what comes after them
+
+    Takes the same params as get_hash, minus nonce/timestamp
+    '''
+
+    def __init__(self,
+                 vins=[],
+                 vouts=[],
+                 txids=[],
+                 reward_address='',
+                 reward_amount='',
+                 prev_block_hash='',
+                 height='',
+                 difficulty=''):
+        prefix, suffix = _get_preimage_parts(
+            vins, vouts, txids, reward_address, reward_amount,
+            prev_block_hash, height, difficulty
+        )
+        self.prefix = prefix.encode()
+        self.suffix = suffix.encode()
+        self.midstate = hashlib.sha256(self.prefix)
+
+    # hashlib objects can't be pickled, so rebuild the
+    # midstate when sent to another process
+    def __getstate__(self):
+        return (self.prefix, self.suffix)
+
+    def __setstate__(self, state):
+        self.prefix, self.suffix = state
+        self.midstate = hashlib.sha256(self.prefix)
+
+    def hash(self, nonce, timestamp='') -> str:
+        h = self.midstate.copy()
+        h.update((str(nonce) + str(timestamp)).encode())
+        h.update(self.suffix)
+        return h.hexdigest()
@@ -0,0 +1,123 @@
+# Optional indexes of our chain: where each tx is, and
+# every tx that touched an address
+from typing import Dict, Iterator, List, Tuple
+
+from misocoin.struct import Block, Coinbase, Transaction
+
+# Most history entries/utxos returned by one request
+MAX_HISTORY_PER_REQUEST = 1000
+
+
+def block_txs(block: Block) -> List[Transaction]:
+    '''
+    Coinbase first (position 0), then the block's txs
+    '''
+    return [block.coinbase] + list(block.transactions)
+
+
+def spent_outputs(entries: List[Tuple]) -> Dict[Tuple[str, int], Dict]:
+    '''
+    (txid, index) -> { 'address', 'amount' } of the outputs
+    spent in a block, from its utxo journal entries
+    '''
+    return {(entry[1], entry[2]): entry[3] for entry in entries if entry[0] == 'spend'}
+
+
+def _new_txs(block: Block, txids: List[str]) -> Iterator[Tuple[int, Transaction]]:
+    '''
+    (position, tx) of the txs in txids (the ones connecting
+    the block added), the first time each of them appears
+    '''
+    new = set(txids)
+    for position, tx in enumerate(block_txs(block)):
+        if tx.txid in new:
+            new.discard(tx.txid)
+            yield position, tx
+
+
+class TxIndex:
+    '''
+    txid -> (height, position) of every tx in our chain
+    '''
+
+    def __init__(self):
+        self.locations: Dict[str, Tuple[int, int]] = {}
+
+    def __contains__(self, txid: str) -> bool:
+        return txid in self.locations
+
+    def __len__(self):
+        return len(self.locations)
+
+    def get(self, txid: str) -> Tuple[int, int]:
+        return self.locations.get(txid)
+
+    def connect(self, height: int, block: Block, txids: List[str]):
+        for position, tx in _new_txs(block, txids):
+            self.locations[tx.txid] = (height, position)
+
+    def disconnect(self, txids: List[str]):
+        for txid in txids:
+            self.locations.pop(txid, None)
+
+
+class AddressHistory:
+    '''
+    Every tx in our chain that paid or spent from an address,
+    oldest first, as (height, txid, received, sent). New blocks
+    only append and disconnecting one only pops, so pages of
+    an address' history stay put as the chain grows
+    '''
+
+    def __init__(self):
+        self.entries: Dict[str, List[Tuple[int, str, int, int]]] = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def count(self, address: str) -> int:
+        return len(self.entries.get(address, ()))
+
+    def get(self, address: str, offset: int = 0,
+            limit: int = MAX_HISTORY_PER_REQUEST) -> List[Tuple[int, str, int, int]]:
+        return self.entries.get(address, [])[offset:offset + limit]
+
+    @staticmethod
+    def _changes(block: Block, txids: List[str], spent: Dict) -> List[Tuple[str, str, int, int]]:
+        '''
+        (address, txid, received, sent) for each address
+        each new tx of the block touched, in block order
+        '''
+        changes = []
+        for _, tx in _new_txs(block, txids):
+            # address -> [received, sent]
+            amounts: Dict[str, List[int]] = {}
+
+            if type(tx) == Coinbase:
+                amounts[tx.reward_address] = [tx.reward_amount, 0]
+            else:
+                for vin in tx.vins:
+                    utxo = spent.get((vin.txid, vin.index))
+                    if utxo is not None:
+                        amounts.setdefault(utxo['address'], [0, 0])[1] += utxo['amount']
+
+                for vout in tx.vouts:
+                    amounts.setdefault(vout.address, [0, 0])[0] += vout.amount
+
+            changes += [(address, tx.txid, received, sent)
+                        for address, (received, sent) in amounts.items()]
+        return changes
+
+    def connect(self, height: int, block: Block, txids: List[str], spent: Dict):
+        '''
+        spent: Outputs the block spent, see spent_outputs
+        '''
+        for address, txid, received, sent in self._changes(block, txids, spent):
+            self.entries.setdefault(address, []).append((height, txid, received, sent))
+
+    def disconnect(self, block: Block, txids: List[str], spent: Dict):
+        for address, _, _, _ in reversed(self._changes(block, txids, spent)):
+            history = self.entries[address]
+            history.pop()
+            if len(history) == 0:
+                del self.entries[address]
@@ -0,0 +1,504 @@
+# Txs waiting to be mined, kept apart from the block template
+# (and from the utxo cache, which only holds confirmed outputs)
+import bisect
+import heapq
+import json
+
+from typing import Dict, Iterable, List, Set, Tuple
+
+import misocoin.utils as mutils
+
+from misocoin.struct import Transaction
+from misocoin.utxo import SpentArchive
+
+
+def tx_size(tx: Transaction) -> int:
+    '''
+    Size of the tx in bytes (binary format, or
+    JSON if the binary format can't hold it)
+    '''
+    try:
+        return len(tx.toBytes())
+    except Exception:
+        return len(json.dumps(tx.toJSON()))
+
+
+class MempoolEntry:
+    '''
+    A tx in the mempool, and where it sits in the graph
+    of mempool txs spending each other's outputs
+
+    coins: (address, amount) of every output it spends
+    parents: Txids of the mempool txs it spends
+    children: Txids of the mempool txs spending it
+
+    ancestor_*/descendant_* add up the tx and all of its
+    ancestors/descendants (its package)
+    '''
+
+    def __init__(self, tx: Transaction, fee: int, coins: List[Tuple[str, int]], seq: int):
+        self.tx = tx
+        self.txid = tx.txid
+        self.fee = fee
+        self.coins = coins
+        self.size = tx_size(tx)
+        self.fee_rate = fee / self.size
+        self.seq = seq
+
+        self.parents: Set[str] = set()
+        self.children: Set[str] = set()
+
+        self.ancestor_count = 1
+        self.ancestor_fee = fee
+        self.ancestor_size = self.size
+
+        self.descendant_count = 1
+        self.descendant_fee = fee
+        self.descendant_size = self.size
+
+        self.key = self.ancestor_key()
+
+    def ancestor_key(self) -> Tuple[float, int, str]:
+        '''
+        Fee rate of the tx and its ancestors (what mining it
+        is worth), oldest first on ties (read from the
+        top of by_ancestor_score, the lowest seq wins)
+        '''
+        return (self.ancestor_fee / self.ancestor_size, -self.seq, self.txid)
+
+    def descendant_key(self) -> Tuple[float, int, str]:
+        '''
+        Fee rate of the tx, or of it and its descendants
+        if that's higher (what evicting it would lose)
+        '''
+        return (max(self.fee_rate, self.descendant_fee / self.descendant_size), -self.seq, self.txid)
+
+
+class Mempool:
+    '''
+    Valid txs that haven't been mined yet. They spend confirmed
+    outputs or the outputs of other txs in the mempool.
+
+    Indexed by txid and by the outpoints they spend (so a
+    conflicting tx is found straight away). Every tx knows its
+    parents and children in the mempool, and the fees/sizes of
+    its ancestors and descendants, so:
+
+    - templates pick packages by their ancestor fee rate (a
+      child paying a high fee gets its parents mined)
+    - removing a tx only touches the txs related to it
+
+    Once there's more than max_size bytes of txs, the ones with
+    the lowest descendant fee rate are evicted (with their
+    descendants). A tx can't have more than max_ancestors
+    mempool txs in its package, or be one of more than
+    max_descendants in an ancestor's (counting itself)
+
+    max_size: Most bytes of txs to hold
+    max_ancestors: Longest chain of unconfirmed txs ending in a tx
+    max_descendants: Most unconfirmed txs depending on a tx
+    '''
+
+    def __init__(self, max_size: int = 300 * 1000 * 1000,
+                 max_ancestors: int = 100, max_descendants: int = 100):
+        self.max_size = max_size
+        self.max_ancestors = max_ancestors
+        self.max_descendants = max_descendants
+        self.size = 0
+
+        self.entries: Dict[str, MempoolEntry] = {}
+
+        # spends[(txid, index)] = txid of the mempool tx spending it
+        self.spends: Dict[Tuple[str, int], str] = {}
+
+        # Ancestor keys of the entries, sorted
+        self.by_ancestor_score: List[Tuple[float, int, str]] = []
+
+        # Min heap of descendant keys, stale ones (the entry
+        # is gone or its key changed) are skipped when popped
+        self.by_descendant_score: List[Tuple[float, int, str]] = []
+
+        # Outputs of mempool txs, outputs[address][(txid, index)] = amount
+        # and how much every address' balance changes once they're mined
+        self.outputs: Dict[str, Dict[Tuple[str, int], int]] = {}
+        self.balances: Dict[str, int] = {}
+
+        self.seq = 0
+
+    def clear(self):
+        self.__init__(self.max_size, self.max_ancestors, self.max_descendants)
+
+    def pending(self) -> List[Transaction]:
+        '''
+        Every tx, in the order they came in (parents first)
+        '''
+        return [entry.tx for entry in sorted(self.entries.values(), key=lambda x: x.seq)]
+
+    def __contains__(self, txid: str) -> bool:
+        return txid in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, txid: str) -> Transaction:
+        entry = self.entries.get(txid)
+        return None if entry is None else entry.tx
+
+    def txids(self) -> List[str]:
+        '''
+        Txids in the mempool, highest ancestor fee rate first
+        '''
+        return [key[2] for key in reversed(list(self.by_ancestor_score))]
+
+    def balance(self, address: str) -> int:
+        return self.balances.get(address, 0)
+
+    def is_spent(self, txid: str, index: int) -> bool:
+        return (txid, index) in self.spends
+
+    def unspent(self, address: str) -> List[Tuple[str, int, int]]:
+        '''
+        Returns a list of (txid, index, amount) of mempool tx
+        outputs owned by address that nothing in the mempool spends
+        '''
+        outpoints = self.outputs.get(address, {})
+        return [(txid, index, amount) for (txid, index), amount in list(outpoints.items())
+                if (txid, index) not in self.spends]
+
+    def coin(self, txid: str, index: int, utxos: Dict) -> Dict:
+        '''
+        Looks up an output in the confirmed utxos, then in the
+        outputs of mempool txs. Returns None if it doesn't exist
+        '''
+        utxo = utxos.get(txid, {}).get(index)
+        if utxo is not None:
+            return utxo
+
+        entry = self.entries.get(txid)
+        if entry is not None and 0 <= index < len(entry.tx.vouts):
+            vout = entry.tx.vouts[index]
+            return {'address': vout.address, 'amount': vout.amount}
+        return None
+
+    def ancestors(self, txids: Iterable[str]) -> Set[str]:
+        '''
+        txids and every mempool tx they depend on
+        '''
+        found = set()
+        stack = list(txids)
+        while len(stack) > 0:
+            txid = stack.pop()
+            if txid not in found:
+                found.add(txid)
+                stack += self.entries[txid].parents
+        return found
+
+    def descendants(self, txids: Iterable[str]) -> Set[str]:
+        '''
+        txids and every mempool tx depending on them
+        '''
+        found = set()
+        stack = list(txids)
+        while len(stack) > 0:
+            txid = stack.pop()
+            if txid not in found:
+                found.add(txid)
+                stack += self.entries[txid].children
+        return found
+
+    def check(self, tx: Transaction, utxos: Dict, spent: SpentArchive = None,
+              check_sigs: bool = True) -> Tuple[Dict, int]:
+        '''
+        Checks tx can go in the mempool, returns the
+        outputs it spends (in the utxos format) and its fee
+        '''
+        txid = tx.txid
+        if txid in self.entries:
+            raise Exception('Transaction {} is already in the mempool'.format(txid))
+
+        coins: Dict = {}
+        for vin in tx.vins:
+            spender = self.spends.get((vin.txid, vin.index))
+            if spender is not None:
+                raise Exception('Transaction {} at vin {} has been spent by {} (in the mempool)'.format(
+                    vin.txid, vin.index, spender))
+
+            coin = self.coin(vin.txid, vin.index, utxos)
+            if coin is not None:
+                coins.setdefault(vin.txid, {})[vin.index] = coin
+
+        # Only needs to see the outputs it spends
+        mutils.check_vins(tx, txid, coins, spent, check_sigs)
+
+        fee = mutils.get_fees(tx, coins)
+        if fee < 0:
+            raise Exception('Attempting to spend more than you have!')
+
+        return coins, fee
+
+    def add(self, tx: Transaction, utxos: Dict, spent: SpentArchive = None,
+            check_sigs: bool = True) -> MempoolEntry:
+        '''
+        Validates tx against the confirmed utxos and the
+        mempool, then adds it (evicting txs if we're full)
+        '''
+        coins, fee = self.check(tx, utxos, spent, check_sigs)
+
+        parents = set(vin.txid for vin in tx.vins if vin.txid in self.entries)
+        ancestors = self.ancestors(parents)
+        if len(ancestors) + 1 > self.max_ancestors:
+            raise Exception('Transaction {} has too many unconfirmed ancestors ({})'.format(
+                tx.txid, len(ancestors)))
+
+        for txid in ancestors:
+            if self.entries[txid].descendant_count + 1 > self.max_descendants:
+                raise Exception('Transaction {} has too many unconfirmed descendants'.format(txid))
+
+        entry = MempoolEntry(
+            tx, fee,
+            [(coins[vin.txid][vin.index]['address'], coins[vin.txid][vin.index]['amount'])
+             for vin in tx.vins],
+            self.seq
+        )
+        self.seq += 1
+        self._insert(entry, parents, ancestors)
+
+        self.evict()
+        if entry.txid not in self.entries:
+            raise Exception('Mempool is full, fee rate of {} is too low'.format(entry.txid))
+
+        return entry
+
+    def _credit(self, address: str, amount: int):
+        balance = self.balances.get(address, 0) + amount
+        if balance == 0:
+            self.balances.pop(address, None)
+        else:
+            self.balances[address] = balance
+
+    def _push_descendant_key(self, entry: MempoolEntry):
+        heapq.heappush(self.by_descendant_score, entry.descendant_key())
+
+        # Don't let stale keys pile up
+        if len(self.by_descendant_score) > 2 * len(self.entries) + 1000:
+            self.by_descendant_score = [e.descendant_key() for e in self.entries.values()]
+            heapq.heapify(self.by_descendant_score)
+
+    def _set_ancestor_key(self, entry: MempoolEntry):
+        del self.by_ancestor_score[bisect.bisect_left(self.by_ancestor_score, entry.key)]
+        entry.key = entry.ancestor_key()
+        bisect.insort(self.by_ancestor_score, entry.key)
+
+    def _insert(self, entry: MempoolEntry, parents: Set[str], ancestors: Set[str]):
+        txid = entry.txid
+        self.entries[txid] = entry
+
+        entry.parents = parents
+        for parent in parents:
+            self.entries[parent].children.add(txid)
+
+        for ancestor in map(self.entries.get, ancestors):
+            entry.ancestor_count += 1
+            entry.ancestor_fee += ancestor.fee
+            entry.ancestor_size += ancestor.size
+
+            ancestor.descendant_count += 1
+            ancestor.descendant_fee += entry.fee
+            ancestor.descendant_size += entry.size
+            self._push_descendant_key(ancestor)
+
+        for vin, (address, amount) in zip(entry.tx.vins, entry.coins):
+            self.spends[(vin.txid, vin.index)] = txid
+            self._credit(address, -amount)
+
+        for index, vout in enumerate(entry.tx.vouts):
+            self.outputs.setdefault(vout.address, {})[(txid, index)] = vout.amount
+            self._credit(vout.address, vout.amount)
+
+        entry.key = entry.ancestor_key()
+        bisect.insort(self.by_ancestor_score, entry.key)
+        self._push_descendant_key(entry)
+        self.size += entry.size
+
+    def remove(self, txid: str, removing: Set[str] = frozenset()) -> MempoolEntry:
+        '''
+        Removes a single tx (e.g. it has been mined), txs
+        spending its outputs stay and no longer count it
+        as an ancestor
+
+        removing: Ancestors that are about to be removed
+                  too, they're left as they are
+        '''
+        entry = self.entries[txid]
+
+        for descendant in map(self.entries.get, self.descendants(entry.children)):
+            descendant.ancestor_count -= 1
+            descendant.ancestor_fee -= entry.fee
+            descendant.ancestor_size -= entry.size
+            self._set_ancestor_key(descendant)
+
+        for ancestor in map(self.entries.get, self.ancestors(entry.parents)):
+            if ancestor.txid in removing:
+                continue
+
+            ancestor.descendant_count -= 1
+            ancestor.descendant_fee -= entry.fee
+            ancestor.descendant_size -= entry.size
+            self._push_descendant_key(ancestor)
+
+        for parent in entry.parents:
+            self.entries[parent].children.discard(txid)
+        for child in entry.children:
+            self.entries[child].parents.discard(txid)
+
+        del self.entries[txid]
+
+        for vin, (address, amount) in zip(entry.tx.vins, entry.coins):
+            del self.spends[(vin.txid, vin.index)]
+            self._credit(address, amount)
+
+        for index, vout in enumerate(entry.tx.vouts):
+            outpoints = self.outputs[vout.address]
+            del outpoints[(txid, index)]
+            if len(outpoints) == 0:
+                del self.outputs[vout.address]
+            self._credit(vout.address, -vout.amount)
+
+        del self.by_ancestor_score[bisect.bisect_left(self.by_ancestor_score, entry.key)]
+        self.size -= entry.size
+
+        return entry
+
+    def remove_with_descendants(self, txid: str) -> List[str]:
+        '''
+        Removes a tx and every tx depending on it (they
+        can't be mined without it), returns their txids
+        '''
+        if txid not in self.entries:
+            return []
+
+        # Children before parents, so nothing left
+        # behind has its ancestors updated
+        descendants = self.descendants([txid])
+        removed = sorted(descendants, key=lambda x: self.entries[x].ancestor_count, reverse=True)
+        for _txid in removed:
+            self.remove(_txid, descendants)
+
+        return removed
+
+    def remove_for_block(self, txs: List[Transaction]) -> List[str]:
+        '''
+        Removes the txs confirmed by a block, and the ones that
+        conflict with them (spend the same outputs) along
+        with their descendants. Returns the conflicting txids
+        '''
+        conflicts = []
+        for tx in txs:
+            if tx.txid in self.entries:
+                self.remove(tx.txid)
+                continue
+
+            for vin in tx.vins:
+                spender = self.spends.get((vin.txid, vin.index))
+                if spender is not None:
+                    conflicts += self.remove_with_descendants(spender)
+
+        return conflicts
+
+    def evict(self) -> List[str]:
+        '''
+        Evicts the txs with the lowest descendant fee rate (and
+        their descendants) until we're under max_size, returns
+        their txids
+        '''
+        evicted = []
+        while self.size > self.max_size and len(self.by_descendant_score) > 0:
+            key = heapq.heappop(self.by_descendant_score)
+            entry = self.entries.get(key[2])
+            if entry is not None and entry.descendant_key() == key:
+                evicted += self.remove_with_descendants(entry.txid)
+        return evicted
+
+    def select(self, max_txs: int = None) -> Tuple[List[Transaction], int]:
+        '''
+        Picks the txs for a block template. Goes through the txs
+        by ancestor fee rate (counting only the ancestors not
+        picked yet), adding each one along with its ancestors,
+        parents first, so a high fee child pays for its parents.
+
+        Returns the txs and their total fees
+        '''
+        max_txs = len(self.entries) if max_txs is None else max_txs
+        selected: List[MempoolEntry] = []
+        chosen: Set[str] = set()
+
+        # Packages that didn't fit
+        skipped: Set[str] = set()
+
+        # Txs with some of their ancestors picked already,
+        # modified[txid] = [ancestor fee, ancestor size] of
+        # the ones left, and a max heap of their (negated) keys
+        modified: Dict[str, List[int]] = {}
+        modified_keys: List[Tuple[float, int, str]] = []
+
+        def modified_key(txid: str) -> Tuple[float, int, str]:
+            fee, size = modified[txid]
+            return (-fee / size, self.entries[txid].seq, txid)
+
+        scores = list(self.by_ancestor_score)
+        i = len(scores) - 1
+
+        while len(selected) < max_txs:
+            # Best tx none of whose ancestors are picked
+            while i >= 0 and (scores[i][2] in chosen or scores[i][2] in skipped or
+                              scores[i][2] in modified):
+                i -= 1
+
+            # Best tx with some of its ancestors picked
+            while len(modified_keys) > 0:
+                key = modified_keys[0]
+                if key[2] in modified and modified_key(key[2]) == key:
+                    break
+                heapq.heappop(modified_keys)
+
+            if i < 0 and len(modified_keys) == 0:
+                break
+
+            if len(modified_keys) > 0 and \
+                    (i < 0 or (-modified_keys[0][0], -modified_keys[0][1]) > scores[i][:2]):
+                txid = heapq.heappop(modified_keys)[2]
+            else:
+                txid = scores[i][2]
+                i -= 1
+
+            # The tx and its ancestors, parents first
+            package = sorted(
+                (self.entries[x] for x in self.ancestors([txid]) if x not in chosen),
+                key=lambda x: x.ancestor_count
+            )
+
+            # Doesn't fit, try the next one
+            if len(selected) + len(package) > max_txs:
+                modified.pop(txid, None)
+                skipped.add(txid)
+                continue
+
+            for entry in package:
+                selected.append(entry)
+                chosen.add(entry.txid)
+                modified.pop(entry.txid, None)
+
+            # Their descendants don't need to pay for them anymore
+            for entry in package:
+                for descendant in map(self.entries.get, self.descendants(entry.children)):
+                    if descendant.txid in chosen:
+                        continue
+
+                    left = modified.setdefault(
+                        descendant.txid, [descendant.ancestor_fee, descendant.ancestor_size])
+                    left[0] -= entry.fee
+                    left[1] -= entry.size
+
+                    heapq.heappush(modified_keys, modified_key(descendant.txid))
+
+        return [entry.tx for entry in selected], sum(entry.fee for entry in selected)
@@ -0,0 +1,97 @@
+# Merkle tree over a block's txids. The block hash commits to
+# the root only, so a tx can be shown to be in a block with
+# a branch of log2(txs) hashes instead of the whole block
+from typing import Dict, List, Tuple
+
+from misocoin.hashing import sha256, get_hash
+
+# Root of a block without txs
+EMPTY_ROOT = '0' * 64
+
+
+def _parent(left: str, right: str) -> str:
+    return sha256(left + right)
+
+
+def _next_level(level: List[str]) -> List[str]:
+    # An odd node out moves up a level as it is (instead of
+    # being paired with itself, so [a, b, c] and [a, b, c, c]
+    # don't get the same root)
+    return [_parent(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+            for i in range(0, len(level), 2)]
+
+
+def merkle_root(txids: List[str]) -> str:
+    if len(txids) == 0:
+        return EMPTY_ROOT
+
+    level = list(txids)
+    while len(level) > 1:
+        level = _next_level(level)
+    return level[0]
+
+
+def merkle_branch(txids: List[str], position: int) -> List[Tuple[str, str]]:
+    '''
+    Hashes needed to get from txids[position] to the root,
+    bottom up, as (side, hash) where side is 'l' if the hash
+    goes on the left of ours and 'r' if it goes on the right
+    '''
+    if position < 0 or position >= len(txids):
+        raise Exception('No tx at position {}'.format(position))
+
+    branch = []
+    level = list(txids)
+    while len(level) > 1:
+        sibling = position ^ 1
+        if sibling < len(level):
+            branch.append(('l' if sibling < position else 'r', level[sibling]))
+
+        level = _next_level(level)
+        position //= 2
+    return branch
+
+
+def verify_merkle_branch(txid: str, branch: List[Tuple[str, str]], root: str) -> bool:
+    h = txid
+    for side, sibling in branch:
+        if side == 'l':
+            h = _parent(sibling, h)
+        elif side == 'r':
+            h = _parent(h, sibling)
+        else:
+            return False
+    return h == root
+
+
+def header_hash(header: Dict) -> str:
+    '''
+    Block hash from a header ({ prev_block_hash, merkle_root,
+    height, difficulty, nonce, timestamp }), same as the block's
+    '''
+    return get_hash(
+        txids=[header['merkle_root']],
+        prev_block_hash=header['prev_block_hash'],
+        height=header['height'],
+        difficulty=header['difficulty'],
+        nonce=header['nonce'],
+        timestamp=header['timestamp']
+    )
+
+
+def verify_tx_proof(proof: Dict) -> bool:
+    '''
+    Checks a get_tx_proof result on its own: the branch leads
+    from the txid to the header's merkle root, and the header
+    hashes to the block hash and meets its difficulty
+
+    (Whether that block is in the chain with the most work
+    is up to the caller, e.g. by comparing with get_headers)
+    '''
+    header = proof['header']
+    block_hash = header_hash(header)
+    difficulty = header['difficulty']
+
+    return verify_merkle_branch(proof['txid'], proof['branch'], header['merkle_root']) and \
+        block_hash == proof['block_hash'] and \
+        block_hash[:difficulty] == '0' * difficulty
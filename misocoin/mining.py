@@ -0,0 +1,129 @@
+# Multi-process miner, farms nonce ranges of a block
+# template out to a pool of worker processes
+import multiprocessing
+import queue
+import time
+
+from typing import Optional, Tuple
+
+from misocoin.hashing import MiningHasher
+
+# Set in each worker process by _init_worker
+_cancel_event = None
+
+
+def _init_worker(cancel_event):
+    global _cancel_event
+    _cancel_event = cancel_event
+
+
+def _mine_range(hasher: MiningHasher,
+                difficulty: int,
+                timestamp: int,
+                start: int,
+                end: int) -> Tuple[Optional[int], int]:
+    '''
+    Tries every nonce in [start, end). Returns the nonce
+    that solves the block (or None) and the amount of hashes
+    done. Gives up early if the cancel event is set
+    '''
+    target = '0' * difficulty
+
+    for nonce in range(start, end):
+        if (nonce - start) % 1024 == 0 and _cancel_event.is_set():
+            return None, nonce - start
+
+        if hasher.hash(nonce, timestamp)[:difficulty] == target:
+            return nonce, nonce - start + 1
+
+    return None, end - start
+
+
+class Miner:
+    '''
+    workers:    Number of worker processes
+    chunk_size: Number of nonces handed to a worker at a time
+    '''
+
+    def __init__(self, workers: int = 1, chunk_size: int = 20000):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.hashrate = 0.0
+
+        # Goes up by one with every cancel()
+        self.generation = 0
+
+        self.cancel_event = multiprocessing.Event()
+        self.pool = multiprocessing.Pool(
+            workers, initializer=_init_worker, initargs=(self.cancel_event,))
+
+    def cancel(self):
+        '''
+        Stops every worker, mine() then returns None
+        '''
+        self.generation += 1
+        self.cancel_event.set()
+
+    def mine(self, hasher: MiningHasher, difficulty: int, timestamp: int,
+             start_nonce: int = 0, generation: int = None) -> Optional[int]:
+        '''
+        Mines the template described by hasher, returns the
+        winning nonce or None if we were cancelled
+
+        generation: self.generation when the template was taken.
+                    If cancel() was called since (e.g. a new block
+                    came in before we got here), gives up straight
+                    away instead of mining a stale template
+        '''
+        self.cancel_event.clear()
+
+        # (Checked after clearing, a cancel from here on
+        # sets the event again)
+        if generation is not None and generation != self.generation:
+            return None
+
+        results = queue.Queue()
+        next_nonce = start_nonce
+        outstanding = 0
+        hashes = 0
+        found = None
+        start_time = time.time()
+
+        def submit():
+            nonlocal next_nonce, outstanding
+            self.pool.apply_async(
+                _mine_range,
+                (hasher, difficulty, timestamp,
+                 next_nonce, next_nonce + self.chunk_size),
+                callback=results.put,
+                error_callback=lambda e: results.put((None, 0))
+            )
+            next_nonce += self.chunk_size
+            outstanding += 1
+
+        for _ in range(self.workers):
+            submit()
+
+        # Keep every worker busy until someone finds it
+        # or we get cancelled, then drain what's left
+        while outstanding > 0:
+            nonce, done = results.get()
+            outstanding -= 1
+            hashes += done
+
+            if nonce is not None and found is None:
+                found = nonce
+                self.cancel_event.set()
+
+            if found is None and not self.cancel_event.is_set():
+                submit()
+
+        elapsed = time.time() - start_time
+        if elapsed > 0:
+            self.hashrate = hashes / elapsed
+
+        return found
+
+    def close(self):
+        self.cancel()
+        self.pool.terminate()
@@ -0,0 +1,257 @@
+# JSON-RPC over HTTP on an asyncio event loop, an alternative
+# to werkzeug's thread per request server
+import asyncio
+import inspect
+import json
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+
+# Biggest request we'll read
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+STATUS_TEXT = {
+    200: 'OK',
+    204: 'No Content',
+    400: 'Bad Request',
+    413: 'Payload Too Large',
+    503: 'Service Unavailable'
+}
+
+
+def _error(code: int, message: str, _id=None, e: Exception = None) -> Dict:
+    error = {'code': code, 'message': message}
+    if e is not None:
+        error['data'] = {
+            'type': type(e).__name__,
+            'args': [str(x) for x in e.args],
+            'message': str(e)
+        }
+    return {'jsonrpc': '2.0', 'error': error, 'id': _id}
+
+
+class AsyncRPCServer:
+    '''
+    Serves the methods in dispatcher as JSON-RPC over
+    HTTP/1.1 with keep-alive. Requests pipelined on a
+    connection are handled concurrently and answered in
+    order. Batch requests (a list of calls) are supported.
+
+    The methods are blocking, so they run on a pool of
+    max_concurrency threads. Requests past that wait on
+    the event loop instead of each getting a thread.
+
+    dispatcher: Dict-like of method name -> function
+    max_concurrency: Most calls running at once
+    on_request: Optional callback(bytes_recv, bytes_sent)
+    '''
+
+    def __init__(self, dispatcher, host: str = 'localhost', port: int = 4000,
+                 max_concurrency: int = 16, on_request: Callable = None):
+        self.dispatcher = dispatcher
+        self.host = host
+        self.port = int(port)
+        self.max_concurrency = int(max_concurrency)
+        self.on_request = on_request
+
+        self.executor = ThreadPoolExecutor(self.max_concurrency)
+        self.semaphore = None
+        self.server = None
+
+        # method -> its inspect.Signature (None if it has none)
+        self.signatures: Dict[Callable, inspect.Signature] = {}
+
+    def _signature(self, method: Callable) -> inspect.Signature:
+        if method not in self.signatures:
+            try:
+                self.signatures[method] = inspect.signature(method)
+            except (TypeError, ValueError):
+                self.signatures[method] = None
+        return self.signatures[method]
+
+    def _call(self, request) -> Dict:
+        '''
+        Runs a single call, returns its response
+        (None for notifications)
+        '''
+        if not isinstance(request, dict) or request.get('jsonrpc') != '2.0' or \
+                not isinstance(request.get('method'), str):
+            return _error(-32600, 'Invalid Request')
+
+        _id = request.get('id')
+        is_notification = 'id' not in request
+        params = request.get('params', [])
+
+        method = self.dispatcher.get(request['method'])
+        if method is None:
+            response = _error(-32601, 'Method not found', _id)
+
+        else:
+            if isinstance(params, list):
+                args, kwargs = params, {}
+            elif isinstance(params, dict):
+                args, kwargs = [], params
+            else:
+                return _error(-32600, 'Invalid Request', _id)
+
+            try:
+                # Only params that don't fit the method are the client's
+                # fault, a TypeError from inside it is a server error
+                signature = self._signature(method)
+                if signature is not None:
+                    signature.bind(*args, **kwargs)
+
+            except TypeError as e:
+                response = _error(-32602, 'Invalid params', _id, e)
+
+            else:
+                try:
+                    result = method(*args, **kwargs)
+                    response = {'jsonrpc': '2.0', 'result': result, 'id': _id}
+
+                except Exception as e:
+                    response = _error(-32000, 'Server error', _id, e)
+
+        return None if is_notification else response
+
+    def handle(self, data: bytes) -> bytes:
+        '''
+        Handles a JSON-RPC request body, returns the
+        response body (b'' if there's nothing to return)
+        '''
+        try:
+            request = json.loads(data)
+        except ValueError:
+            return json.dumps(_error(-32700, 'Parse error')).encode()
+
+        if isinstance(request, list):
+            if len(request) == 0:
+                return json.dumps(_error(-32600, 'Invalid Request')).encode()
+
+            responses = [r for r in map(self._call, request) if r is not None]
+            return json.dumps(responses).encode() if len(responses) > 0 else b''
+
+        response = self._call(request)
+        return json.dumps(response).encode() if response is not None else b''
+
+    async def _respond(self, body: bytes) -> bytes:
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(self.executor, self.handle, body)
+
+        if self.on_request is not None:
+            self.on_request(len(body), len(response))
+        return response
+
+    @staticmethod
+    def _http_response(status: int, body: bytes, keep_alive: bool) -> bytes:
+        headers = [
+            'HTTP/1.1 {} {}'.format(status, STATUS_TEXT[status]),
+            'Content-Type: application/json',
+            'Content-Length: {}'.format(len(body)),
+            'Connection: {}'.format('keep-alive' if keep_alive else 'close'),
+        ]
+        return ('\r\n'.join(headers) + '\r\n\r\n').encode() + body
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        '''
+        Returns (body, keep_alive), or None when the
+        client is done or sent garbage
+        '''
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            return None
+
+        lines = head.decode('latin-1').split('\r\n')
+        request_line = lines[0].split(' ')
+        if len(request_line) != 3:
+            return None
+
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+
+        # HTTP/1.1 keeps the connection open unless told
+        # not to, HTTP/1.0 only if asked to
+        connection = headers.get('connection', '').lower()
+        if request_line[2] == 'HTTP/1.1':
+            keep_alive = connection != 'close'
+        else:
+            keep_alive = connection == 'keep-alive'
+
+        try:
+            length = int(headers.get('content-length', '0'))
+        except ValueError:
+            return None
+
+        if length < 0 or length > MAX_BODY_SIZE:
+            return None
+
+        try:
+            body = await reader.readexactly(length)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+
+        return body, keep_alive
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Responses go out in the same order as
+        # the requests, even if they finish early
+        responses: asyncio.Queue = asyncio.Queue()
+
+        async def write_responses():
+            while True:
+                item = await responses.get()
+                if item is None:
+                    return
+
+                task, keep_alive = item
+                try:
+                    body = await task
+                    status = 200 if len(body) > 0 else 204
+                except Exception:
+                    body, status = b'', 503
+
+                writer.write(self._http_response(status, body, keep_alive))
+                await writer.drain()
+
+        writer_task = asyncio.ensure_future(write_responses())
+
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+
+                body, keep_alive = request
+                task = asyncio.ensure_future(self._respond(body))
+                await responses.put((task, keep_alive))
+
+                if not keep_alive:
+                    break
+
+            await responses.put(None)
+            await writer_task
+
+        except ConnectionError:
+            writer_task.cancel()
+
+        finally:
+            writer.close()
+
+    async def start(self):
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port)
+
+    def serve_forever(self):
+        async def run():
+            await self.start()
+            async with self.server:
+                await self.server.serve_forever()
+
+        asyncio.run(run())
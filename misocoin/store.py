@@ -0,0 +1,228 @@
+# Persistent, append-only storage for the blockchain (only
+# the last block can be removed, when it gets reorged out)
+import json
+import mmap
+import os
+import pickle
+import struct
+import threading
+
+from collections import OrderedDict
+from typing import Dict
+
+from misocoin.struct import Block, BYTES_VERSION
+
+
+class BlockStore:
+    '''
+    Append-only file of blocks (one record per block) plus an
+    index file of fixed width offsets, so block N can be found
+    without scanning the block file. The index is memory-mapped.
+
+    Behaves like the global_blockchain dict (keyed by height),
+    so it can be used in its place.
+
+    Files inside datadir:
+        blocks.dat:     Records of <4 byte length><format byte><block>
+                        format is 'B' (Block.toBytes) or 'J' (JSON)
+        blocks.idx:     8 byte offset of each block, in height order
+        chainstate.pkl: Last checkpoint of the utxo state
+    '''
+
+    # How many parsed blocks to keep around
+    cache_size = 64
+
+    def __init__(self, datadir: str):
+        os.makedirs(datadir, exist_ok=True)
+
+        self.datadir = datadir
+        self.snapshot_path = os.path.join(datadir, 'chainstate.pkl')
+        self.data_file = self._open(os.path.join(datadir, 'blocks.dat'))
+        self.index_file = self._open(os.path.join(datadir, 'blocks.idx'))
+
+        # Drop a partially written index entry
+        self.height = os.path.getsize(self.index_file.name) // 8
+        self.index_file.truncate(self.height * 8)
+        self.index_map = None
+        self.cache: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _open(path: str):
+        # Create if missing, but don't open in append mode
+        # (we need to be able to seek before writing)
+        open(path, 'ab').close()
+        return open(path, 'r+b')
+
+    def _map_index(self):
+        # mmap can't map an empty file
+        if self.index_map is not None:
+            self.index_map.close()
+            self.index_map = None
+
+        if self.height > 0:
+            self.index_map = mmap.mmap(
+                self.index_file.fileno(), self.height * 8, access=mmap.ACCESS_READ)
+
+    def _offset(self, height: int) -> int:
+        if self.index_map is None or len(self.index_map) < height * 8:
+            self._map_index()
+
+        return struct.unpack_from('<Q', self.index_map, (height - 1) * 8)[0]
+
+    def _read(self, height: int) -> Block:
+        offset = self._offset(height)
+        data = os.pread(self.data_file.fileno(), 5, offset)
+        length, fmt = struct.unpack('<IB', data)
+        record = os.pread(self.data_file.fileno(), length, offset + 5)
+
+        if fmt == ord('B'):
+            return Block.fromBytes(record)
+
+        if fmt == ord('J'):
+            return Block.fromJSON(json.loads(record.decode()))
+
+        raise Exception('Unknown block record format {}'.format(fmt))
+
+    def version(self) -> int:
+        '''
+        Binary format version the stored blocks were written
+        with (taken from the first one). Blocks of an older
+        version hash differently, they can't be read back
+        '''
+        if self.height == 0:
+            return BYTES_VERSION
+
+        offset = self._offset(1)
+        length, fmt = struct.unpack('<IB', os.pread(self.data_file.fileno(), 5, offset))
+        record = os.pread(self.data_file.fileno(), length, offset + 5)
+
+        if fmt == ord('B'):
+            return record[0]
+
+        # JSON blocks only got a merkle root in version 2
+        if fmt == ord('J'):
+            return BYTES_VERSION if 'merkle_root' in json.loads(record.decode()) else 1
+
+        raise Exception('Unknown block record format {}'.format(fmt))
+
+    def _cache(self, height: int, block: Block):
+        self.cache[height] = block
+        self.cache.move_to_end(height)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def append(self, block: Block):
+        '''
+        Appends the next block of the chain
+        '''
+        # Blocks with fields the binary format can't
+        # represent are stored as JSON
+        try:
+            record, fmt = block.toBytes(), ord('B')
+        except Exception:
+            record, fmt = json.dumps(block.toJSON()).encode(), ord('J')
+
+        with self.lock:
+            self._append(block, record, fmt)
+
+    def _append(self, block: Block, record: bytes, fmt: int):
+        if block.height != self.height + 1:
+            raise Exception('Expected block {}, got block {}'.format(
+                self.height + 1, block.height))
+
+        # Data goes first, a block only exists once
+        # its offset has been written to the index
+        self.data_file.seek(0, os.SEEK_END)
+        offset = self.data_file.tell()
+        self.data_file.write(struct.pack('<IB', len(record), fmt))
+        self.data_file.write(record)
+        self.data_file.flush()
+
+        self.index_file.seek(self.height * 8)
+        self.index_file.write(struct.pack('<Q', offset))
+        self.index_file.flush()
+
+        self.height += 1
+        self._cache(block.height, block)
+
+    def __setitem__(self, height: int, block: Block):
+        if height != block.height:
+            raise Exception('Block height mismatch')
+        self.append(block)
+
+    def __delitem__(self, height: int):
+        '''
+        Removes the last block (e.g. it got reorged out)
+        '''
+        with self.lock:
+            if height != self.height:
+                raise Exception('Can only remove the last block ({}), not block {}'.format(
+                    self.height, height))
+
+            offset = self._offset(height)
+
+            # Unmap before shrinking the index underneath it
+            if self.index_map is not None:
+                self.index_map.close()
+                self.index_map = None
+
+            self.height -= 1
+            self.index_file.truncate(self.height * 8)
+            self.data_file.truncate(offset)
+            self.cache.pop(height, None)
+
+    def __getitem__(self, height: int) -> Block:
+        if height not in self:
+            raise KeyError(height)
+
+        with self.lock:
+            if height in self.cache:
+                self.cache.move_to_end(height)
+                return self.cache[height]
+
+            block = self._read(height)
+            self._cache(height, block)
+            return block
+
+    def __contains__(self, height) -> bool:
+        return type(height) == int and 1 <= height <= self.height
+
+    def __len__(self) -> int:
+        return self.height
+
+    def __iter__(self):
+        return iter(range(1, self.height + 1))
+
+    def save_snapshot(self, state: Dict):
+        '''
+        Checkpoints the chain state, state['height'] is the
+        last block whose changes are included
+        '''
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        # Atomic, we never end up with half a snapshot
+        os.replace(tmp_path, self.snapshot_path)
+
+    def load_snapshot(self) -> Dict:
+        '''
+        Returns the last checkpointed chain state or None
+        '''
+        if not os.path.exists(self.snapshot_path):
+            return None
+
+        with open(self.snapshot_path, 'rb') as f:
+            state = pickle.load(f)
+
+        # Snapshot can't be ahead of the blocks we have
+        if state['height'] > self.height:
+            return None
+        return state
+
+    def close(self):
+        if self.index_map is not None:
+            self.index_map.close()
+        self.data_file.close()
+        self.index_file.close()
@@ -1,10 +1,28 @@
 # Here we define the structure of our object
 import json
 
-from functools import reduce
-from typing import List, Union, Dict
+from typing import List, Union, Dict, Tuple
 
-from misocoin.hashing import sha256, get_hash
+from misocoin.hashing import sha256, get_hash, MiningHasher
+from misocoin.merkle import merkle_root
+from misocoin.encoding import BytesReader, write_varint, read_varint, \
+    write_signed_varint, read_signed_varint, write_hex, read_hex, \
+    write_address, read_address, write_pair, read_pair
+
+# Version of the binary format (toBytes/fromBytes)
+# 2: Blocks have a merkle root after prev_block_hash
+BYTES_VERSION = 2
+
+
+def _check_version(reader: BytesReader):
+    version = reader.read_byte()
+    if version != BYTES_VERSION:
+        raise Exception('Unsupported binary format version {}'.format(version))
+
+
+def _check_done(reader: BytesReader):
+    if not reader.done():
+        raise Exception('Trailing bytes after object')
 
 
 class Vin:
@@ -21,6 +39,14 @@ class Vin:
         self.pub_key = ''
         self.signature = ''
 
+    def __setattr__(self, name, value):
+        # txid and index are part of the owning tx's txid,
+        # which is cached, so they can't change
+        if name in ('txid', 'index') and name in self.__dict__:
+            raise AttributeError(
+                'Vin.{} is immutable, create a new Vin instead'.format(name))
+        object.__setattr__(self, name, value)
+
     def __str__(self):
         return json.dumps(self.toJSON())
 
@@ -43,6 +69,38 @@ class Vin:
             'signature': self.signature
         }
 
+    def _write(self, buf: bytearray):
+        write_hex(buf, self.txid, 32)
+        write_varint(buf, self.index)
+        write_pair(buf, self.pub_key)
+        write_pair(buf, self.signature)
+
+    @classmethod
+    def _read(cls, reader: BytesReader):
+        # Hot path when syncing, skip __init__/__setattr__
+        # (same as what copy/pickle do)
+        vin = cls.__new__(cls)
+        vin.__dict__.update(
+            txid=read_hex(reader, 32),
+            index=read_varint(reader),
+            pub_key=read_pair(reader),
+            signature=read_pair(reader)
+        )
+        return vin
+
+    def toBytes(self) -> bytes:
+        buf = bytearray([BYTES_VERSION])
+        self._write(buf)
+        return bytes(buf)
+
+    @classmethod
+    def fromBytes(cls, data: bytes):
+        reader = BytesReader(data)
+        _check_version(reader)
+        vin = cls._read(reader)
+        _check_done(reader)
+        return vin
+
 
 class Vout:
     def __init__(self, address: str, amount: int):
@@ -53,6 +111,13 @@ class Vout:
         self.address = address
         self.amount = amount
 
+    def __setattr__(self, name, value):
+        # Part of the owning tx's txid, which is cached
+        if name in ('address', 'amount') and name in self.__dict__:
+            raise AttributeError(
+                'Vout.{} is immutable, create a new Vout instead'.format(name))
+        object.__setattr__(self, name, value)
+
     def __str__(self):
         return json.dumps(self.toJSON())
 
@@ -69,6 +134,32 @@ class Vout:
             'amount': self.amount
         }
 
+    def _write(self, buf: bytearray):
+        write_address(buf, self.address)
+        write_signed_varint(buf, self.amount)
+
+    @classmethod
+    def _read(cls, reader: BytesReader):
+        vout = cls.__new__(cls)
+        vout.__dict__.update(
+            address=read_address(reader),
+            amount=read_signed_varint(reader)
+        )
+        return vout
+
+    def toBytes(self) -> bytes:
+        buf = bytearray([BYTES_VERSION])
+        self._write(buf)
+        return bytes(buf)
+
+    @classmethod
+    def fromBytes(cls, data: bytes):
+        reader = BytesReader(data)
+        _check_version(reader)
+        vout = cls._read(reader)
+        _check_done(reader)
+        return vout
+
 
 class Coinbase:
     '''
@@ -90,13 +181,21 @@ class Coinbase:
         self.reward_address = reward_address
         self.reward_amount = reward_amount
 
+    def __setattr__(self, name, value):
+        # Invalidate cached txid
+        if name in ('prev_block_hash', 'reward_address', 'reward_amount'):
+            self.__dict__['_txid'] = None
+        object.__setattr__(self, name, value)
+
     @property
     def txid(self):
-        return get_hash(
-            prev_block_hash=self.prev_block_hash,
-            reward_address=self.reward_address,
-            reward_amount=self.reward_amount
-        )
+        if self._txid is None:
+            self._txid = get_hash(
+                prev_block_hash=self.prev_block_hash,
+                reward_address=self.reward_address,
+                reward_amount=self.reward_amount
+            )
+        return self._txid
 
     def __str__(self):
         return json.dumps(self.toJSON())
@@ -121,6 +220,32 @@ class Coinbase:
             'reward_amount': self.reward_amount
         }
 
+    def _write(self, buf: bytearray, with_prev_block_hash: bool = True):
+        # Inside a block the prev_block_hash is the block's
+        if with_prev_block_hash:
+            write_hex(buf, self.prev_block_hash, 32)
+        write_address(buf, self.reward_address)
+        write_signed_varint(buf, self.reward_amount)
+
+    @classmethod
+    def _read(cls, reader: BytesReader, prev_block_hash: str = None):
+        if prev_block_hash is None:
+            prev_block_hash = read_hex(reader, 32)
+        return cls(prev_block_hash, read_address(reader), read_signed_varint(reader))
+
+    def toBytes(self) -> bytes:
+        buf = bytearray([BYTES_VERSION])
+        self._write(buf)
+        return bytes(buf)
+
+    @classmethod
+    def fromBytes(cls, data: bytes):
+        reader = BytesReader(data)
+        _check_version(reader)
+        coinbase = cls._read(reader)
+        _check_done(reader)
+        return coinbase
+
 
 class Transaction:
     def __init__(self, vins: List[Vin], vouts: List[Vout]):
@@ -128,13 +253,25 @@ class Transaction:
         vins:  List of inputs (where we our money is supplied from)
                Note: First item in array will always be a coinbase
         vouts: List of outputs (where our supplied money is going to go)
+
+        vins and vouts are stored as tuples so the cached
+        txid can't go stale
         '''
         self.vins = vins
         self.vouts = vouts
 
+    def __setattr__(self, name, value):
+        # Invalidate cached txid
+        if name in ('vins', 'vouts'):
+            value = tuple(value)
+            self.__dict__['_txid'] = None
+        object.__setattr__(self, name, value)
+
     @property
     def txid(self):
-        return get_hash(vins=self.vins, vouts=self.vouts)
+        if self._txid is None:
+            self._txid = get_hash(vins=self.vins, vouts=self.vouts)
+        return self._txid
 
     def __str__(self):
         return json.dumps(self.toJSON())
@@ -154,8 +291,8 @@ class Transaction:
         return cls(vins, vouts)
 
     def toJSON(self):
-        vins_json = reduce(lambda x, y: x + [y.toJSON()], self.vins, [])
-        vouts_json = reduce(lambda x, y: x + [y.toJSON()], self.vouts, [])
+        vins_json = [vin.toJSON() for vin in self.vins]
+        vouts_json = [vout.toJSON() for vout in self.vouts]
 
         return {
             'txid': self.txid,
@@ -163,6 +300,34 @@ class Transaction:
             'vouts': vouts_json,
         }
 
+    def _write(self, buf: bytearray):
+        write_varint(buf, len(self.vins))
+        for vin in self.vins:
+            vin._write(buf)
+
+        write_varint(buf, len(self.vouts))
+        for vout in self.vouts:
+            vout._write(buf)
+
+    @classmethod
+    def _read(cls, reader: BytesReader):
+        vins = [Vin._read(reader) for _ in range(read_varint(reader))]
+        vouts = [Vout._read(reader) for _ in range(read_varint(reader))]
+        return cls(vins, vouts)
+
+    def toBytes(self) -> bytes:
+        buf = bytearray([BYTES_VERSION])
+        self._write(buf)
+        return bytes(buf)
+
+    @classmethod
+    def fromBytes(cls, data: bytes):
+        reader = BytesReader(data)
+        _check_version(reader)
+        tx = cls._read(reader)
+        _check_done(reader)
+        return tx
+
 
 class Block:
     def __init__(self,
@@ -176,6 +341,17 @@ class Block:
         blockHash: Hash of the block
         transactions: Transactions in our blockchain
         height:  Current block height
+
+        transactions are stored as a tuple, the block hash
+        (and the nonce independent part of it) are cached
+        until one of the fields they depend on is set.
+        add_transactions appends to a list instead, the tuple
+        is only rebuilt the next time transactions is read
+
+        The block hash commits to the transactions through
+        merkle_root (the root of a merkle tree of their
+        txids), so its preimage is the same size for any
+        number of transactions
         '''
         self.prev_block_hash = prev_block_hash
         self.transactions = transactions
@@ -185,26 +361,98 @@ class Block:
         self.nonce = nonce
         self.coinbase = None
 
+    def __setattr__(self, name, value):
+        # Invalidate cached hashes
+        if name in ('prev_block_hash', 'transactions', 'height', 'difficulty'):
+            self.__dict__['_hasher'] = None
+            self.__dict__['_block_hash'] = None
+            if name == 'transactions':
+                self.__dict__['_merkle_root'] = None
+        elif name in ('nonce', 'timestamp'):
+            self.__dict__['_block_hash'] = None
+
+        object.__setattr__(self, name, value)
+
+    def __copy__(self):
+        # Copies share the transactions tuple, but not
+        # the list of txs added since it was built
+        block = Block.__new__(Block)
+        block.__dict__.update(self.__dict__)
+        block.__dict__['_transactions'] = self.transactions
+        block.__dict__['_added'] = []
+        return block
+
     @property
-    def block_hash(self):
+    def transactions(self) -> Tuple[Transaction, ...]:
+        if len(self._added) > 0:
+            self.__dict__['_transactions'] = self._transactions + tuple(self._added)
+            self.__dict__['_added'] = []
+        return self._transactions
+
+    @transactions.setter
+    def transactions(self, value: List[Transaction]):
+        self.__dict__['_transactions'] = tuple(value)
+        self.__dict__['_added'] = []
+
+    def add_transactions(self, txs: List[Transaction]):
+        '''
+        Appends txs, the cached hashes are invalidated once.
+        Filling a block one tx at a time stays linear
+        '''
+        self._added.extend(txs)
+        self.__dict__['_hasher'] = None
+        self.__dict__['_block_hash'] = None
+        self.__dict__['_merkle_root'] = None
+
+    def txids(self) -> List[str]:
         # Don't use coinbase to calculate blockhash (since its appended)
-        # after mining
-        transactions = filter(lambda x: type(
-            x) == Transaction, self.transactions)
-        txids = reduce(lambda x, y: x + [y.txid], transactions, [])
-        vins = reduce(lambda x, y: x + y.vins, transactions, [])
-        vouts = reduce(lambda x, y: x + y.vouts, transactions, [])
-
-        return get_hash(
-            vins=vins,
-            vouts=vouts,
-            txids=txids,
-            prev_block_hash=self.prev_block_hash,
-            height=self.height,
-            timestamp=self.timestamp,
-            difficulty=self.difficulty,
-            nonce=self.nonce
-        )
+        # after mining. The vins and vouts of each tx are committed
+        # to through its txid
+        return [x.txid for x in self.transactions if type(x) == Transaction]
+
+    @property
+    def merkle_root(self) -> str:
+        if self._merkle_root is None:
+            self._merkle_root = merkle_root(self.txids())
+        return self._merkle_root
+
+    def header(self) -> Dict:
+        '''
+        Everything the block hash is computed from
+        (see misocoin.merkle.header_hash)
+        '''
+        return {
+            'prev_block_hash': self.prev_block_hash,
+            'merkle_root': self.merkle_root,
+            'height': self.height,
+            'difficulty': self.difficulty,
+            'nonce': self.nonce,
+            'timestamp': self.timestamp
+        }
+
+    @property
+    def block_hash(self):
+        if self._block_hash is None:
+            self._block_hash = self.mining_hasher().hash(
+                self.nonce, self.timestamp)
+        return self._block_hash
+
+    def mining_hasher(self) -> MiningHasher:
+        '''
+        Precomputes the part of the block hash that doesn't
+        depend on the nonce/timestamp, so mining only has to
+        hash those per attempt.
+
+        mining_hasher().hash(nonce, timestamp) == block_hash
+        '''
+        if self._hasher is None:
+            self._hasher = MiningHasher(
+                txids=[self.merkle_root],
+                prev_block_hash=self.prev_block_hash,
+                height=self.height,
+                difficulty=self.difficulty
+            )
+        return self._hasher
 
     @property
     def mined(self):
@@ -242,6 +490,11 @@ class Block:
             block_json['nonce']
         )
         block.coinbase = coinbase
+
+        if 'merkle_root' in block_json and block_json['merkle_root'] != block.merkle_root:
+            raise Exception('Block {} merkle root doesn\'t match its transactions'.format(
+                block.height))
+
         return block
 
     def toJSON(self):
@@ -250,6 +503,7 @@ class Block:
         return {
             'block_hash': self.block_hash,
             'prev_block_hash': self.prev_block_hash,
+            'merkle_root': self.merkle_root,
             'height': self.height,
             'difficulty': self.difficulty,
             'nonce': self.nonce,
@@ -257,3 +511,53 @@ class Block:
             'coinbase': coinbase,
             'transactions': transactions
         }
+
+    def toBytes(self) -> bytes:
+        buf = bytearray([BYTES_VERSION])
+        write_hex(buf, self.prev_block_hash, 32)
+        write_hex(buf, self.merkle_root, 32)
+        write_varint(buf, self.height)
+        write_varint(buf, self.timestamp)
+        write_varint(buf, self.difficulty)
+        write_varint(buf, self.nonce)
+
+        if self.coinbase is None:
+            buf.append(0)
+        else:
+            buf.append(1)
+            self.coinbase._write(buf, with_prev_block_hash=False)
+
+        write_varint(buf, len(self.transactions))
+        for tx in self.transactions:
+            tx._write(buf)
+
+        return bytes(buf)
+
+    @classmethod
+    def fromBytes(cls, data: bytes):
+        reader = BytesReader(data)
+        _check_version(reader)
+
+        prev_block_hash = read_hex(reader, 32)
+        root = read_hex(reader, 32)
+        height = read_varint(reader)
+        timestamp = read_varint(reader)
+        difficulty = read_varint(reader)
+        nonce = read_varint(reader)
+
+        coinbase = None
+        if reader.read_byte() == 1:
+            coinbase = Coinbase._read(reader, prev_block_hash)
+
+        transactions = [Transaction._read(reader)
+                        for _ in range(read_varint(reader))]
+        _check_done(reader)
+
+        block = cls(prev_block_hash, transactions,
+                    height, timestamp, difficulty, nonce)
+        block.coinbase = coinbase
+
+        if root != block.merkle_root:
+            raise Exception('Block {} merkle root doesn\'t match its transactions'.format(height))
+
+        return block
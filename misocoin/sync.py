@@ -1,33 +1,137 @@
 import requests
 import json
+import itertools
+import threading
 
+from typing import Dict, List, Tuple
 from werkzeug.serving import WSGIRequestHandler
 
 
+# Default timeouts (in seconds) for calls to other nodes,
+# so a hung peer can't block us forever
+connect_timeout = 3.05
+read_timeout = 30
+
+# One client (and connection pool) per node
+_clients: Dict[Tuple[str, str], 'RPCClient'] = {}
+_clients_lock = threading.Lock()
+
+
 class MisocoinRequestHandler(WSGIRequestHandler):
     '''
-    Don't want verbose logging
+    Don't want verbose logging.
+
+    HTTP/1.1 so clients can keep their connections open
     '''
+    protocol_version = 'HTTP/1.1'
 
     def log(self, type, message, *args):
         return
 
 
+class RPCClient:
+    '''
+    JSON-RPC client for a single node. Reuses its
+    connections (keep-alive) instead of opening a new
+    one for every call
+
+    connect_timeout, read_timeout: Override the module
+                                   defaults (in seconds)
+    pool_size: How many connections to keep open
+    '''
+
+    def __init__(self, host='localhost', port=4000, connect_timeout=None, read_timeout=None, pool_size=4):
+        self.url = "http://{}:{}/jsonrpc".format(host, port)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.ids = itertools.count()
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        return (
+            float(self.connect_timeout or connect_timeout),
+            float(self.read_timeout or read_timeout)
+        )
+
+    def _payload(self, m, args) -> Dict:
+        return {
+            "method": m,
+            "params": args,
+            "jsonrpc": "2.0",
+            "id": next(self.ids),
+        }
+
+    def _post(self, payload):
+        return self.session.post(
+            self.url, data=json.dumps(payload),
+            headers={'content-type': 'application/json'},
+            timeout=self.timeout
+        ).json()
+
+    @staticmethod
+    def _result(response):
+        try:
+            return response['result']
+        except:
+            return response
+
+    def call(self, m, args=[]):
+        '''
+        Returns the result, or the whole response
+        if the call failed
+        '''
+        return self._result(self._post(self._payload(m, args)))
+
+    def batch(self, calls: List[Tuple[str, List]]) -> List:
+        '''
+        Makes multiple calls in a single request,
+        calls is a list of (method, params).
+
+        Returns the results in the same order
+        '''
+        if len(calls) == 0:
+            return []
+
+        payloads = [self._payload(m, args) for m, args in calls]
+        responses = self._post(payloads)
+
+        # A failed batch comes back as a single error
+        if not isinstance(responses, list):
+            return [self._result(responses)] * len(calls)
+
+        # Responses can come back in any order
+        by_id = {r.get('id'): r for r in responses}
+        return [self._result(by_id.get(p['id'], {'error': 'No response'})) for p in payloads]
+
+    def close(self):
+        self.session.close()
+
+
+def get_client(host='localhost', port=4000) -> RPCClient:
+    '''
+    Returns the shared client of a node
+    '''
+    key = (host, str(port))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = RPCClient(host, port)
+        return client
+
+
+def set_timeouts(connect: float = None, read: float = None):
+    global connect_timeout, read_timeout
+
+    if connect is not None:
+        connect_timeout = float(connect)
+    if read is not None:
+        read_timeout = float(read)
+
+
 def misocoin_cli(m, args, host='localhost', port=4000):
-    url = "http://{}:{}/jsonrpc".format(host, port)
-    headers = {'content-type': 'application/json'}
-
-    # Example echo method
-    payload = {
-        "method": m,
-        "params": args,
-        "jsonrpc": "2.0",
-        "id": 0,
-    }
-    response = requests.post(
-        url, data=json.dumps(payload), headers=headers).json()
-
-    try:
-        return response['result']
-    except:
-        return response
+    return get_client(host, port).call(m, args)
@@ -4,9 +4,10 @@ import time
 from typing import List, Union, Dict, Tuple
 from functools import reduce
 
-from misocoin.crypto import get_pub_key, sign_msg, is_sig_valid, get_address
+from misocoin.crypto import get_pub_key, sign_msg, is_sig_valid_cached, get_address
 from misocoin.struct import Block, Transaction, Vin, Vout, Coinbase
-from misocoin.hashing import sha256, get_hash
+from misocoin.hashing import sha256, get_hash, get_sighashes
+from misocoin.utxo import UTXOJournal, AddressIndex, SpentArchive
 
 
 def create_raw_tx(vins: List[Vin], vouts: List[Vout]) -> Transaction:
@@ -45,20 +46,26 @@ def sign_tx(tx: Transaction, idx: int, priv_key: str) -> Transaction:
     vin.signature = signature
     vin.pub_key = pub_key
 
-    # Rebuild vins
-    vins = _tx.vins
-    vins[idx] = vin
-
-    return Transaction(vins, vouts)
+    return Transaction(_tx.vins, vouts)
 
 
-def get_fees(tx: Transaction, utxos: Dict) -> int:
+def get_fees(tx: Transaction, utxos: Dict, spent: SpentArchive = None) -> int:
     '''
     Gets the fees inside a transaction
+
+    If spent is supplied, vins that have already been spent
+    (e.g. by this very tx) are looked up in the archive
     '''
+    def get_amount(vin: Vin) -> int:
+        if spent is not None and (vin.txid not in utxos or vin.index not in utxos[vin.txid]):
+            utxo = spent.get(vin.txid, vin.index)
+            if utxo is None:
+                raise KeyError(vin.txid)
+            return utxo['amount']
+        return utxos[vin.txid][vin.index]['amount']
+
     try:
-        total_in = reduce(
-            lambda x, y: x + utxos[y.txid][y.index]['amount'], tx.vins, 0)
+        total_in = reduce(lambda x, y: x + get_amount(y), tx.vins, 0)
         total_out = reduce(lambda x, y: x + y.amount, tx.vouts, 0)
         return (total_in - total_out)
 
@@ -69,49 +76,30 @@ def get_fees(tx: Transaction, utxos: Dict) -> int:
         raise e
 
 
-def add_tx_to_block(tx: Transaction,
-                    block: Block,
-                    txs: Dict,
-                    utxos: Dict) -> Tuple[Block, Dict, Dict]:
+def check_vins(tx: Transaction, txid: str, utxos: Dict, spent: SpentArchive = None, check_sigs: bool = True):
     '''
-    Adds the tx to the to the blockchain and broadcasts it to
-    connected nodes. 
-
-    Updates and maintains the global cache of utxos. This is also used
-    to check for double spending
+    Checks that every vin of the transaction exists, is unspent
+    and is authorized by its signature. Doesn't modify the utxos
 
     Params:
-        tx: transaction to be added to the latest block
-        block: latest block
-        txs: Global dictionary of transactions (state of all txs)
-        utxos: Global dictioanry of unspent transactions (contains
-                the state of unspent txs)
+        tx: transaction to be checked
+        txid: txid of the transaction (so we don't recompute it)
+        utxos: Global dictionary of unspent transactions
+        spent: Optional SpentArchive, used for nicer double spend errors
+        check_sigs: If False the signatures are left to the caller
+                    (e.g. to verify a whole block's at once)
     '''
-    # Make copy of object
-    _block = copy.deepcopy(block)
-    _tx = copy.deepcopy(tx)
-    _txs = copy.deepcopy(txs)
-    _utxos = copy.deepcopy(utxos)
+    seen = set()
 
-    # Can't send more than you received
-    if (get_fees(_tx, _utxos) < 0):
-        raise Exception('Attempting to spend more than you have!')
+    # Signature message of each vin
+    if check_sigs:
+        tx_hashes = get_sighashes(tx.vins, tx.vouts, txid)
 
-    # Update utxo cache
-    # Whilst checking signature validity
-    for idx, vout in enumerate(_tx.vouts):
-        if _tx.txid not in _utxos:
-            _utxos[_tx.txid] = {}
-
-        _utxos[_tx.txid][idx] = {
-            'address': vout.address,
-            'amount': vout.amount,
-            'spent': None
-        }
-
-    for vin in _tx.vins:
-        if (vin.txid in _utxos) and (vin.index in _utxos[vin.txid]):
-            if _utxos[vin.txid][vin.index]['spent'] is None:
+    for i, vin in enumerate(tx.vins):
+        if (vin.txid in utxos) and (vin.index in utxos[vin.txid]):
+            utxo = utxos[vin.txid][vin.index]
+
+            if (vin.txid, vin.index) not in seen:
                 # Check if the address in the utxos[tx.txid] is the same as the public key
                 # If it doesn't exist in the utxos, we're trying to double spend
                 # If the vout address in the utxos doesn't match the private key
@@ -119,13 +107,13 @@ def add_tx_to_block(tx: Transaction,
 
                 # Check the signature
                 try:
-                    tx_hash = get_hash(
-                        vins=[vin], vouts=_tx.vouts, txids=[_tx.txid])
-
                     same_address = get_address(
-                        vin.pub_key) == _utxos[vin.txid][vin.index]['address']
-                    valid_sig = is_sig_valid(
-                        vin.signature, vin.pub_key, tx_hash)
+                        vin.pub_key) == utxo['address']
+
+                    valid_sig = True
+                    if check_sigs:
+                        valid_sig = is_sig_valid_cached(
+                            vin.signature, vin.pub_key, tx_hashes[i])
                 except:
                     raise Exception(
                         'Corrupted pub_key/signature for vin\n{}'.format(vin))
@@ -135,22 +123,101 @@ def add_tx_to_block(tx: Transaction,
                         vin
                     ))
 
-                # Mark it as spent
-                _utxos[vin.txid][vin.index]['spent'] = _tx.txid
+                seen.add((vin.txid, vin.index))
 
             else:
                 raise Exception(
                     'Transaction {} at vin {} has been spent'.format(vin.txid, vin.index))
 
+        elif spent is not None and (vin.txid, vin.index) in spent:
+            raise Exception('Transaction {} at vin {} has been spent by {}'.format(
+                vin.txid, vin.index, spent.get(vin.txid, vin.index)['spent']))
+
         else:
             raise Exception('Transaction {} does not exist'.format(vin.txid))
 
+
+def apply_tx(tx: Transaction, txid: str, utxos: Dict, journal: UTXOJournal,
+             spent: SpentArchive = None, check_sigs: bool = True):
+    '''
+    Checks the tx against the utxos, then spends its vins and
+    creates its vouts through the journal (the caller rolls
+    the journal back if anything goes wrong)
+    '''
+    check_vins(tx, txid, utxos, spent, check_sigs)
+
+    # Can't send more than you received
+    if (get_fees(tx, utxos) < 0):
+        raise Exception('Attempting to spend more than you have!')
+
+    # Update utxo cache
+    for idx, vout in enumerate(tx.vouts):
+        journal.create(txid, idx, vout.address, vout.amount)
+
+    for vin in tx.vins:
+        journal.spend(vin.txid, vin.index, txid)
+
+
+def add_tx_to_block(tx: Transaction,
+                    block: Block,
+                    txs: Dict,
+                    utxos: Dict,
+                    address_index: AddressIndex = None,
+                    spent: SpentArchive = None,
+                    check_sigs: bool = True) -> Tuple[Block, Dict, Dict]:
+    '''
+    Adds the tx to the to the blockchain and broadcasts it to
+    connected nodes. 
+
+    Updates and maintains the global cache of utxos. This is also used
+    to check for double spending
+
+    The tx is validated against the live utxos first, then applied
+    in place through a journal. If anything goes wrong the journal
+    is rolled back, so block, txs and utxos are left untouched
+
+    Params:
+        tx: transaction to be added to the latest block
+        block: latest block
+        txs: Global dictionary of transactions (state of all txs)
+        utxos: Global dictioanry of unspent transactions (contains
+                the state of unspent txs)
+        address_index: Optional AddressIndex kept in sync with utxos
+        spent: Optional SpentArchive that spent outputs are moved to
+        check_sigs: If False the signatures must have been verified already
+    '''
+    # Only copy the tx, the caches are updated in place
+    _tx = copy.deepcopy(tx)
+    txid = _tx.txid
+
+    journal = UTXOJournal(utxos, address_index, spent)
+    try:
+        apply_tx(_tx, txid, utxos, journal, spent, check_sigs)
+
+    except:
+        journal.rollback()
+        raise
+
     # Add to global_txs
-    _txs[_tx.txid] = _tx
+    txs[txid] = _tx
 
     # Wow state mutations
-    _block.transactions = _block.transactions + [_tx]
-    return _block, _txs, _utxos
+    block.add_transactions([_tx])
+    return block, txs, utxos
+
+
+def add_coinbase_to_utxos(coinbase: Coinbase,
+                          utxos: Dict,
+                          address_index: AddressIndex = None,
+                          journal: UTXOJournal = None):
+    '''
+    Adds the coinbase's only vout (index 0) to the utxo cache
+    (recording it in journal, if supplied)
+    '''
+    if journal is None:
+        journal = UTXOJournal(utxos, address_index)
+    journal.create(coinbase.txid, 0,
+                   coinbase.reward_address, coinbase.reward_amount)
 
 
 def print_blockchain(blockchain: List[Block]):
@@ -0,0 +1,258 @@
+# Transactional helpers for the utxo cache
+import sqlite3
+import threading
+
+from typing import Dict, List, Tuple
+
+
+class AddressIndex:
+    '''
+    Secondary index of the utxo cache keyed by address.
+    Only holds unspent outpoints, and keeps a running
+    balance so we don't have to walk the whole cache
+    '''
+
+    def __init__(self):
+        # outpoints[address][(txid, index)] = amount
+        self.outpoints: Dict[str, Dict[Tuple[str, int], int]] = {}
+        self.balances: Dict[str, int] = {}
+
+    def add(self, address: str, txid: str, index: int, amount: int):
+        self.outpoints.setdefault(address, {})[(txid, index)] = amount
+        self.balances[address] = self.balances.get(address, 0) + amount
+
+    def remove(self, address: str, txid: str, index: int):
+        outpoints = self.outpoints[address]
+        amount = outpoints.pop((txid, index))
+        self.balances[address] -= amount
+
+        if len(outpoints) == 0:
+            del self.outpoints[address]
+            del self.balances[address]
+
+    def balance(self, address: str) -> int:
+        return self.balances.get(address, 0)
+
+    def unspent(self, address: str) -> List[Tuple[str, int, int]]:
+        '''
+        Returns a list of (txid, index, amount) owned by address
+        '''
+        outpoints = self.outpoints.get(address, {})
+        return [(txid, index, amount) for (txid, index), amount in list(outpoints.items())]
+
+
+class SpentArchive:
+    '''
+    Compact record of every output that has been spent,
+    so spent outputs don't have to live in the utxo cache.
+
+    Each outpoint is stored as a single packed key/value
+    pair (raw txid bytes + index -> raw spender bytes + amount
+    and address), either in memory or (if path is supplied)
+    in a sqlite file on disk
+
+    path: Optional path of the on-disk archive
+    '''
+
+    # How many writes before we commit to disk
+    commit_every = 10000
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self.db = None
+        self.pending = 0
+
+        if path is None:
+            self.db = {}
+        else:
+            # Readers use it from other threads
+            self.lock = threading.Lock()
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute('PRAGMA synchronous = OFF')
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS spent (outpoint BLOB PRIMARY KEY, record BLOB) WITHOUT ROWID')
+
+    @staticmethod
+    def _key(txid: str, index: int) -> bytes:
+        '''
+        Returns None for outpoints that can't exist
+        (txids are always sha256 hex digests)
+        '''
+        try:
+            return bytes.fromhex(txid) + index.to_bytes(4, 'big')
+        except (ValueError, TypeError, OverflowError):
+            return None
+
+    def _wrote(self):
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self._commit()
+
+    def _commit(self):
+        self.conn.commit()
+        self.pending = 0
+
+    def add(self, txid: str, index: int, spender: str, address: str, amount: int):
+        key = self._key(txid, index)
+        record = bytes.fromhex(spender) + \
+            '{} {}'.format(amount, address).encode()
+
+        if self.db is not None:
+            self.db[key] = record
+        else:
+            with self.lock:
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO spent VALUES (?, ?)', (key, record))
+                self._wrote()
+
+    def remove(self, txid: str, index: int):
+        key = self._key(txid, index)
+
+        if self.db is not None:
+            del self.db[key]
+        else:
+            with self.lock:
+                self.conn.execute('DELETE FROM spent WHERE outpoint = ?', (key,))
+                self._wrote()
+
+    def _get_record(self, key: bytes) -> bytes:
+        if key is None:
+            return None
+
+        if self.db is not None:
+            return self.db.get(key)
+
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT record FROM spent WHERE outpoint = ?', (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def get(self, txid: str, index: int) -> Dict:
+        '''
+        Returns the spent output as
+        { 'address', 'amount', 'spent' } or None
+        '''
+        record = self._get_record(self._key(txid, index))
+        if record is None:
+            return None
+
+        amount, address = record[32:].decode().split(' ', 1)
+        return {'address': address, 'amount': int(amount), 'spent': record[:32].hex()}
+
+    def __contains__(self, outpoint: Tuple[str, int]) -> bool:
+        return self._get_record(self._key(*outpoint)) is not None
+
+    def __len__(self):
+        if self.db is not None:
+            return len(self.db)
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM spent').fetchone()[0]
+
+    def flush(self):
+        if self.db is None:
+            with self.lock:
+                self._commit()
+
+    def close(self):
+        if self.db is None:
+            self.flush()
+            self.conn.close()
+
+
+class UTXOJournal:
+    '''
+    Records every change made to the utxo cache so a
+    partially applied transaction can be undone, instead
+    of copying the whole cache before touching it
+
+    utxos: Global dictionary of unspent transactions,
+           utxo[txid][index] = { 'address', 'amount' }
+    address_index: Optional AddressIndex kept in sync with utxos
+    spent: Optional SpentArchive that spent outputs are moved to
+    entries: Changes recorded by an earlier journal (e.g. a
+             block's undo record), so they can be rolled back
+    '''
+
+    def __init__(self, utxos: Dict, address_index: AddressIndex = None, spent: SpentArchive = None,
+                 entries: List[Tuple] = None):
+        self.utxos = utxos
+        self.address_index = address_index
+        self.spent = spent
+        self.entries: List[Tuple] = [] if entries is None else entries
+
+    def _index_add(self, utxo: Dict, txid: str, index: int):
+        if self.address_index is not None:
+            self.address_index.add(
+                utxo['address'], txid, index, utxo['amount'])
+
+    def _index_remove(self, utxo: Dict, txid: str, index: int):
+        if self.address_index is not None:
+            self.address_index.remove(utxo['address'], txid, index)
+
+    def create(self, txid: str, index: int, address: str, amount: int):
+        '''
+        Adds a new unspent output to the cache
+        '''
+        outputs = self.utxos.get(txid)
+        new_txid = outputs is None
+        if new_txid:
+            outputs = self.utxos[txid] = {}
+
+        prev = outputs.get(index)
+        if prev is not None:
+            self._index_remove(prev, txid, index)
+
+        self.entries.append(('create', txid, index, new_txid, prev))
+        outputs[index] = {
+            'address': address,
+            'amount': amount
+        }
+        self._index_add(outputs[index], txid, index)
+
+    def spend(self, txid: str, index: int, spender: str):
+        '''
+        Removes an output from the cache, moving it
+        to the spent archive
+        '''
+        outputs = self.utxos[txid]
+        utxo = outputs[index]
+
+        # Archive it first, so readers that look at the cache
+        # then the archive (without locking) always find it
+        if self.spent is not None:
+            self.spent.add(txid, index, spender,
+                           utxo['address'], utxo['amount'])
+
+        del outputs[index]
+        if len(outputs) == 0:
+            del self.utxos[txid]
+
+        self._index_remove(utxo, txid, index)
+        self.entries.append(('spend', txid, index, utxo))
+
+    def rollback(self):
+        '''
+        Undo every recorded change, newest first
+        '''
+        for entry in reversed(self.entries):
+            if entry[0] == 'create':
+                _, txid, index, new_txid, prev = entry
+                self._index_remove(self.utxos[txid][index], txid, index)
+
+                if new_txid:
+                    del self.utxos[txid]
+                elif prev is None:
+                    del self.utxos[txid][index]
+                else:
+                    self.utxos[txid][index] = prev
+                    self._index_add(prev, txid, index)
+
+            else:
+                _, txid, index, utxo = entry
+                self.utxos.setdefault(txid, {})[index] = utxo
+                self._index_add(utxo, txid, index)
+
+                if self.spent is not None:
+                    self.spent.remove(txid, index)
+
+        self.entries = []
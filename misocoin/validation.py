@@ -0,0 +1,198 @@
+# Validates batches of transactions (e.g. all of a block's),
+# cheap checks first, then every signature at once
+import copy
+import multiprocessing
+
+from typing import Dict, List, Tuple
+
+import misocoin.utils as mutils
+
+from misocoin.crypto import SignatureCache, is_sig_valid, sig_cache
+from misocoin.hashing import get_sighashes
+from misocoin.mempool import Mempool
+from misocoin.struct import Block, Transaction
+from misocoin.utxo import UTXOJournal, AddressIndex, SpentArchive
+
+
+def sig_jobs(tx: Transaction, txid: str) -> List[Tuple[str, str, str]]:
+    '''
+    Returns (signature, pub_key, message) of every vin
+    '''
+    return [
+        (vin.signature, vin.pub_key, msg)
+        for vin, msg in zip(tx.vins, get_sighashes(tx.vins, tx.vouts, txid))
+    ]
+
+
+def _verify(job: Tuple[str, str, str]) -> bool:
+    try:
+        return is_sig_valid(*job)
+    except:
+        return False
+
+
+def _verify_chunk(jobs: List[Tuple[str, str, str]]) -> List[bool]:
+    return [_verify(job) for job in jobs]
+
+
+class SignatureVerifier:
+    '''
+    Verifies signatures on a pool of worker processes.
+    Batches smaller than min_parallel (or with workers <= 1)
+    are verified serially, it isn't worth shipping them
+
+    Signatures in the cache aren't verified again, and the
+    ones that turn out valid are added to it
+
+    workers: Number of processes
+    min_parallel: Smallest batch sent to the pool
+    cache: SignatureCache to use
+    '''
+
+    def __init__(self, workers: int = 1, min_parallel: int = 64, cache: SignatureCache = sig_cache):
+        self.workers = workers
+        self.min_parallel = min_parallel
+        self.cache = cache
+        self.pool = None
+
+        if workers > 1:
+            self.pool = multiprocessing.Pool(workers)
+
+    def verify(self, jobs: List[Tuple[str, str, str]]) -> List[bool]:
+        '''
+        Returns whether each (signature, pub_key, message) is valid
+        '''
+        results = [True] * len(jobs)
+        unknown = [i for i, job in enumerate(jobs) if not self.cache.is_known(*job)]
+        unknown_jobs = [jobs[i] for i in unknown]
+
+        for i, valid in zip(unknown, self._verify(unknown_jobs)):
+            results[i] = valid
+            if valid:
+                self.cache.add(*jobs[i])
+
+        return results
+
+    def _verify(self, jobs: List[Tuple[str, str, str]]) -> List[bool]:
+        if self.pool is None or len(jobs) < self.min_parallel:
+            return _verify_chunk(jobs)
+
+        # A few chunks per worker to even out the load
+        size = -(-len(jobs) // (self.workers * 4))
+        chunks = [jobs[i:i + size] for i in range(0, len(jobs), size)]
+        return [valid for chunk in self.pool.map(_verify_chunk, chunks) for valid in chunk]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+
+def connect_txs(new_txs: List[Transaction],
+                block: Block,
+                txs: Dict,
+                utxos: Dict,
+                address_index: AddressIndex = None,
+                spent: SpentArchive = None,
+                verifier: SignatureVerifier = None,
+                journal: UTXOJournal = None) -> Tuple[Block, Dict, Dict]:
+    '''
+    Adds a block's worth of txs to block, all or nothing. Txs we
+    already have are skipped.
+
+    Every tx is checked against (and applied to) the utxos in
+    order without its signatures, then all the signatures are
+    verified in one batch. If anything is invalid every tx is
+    rolled back
+
+    Same params as add_tx_to_block, plus
+        verifier: SignatureVerifier to use (serial if None)
+        journal: Journal to record the changes in (e.g. to undo
+                 the block later), it's rolled back on failure
+    '''
+    if journal is None:
+        journal = UTXOJournal(utxos, address_index, spent)
+    added: List[Transaction] = []
+    added_txids = set()
+    jobs = []
+
+    try:
+        for tx in new_txs:
+            _tx = copy.deepcopy(tx)
+            txid = _tx.txid
+            if txid in txs or txid in added_txids:
+                continue
+
+            mutils.apply_tx(_tx, txid, utxos, journal, spent, check_sigs=False)
+            added.append(_tx)
+            added_txids.add(txid)
+            jobs += [(job, _tx, vin) for job, vin in zip(sig_jobs(_tx, txid), _tx.vins)]
+
+        results = (verifier or SignatureVerifier()).verify([job for job, _, _ in jobs])
+        for valid, (_, _tx, vin) in zip(results, jobs):
+            if not valid:
+                raise Exception('You don\'t have the credentials to authorize this transaction:\n\t{}'.format(
+                    vin
+                ))
+
+    except:
+        journal.rollback()
+        raise
+
+    for _tx in added:
+        txs[_tx.txid] = _tx
+
+    block.add_transactions(added)
+    return block, txs, utxos
+
+
+def add_txs_to_mempool(new_txs: List[Transaction],
+                       mempool: Mempool,
+                       txs: Dict,
+                       utxos: Dict,
+                       spent: SpentArchive = None,
+                       verifier: SignatureVerifier = None) -> List[Tuple[Transaction, str]]:
+    '''
+    Adds a batch of txs (e.g. relayed to us) to the mempool, each
+    one on its own. Txs spending outputs that don't exist (or aren't
+    created earlier in the batch) are turned away before their
+    signatures are verified, the rest are verified in one batch,
+    then added in order.
+
+    Returns (tx, error) for every new tx, error is None if it was added
+    '''
+    new_txs = [tx for tx in new_txs if tx.txid not in txs and tx.txid not in mempool]
+    batch_txids = set(tx.txid for tx in new_txs)
+
+    def may_exist(vin):
+        return vin.txid in batch_txids or mempool.coin(vin.txid, vin.index, utxos) is not None
+
+    jobs, counts = [], []
+    for tx in new_txs:
+        tx_jobs = sig_jobs(tx, tx.txid) if all(map(may_exist, tx.vins)) else []
+        jobs += tx_jobs
+        counts.append(len(tx_jobs))
+
+    results = (verifier or SignatureVerifier()).verify(jobs)
+
+    added = []
+    start = 0
+    for tx, count in zip(new_txs, counts):
+        valid = all(results[start:start + count])
+        start += count
+
+        try:
+            # Let the mempool explain what's missing
+            if count == 0:
+                mempool.check(tx, utxos, spent, check_sigs=False)
+
+            if not valid:
+                raise Exception('You don\'t have the credentials to authorize this transaction')
+
+            mempool.add(tx, utxos, spent, check_sigs=False)
+            added.append((tx, None))
+
+        except Exception as e:
+            added.append((tx, str(e)))
+
+    return added
@@ -0,0 +1,80 @@
+# Keys we can spend with, and signing txs with them
+import threading
+
+from typing import Dict, List
+
+from misocoin.crypto import get_pub_key, get_address, sign_msg
+from misocoin.hashing import get_sighashes
+from misocoin.struct import Transaction, Vin
+
+
+class Key:
+    '''
+    A private key with its public key and address, derived
+    once (get_pub_key is an EC point multiplication)
+    '''
+
+    __slots__ = ('priv_key', 'pub_key', 'address')
+
+    def __init__(self, priv_key: str):
+        self.priv_key = priv_key
+        self.pub_key = get_pub_key(priv_key)
+        self.address = get_address(self.pub_key)
+
+
+class Keystore:
+    '''
+    Keys by address. Adding a private key that's already
+    in it doesn't derive its public key again
+    '''
+
+    def __init__(self):
+        self.keys: Dict[str, Key] = {}
+        self._by_priv_key: Dict[str, Key] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, address: str) -> bool:
+        return address in self.keys
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, priv_key: str) -> Key:
+        with self._lock:
+            key = self._by_priv_key.get(priv_key)
+            if key is None:
+                key = Key(priv_key)
+                self._by_priv_key[priv_key] = key
+                self.keys[key.address] = key
+            return key
+
+    def get(self, address: str) -> Key:
+        return self.keys.get(address)
+
+    def addresses(self) -> List[str]:
+        return list(self.keys)
+
+
+def sign_all(tx: Transaction, key: Key, indexes: List[int] = None) -> Transaction:
+    '''
+    Signs every vin of tx (or the ones at indexes) with key,
+    returns a signed copy. Only the vins are copied, the txid
+    and the vouts part of the messages are computed once for
+    all of them (mutils.sign_tx does all of it per vin)
+    '''
+    if indexes is None:
+        indexes = range(len(tx.vins))
+
+    vins = []
+    for vin in tx.vins:
+        _vin = Vin(vin.txid, vin.index)
+        _vin.pub_key = vin.pub_key
+        _vin.signature = vin.signature
+        vins.append(_vin)
+
+    to_sign = [vins[i] for i in indexes]
+    for vin, msg in zip(to_sign, get_sighashes(to_sign, tx.vouts, tx.txid)):
+        vin.signature = sign_msg(msg, key.priv_key)
+        vin.pub_key = key.pub_key
+
+    return Transaction(vins, tx.vouts)
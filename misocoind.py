@@ -1,12 +1,16 @@
 #! /usr/bin/env python
 
+import base64
 import json
 import copy
+import itertools
+import os
 import sys
 import threading
 import time
 import misocoin.utils as mutils
 
+from collections import OrderedDict
 from functools import reduce, partial
 from typing import List, Dict, Tuple
 from pprint import pprint
@@ -15,9 +19,24 @@ from werkzeug.serving import run_simple
 from jsonrpc import JSONRPCResponseManager, dispatcher
 
 from misocoin.hashing import sha256
-from misocoin.crypto import get_new_priv_key, get_pub_key, get_address
-from misocoin.struct import Vin, Vout, Coinbase, Transaction, Block
-from misocoin.sync import misocoin_cli, MisocoinRequestHandler
+from misocoin.crypto import get_new_priv_key
+from misocoin.struct import Vin, Vout, Coinbase, Transaction, Block, BYTES_VERSION
+from misocoin.sync import misocoin_cli, set_timeouts, MisocoinRequestHandler
+from misocoin.utxo import AddressIndex, SpentArchive, UTXOJournal
+from misocoin.mining import Miner
+from misocoin.store import BlockStore
+from misocoin.broadcast import Broadcaster, node_key, key_node
+from misocoin.server import AsyncRPCServer
+from misocoin.chainstate import ChainSnapshot, ChainWriter
+from misocoin.validation import SignatureVerifier, connect_txs, add_txs_to_mempool
+from misocoin.mempool import Mempool
+from misocoin.blocktree import BlockTree, BlockIndex
+from misocoin.difficulty import DifficultyWindow
+from misocoin.wallet import Keystore, Key, sign_all
+from misocoin.coinselect import select_coins
+from misocoin.merkle import merkle_branch, header_hash
+from misocoin.history import TxIndex, AddressHistory, MAX_HISTORY_PER_REQUEST, \
+    block_txs, spent_outputs
 
 # Private Key to the genesis_block's output address is
 # sha256('miso is a good boy')
@@ -46,24 +65,107 @@ global_port = 4000
 # global nodes
 global_nodes = []
 
-# Global difficulty
-global_difficulty = 1
+# Difficulty of every block in our chain (and the next one)
+global_difficulty = DifficultyWindow()
 
 # utxo cache
 # is of structure
-# utxo[txid][index] = { 'address': address, 'amount': amount, 'spent': None or txid }
+# utxo[txid][index] = { 'address': address, 'amount': amount }
+# only holds unspent outputs, spent ones are moved
+# to global_spent
 global_utxos = {}
 
+# Archive of spent outputs, replaced with an on-disk
+# one if -spent_db is supplied
+global_spent = SpentArchive()
+
+# Secondary index of global_utxos keyed by address
+# only holds unspent outpoints and running balances
+global_address_index = AddressIndex()
+
 # Tx is a dict of all transactions
 # that ever took place
 global_txs = {}
 
-# blockchain
+# Txs waiting to be mined, -mempool_size (in MB)
+# sets how much it holds
+global_mempool = Mempool()
+
+# Fees of the txs in global_best_block
+global_template_fees = 0
+
+# blockchain (our chain, keyed by height)
 global_blockchain = {}
 
+# Every block we know of keyed by hash, including
+# the ones on chains competing with ours
+global_block_tree = BlockTree()
+
+# Undo records of the last UNDO_DEPTH blocks in our chain
+# global_undo[block_hash] = (utxo journal entries, txids
+# it added)
+global_undo = OrderedDict()
+
+# Optional indexes of our chain (-txindex=1, -addressindex=1)
+# txid -> (height, position) and address -> txs that touched it
+global_tx_index = None
+global_address_history = None
+
+# On disk block store (replaces global_blockchain
+# if -datadir is supplied)
+global_store = None
+
+# Checkpoint chain state every n blocks
+global_snapshot_every = 1000
+
+# Miner (pool of mining processes), None if
+# we're not mining
+global_miner = None
+
+# Verifies the signatures of blocks and batches of txs,
+# serially until run_misocoin starts the worker processes
+global_verifier = SignatureVerifier()
+
+# Relays txs and blocks to global_nodes in the background,
+# -broadcast=serial sends them in the calling thread instead
+global_broadcaster = Broadcaster()
+
+# How txs and blocks are relayed, 'inv' announces their
+# hashes and nodes fetch what they don't have, 'push'
+# sends the whole thing to every node
+global_relay = 'inv'
+
+# How send_misocoin picks the coins it spends: 'bnb' looks
+# for an exact match (no change), then takes the largest
+# first, see misocoin.coinselect for the others
+global_coin_selection = 'bnb'
+
+# Hashes we've asked a node for and are waiting on
+global_requested = set()
+global_requested_lock = threading.Lock()
+
+# Bytes of JSON-RPC requests and responses we've handled
+# (updated from every request thread)
+global_net_totals = {'requests': 0, 'bytes_recv': 0, 'bytes_sent': 0}
+global_net_totals_lock = threading.Lock()
+
 # blacklisted nodes
 global_blacklisted_nodes = {}
 
+# Batch sizes used when catching up with a node
+SYNC_HEADERS_BATCH = 2000
+SYNC_BLOCKS_BATCH = 100
+
+# Most we'll return for a single get_headers/get_blocks
+MAX_HEADERS_PER_REQUEST = 2000
+MAX_BLOCKS_PER_REQUEST = 500
+
+# Most txs we'll put in a block we mine
+MAX_TEMPLATE_TXS = 5000
+
+# Deepest reorg we can do
+UNDO_DEPTH = 1000
+
 # Genesis block
 genesis_epoch = 1512254915
 genesis_block = Block(
@@ -78,205 +180,730 @@ genesis_block = Block(
 # At init best block will the the genesis_block
 global_best_block = genesis_block
 
+
+def take_snapshot(version: int) -> ChainSnapshot:
+    return ChainSnapshot(
+        len(global_blockchain), global_difficulty.next,
+        copy.copy(global_best_block), version
+    )
+
+
+# Every change to the chain state (blocks, utxos, txs,
+# best block, difficulty) goes through global_chain, one
+# at a time. RPCs read from global_chain.snapshot
+global_chain = ChainWriter(take_snapshot)
+global_chain.publish()
+
 # For now we'll just fix their address and private key
 account_address = '461ec74a3ce3ea96267c1b7d043b35004a7058f1'
 account_priv_key = '60c8cb60c21143fffdd682f399ef3baa4b67c56a1f83a274284cfe7c57e007ed'
 
+# Our keys (pub keys and addresses derived once)
+global_keystore = Keystore()
+account_key = global_keystore.add(account_priv_key)
+
+
+def encode_block(block: Block) -> str:
+    '''
+    Block in the compact binary format (base64 so it fits
+    in JSON-RPC), or JSON if the binary format can't hold it
+    '''
+    try:
+        return base64.b64encode(block.toBytes()).decode()
+    except Exception:
+        return json.dumps(block.toJSON())
+
+
+def decode_block(block_str: str) -> Block:
+    '''
+    Accepts both the JSON and the base64 binary form
+    '''
+    if block_str.lstrip().startswith('{'):
+        return Block.fromJSON(json.loads(block_str))
+    return Block.fromBytes(base64.b64decode(block_str))
+
+
+def relay(item: List, m: str, args: List, origin: str = None):
+    '''
+    Lets our nodes (except origin) know about a tx or block
+    without waiting for them. item is ['tx', txid] or
+    ['block', block_hash, height].
+
+    Only announces the hash, unless we're relaying with
+    -relay=push, in which case m(*args) is sent instead
+    '''
+    nodes = list(filter(
+        lambda x: x['host'] not in global_blacklisted_nodes, global_nodes))
+
+    # Let them know who it's from so they don't send it back
+    our_node = '{}:{}'.format(global_host, global_port)
+    if global_relay == 'push':
+        global_broadcaster.broadcast(
+            nodes, item[1], m, args + [our_node], origin)
+    else:
+        global_broadcaster.broadcast(
+            nodes, item[1], 'inv', [[item], our_node], origin, merge=True)
+
+
+def catch_up(node: Dict, target_height: int):
+    '''
+    Downloads the blocks we're missing up to target_height
+    from node. Headers first (to check they link up with a
+    block we have before downloading anything big), then the
+    blocks themselves in batches, added in order.
+
+    If node's chain forked off ours, steps back (twice as far
+    every time) until its headers link up with our tree
+
+    Iterative, so long gaps don't recurse
+    '''
+    # (If we're as far along, the node's chain can still be a
+    # different one, so check at least its last header)
+    start = max(1, min(global_chain.snapshot.height + 1, target_height))
+    step = 1
+
+    while start <= target_height:
+        count = min(SYNC_HEADERS_BATCH, target_height - start + 1)
+
+        headers = misocoin_cli('get_headers', [start, count], **node)
+        if not isinstance(headers, list) or len(headers) == 0:
+            raise Exception('Node didn\'t return headers: {}'.format(headers))
+
+        if headers[0]['prev_block_hash'] not in global_block_tree:
+            if start == 1:
+                raise Exception('Node\'s chain doesn\'t link up with ours')
+
+            start = max(1, start - step)
+            step *= 2
+            continue
+
+        prev_block_hash = headers[0]['prev_block_hash']
+        for height, header in enumerate(headers, start):
+            if header['height'] != height:
+                raise Exception('Expected header {}, got {}'.format(
+                    height, header['height']))
+
+            if header['prev_block_hash'] != prev_block_hash:
+                raise Exception(
+                    'Header {} doesn\'t link up with the one before it'.format(height))
+
+            if header['block_hash'][:header['difficulty']] != '0' * header['difficulty']:
+                raise Exception('Header {} hasn\'t been mined'.format(height))
+
+            # Headers are small and fixed size, so it's
+            # cheap to check the hash is really theirs
+            if header_hash(header) != header['block_hash']:
+                raise Exception('Header {} doesn\'t hash to its block hash'.format(height))
+
+            prev_block_hash = header['block_hash']
+
+        # Download the blocks we don't have in windows
+        missing = [header for header in headers
+                   if header['block_hash'] not in global_block_tree]
+
+        for i in range(0, len(missing), SYNC_BLOCKS_BATCH):
+            window = missing[i:i + SYNC_BLOCKS_BATCH]
+            block_strs = misocoin_cli(
+                'get_blocks', [window[0]['height'], len(window)], **node)
+
+            if not isinstance(block_strs, list) or len(block_strs) != len(window):
+                raise Exception('Node didn\'t return blocks: {}'.format(block_strs))
 
-def add_to_blockchain(block: Block):
+            for header, block_str in zip(window, block_strs):
+                block = decode_block(block_str)
+                if block.block_hash != header['block_hash']:
+                    raise Exception(
+                        'Block {} doesn\'t match its header'.format(block.height))
+
+                # Old blocks, no need to relay them
+                add_to_blockchain(block, broadcast=False)
+
+        start = headers[-1]['height'] + 1
+
+
+def add_to_blockchain(block: Block, broadcast: bool = True, origin: str = None):
     """
     Helper function to update the blockchain.    
 
-    Also updates the utxo cache and tx cache
-    """
-    global global_best_block, global_txs, global_utxos, global_difficulty
+    Also updates the utxo cache and tx cache.
+    origin is the node ('host:port') we got the block from
 
-    # If we don't have the prev block, get it from our nodes
-    if (block.height - 1) not in global_blockchain:
-        for node in global_nodes:
+    If we don't have the block's parent we catch up with our
+    nodes first. That's network I/O, so it happens on the
+    caller's thread, the chain only sees blocks that link up
+    """
+    # Cheap checks first, junk blocks shouldn't
+    # cost us any requests to our nodes
+    if not block.mined:
+        raise Exception('Block hasn\'t been mined')
+
+    if block.block_hash in global_block_tree:
+        return
+
+    # If we don't have the prev block, catch up with
+    # our nodes (the one that sent it first)
+    if block.prev_block_hash not in global_block_tree:
+        nodes = list(global_nodes)
+        if origin is not None:
+            nodes = [key_node(origin)] + [x for x in nodes if node_key(x) != origin]
+
+        for node in nodes:
             try:
-                missing_block_dict: Dict = misocoin_cli(
-                    'get_block', [block.height - 1], **node)
-                missing_block: Block = Block.fromJSON(missing_block_dict)
-                add_to_blockchain(missing_block)
-                break
+                catch_up(node, block.height - 1)
             except:
                 pass
 
-    # Check block hashes
-    if len(global_blockchain) > 0:
-        # Check hashes
-        if block.prev_block_hash != global_blockchain[block.height - 1].block_hash:
-            raise Exception(
-                'Block previous hash doesn\'t match')
-
-        if not block.mined:
-            raise Exception('Block hasn\'t been mined')
-
-    # Add block to node
-    if block.height not in global_blockchain:
-        global_blockchain[block.height] = block
-
-        # Add coinbase to cache
-        if block.coinbase.txid not in global_txs:
-            global_txs[block.coinbase.txid] = block.coinbase
-
-        if block.coinbase.txid not in global_utxos:
-            global_utxos[block.coinbase.txid] = {}
-            global_utxos[block.coinbase.txid][0] = {
-                'address': block.coinbase.reward_address,
-                'amount': block.coinbase.reward_amount,
-                'spent': None
-            }
-
-        # Add tx
-        for tx in block.transactions:
-            if tx.txid not in global_txs:
-                # Update utxos
-                global_best_block, global_txs, global_utxos = mutils.add_tx_to_block(
-                    tx, global_best_block, global_txs, global_utxos
-                )
-
-        # Only ammend global_best_block if the block.height
-        # is higher
-        if (global_best_block.height < block.height + 1):
-            global_best_block = Block(
-                prev_block_hash=block.block_hash,
-                transactions=[],
-                height=block.height + 1,
-                timestamp=int(time.time()),
-                difficulty=global_difficulty,
-                nonce=0
-            )
-
-        # Broadcast block
-        for node in global_nodes:
+            if block.prev_block_hash in global_block_tree:
+                break
+
+        if block.prev_block_hash not in global_block_tree:
+            raise Exception('Block {} doesn\'t link up with our chain'.format(block.height))
+
+    return global_chain.submit(_add_to_blockchain, block, broadcast, origin)
+
+
+def _add_to_blockchain(block: Block, broadcast: bool, origin: str):
+    if block.block_hash in global_block_tree:
+        return
+
+    tip = global_block_tree.tip
+    parent = global_block_tree.get(block.prev_block_hash)
+    if parent is not None and parent is not tip:
+        check_side_block(block, parent)
+
+    # Checks it links up with its parent
+    entry = global_block_tree.add(block)
+
+    # Chain with the most work wins
+    if entry.chain_work <= tip.chain_work:
+        print('[INFO] Block {} {} is on a side chain'.format(block.height, block.block_hash))
+        return
+
+    if entry.prev_block_hash == tip.block_hash:
+        try:
+            connect_tip(entry)
+        except:
+            entry.invalid = True
+            raise
+    else:
+        reorg(entry)
+
+    # Side chains we can't reorg to anymore
+    global_block_tree.prune(global_block_tree.tip.height - UNDO_DEPTH)
+
+    # Broadcast block
+    if broadcast:
+        relay(['block', block.block_hash, block.height],
+              'receive_mined_block', [encode_block(block)], origin)
+
+    print('[INFO] Received mined block {}'.format(block.height))
+
+
+def check_side_block(block: Block, parent: BlockIndex):
+    '''
+    Raises if a block that doesn't build on our tip can't end
+    up in our chain: it forks off too far back to reorg to, or
+    its difficulty is lower than its chain could have gotten
+    down to. Side blocks are kept in memory until their chain
+    gets connected, so these stop cheap forks piling up
+    '''
+    tip = global_block_tree.tip
+
+    # (Fork is at most as high as the parent, checking that first
+    # keeps fork_point from walking our whole chain back)
+    if parent.height < tip.height - UNDO_DEPTH:
+        raise Exception('Block {} forks off too far back'.format(block.height))
+
+    fork = global_block_tree.fork_point(tip, parent)
+    if fork.height < tip.height - UNDO_DEPTH:
+        raise Exception('Block {} forks off too far back'.format(block.height))
+
+    lowest = global_difficulty.lowest(fork.height, block.height)
+    if block.difficulty < lowest:
+        raise Exception('Block {} has difficulty {}, its chain can\'t be below {}'.format(
+            block.height, block.difficulty, lowest))
+
+
+def connect_tip(entry: BlockIndex):
+    '''
+    Connects the block after our tip, making it the new tip
+    '''
+    block = entry.block
+    global_difficulty.check(block)
+    connect_block(block)
+
+    global_blockchain[block.height] = block
+    global_block_tree.tip = entry
+    entry.block = None
+
+    # Checkpoint the chain state every so often
+    if global_store is not None and block.height % global_snapshot_every == 0:
+        save_chain_state(block.height)
+
+
+def disconnect_tip() -> Block:
+    '''
+    Undoes the last block of our chain, returns it
+    '''
+    entry = global_block_tree.tip
+    if entry.block_hash not in global_undo:
+        raise Exception('No undo record for block {}'.format(entry.height))
+
+    block = global_blockchain[entry.height]
+    journal_entries, txids = global_undo.pop(entry.block_hash)
+
+    if global_tx_index is not None:
+        global_tx_index.disconnect(txids)
+    if global_address_history is not None:
+        global_address_history.disconnect(block, txids, spent_outputs(journal_entries))
+
+    UTXOJournal(global_utxos, global_address_index, global_spent, journal_entries).rollback()
+    global_spent.flush()
+    for txid in txids:
+        global_txs.pop(txid, None)
+    global_difficulty.disconnect()
+
+    del global_blockchain[entry.height]
+    global_block_tree.hold(entry, block)
+    global_block_tree.tip = global_block_tree.get(entry.prev_block_hash)
+
+    new_template(global_block_tree.tip.block_hash, entry.height)
+    if global_miner is not None:
+        global_miner.cancel()
+
+    return block
+
+
+def reorg(new_tip: BlockIndex):
+    '''
+    Switches our chain over to the one ending in new_tip. Only the
+    blocks after the fork are touched: ours are disconnected (newest
+    first), then the new ones connected. If one of them turns out to
+    be invalid, our old chain is put back.
+
+    Txs of our disconnected blocks go back in the mempool
+    '''
+    fork = global_block_tree.fork_point(global_block_tree.tip, new_tip)
+    old_branch = global_block_tree.branch(fork, global_block_tree.tip)
+    new_branch = global_block_tree.branch(fork, new_tip)
+
+    if any(x.invalid for x in new_branch):
+        raise Exception('Block {} builds on an invalid block'.format(new_tip.height))
+
+    if any(x.block_hash not in global_undo for x in old_branch):
+        raise Exception('Can\'t reorg {} blocks deep'.format(len(old_branch)))
+
+    pending = global_mempool.pending()
+    disconnected = [disconnect_tip() for _ in old_branch]
+
+    try:
+        for entry in new_branch:
             try:
-                misocoin_cli('receive_mined_block', [
-                             json.dumps(block.toJSON())], **node)
+                connect_tip(entry)
             except:
-                pass
+                entry.invalid = True
+                raise
+
+    except:
+        while global_block_tree.tip is not fork:
+            disconnect_tip()
+        for entry in old_branch:
+            connect_tip(entry)
+
+        refill_mempool(pending)
+        raise
+
+    # Oldest block's txs first, so parents go in before children
+    resurrected = [tx for block in reversed(disconnected) for tx in block.transactions]
+    refill_mempool(resurrected + pending)
+
+    print('[INFO] Reorg to block {}, {} blocks disconnected and {} connected'.format(
+        new_tip.height, len(old_branch), len(new_branch)))
+
+
+def refill_mempool(txs: List[Transaction]):
+    '''
+    Empties the mempool and adds txs back, the ones that
+    aren't valid on top of our chain anymore are dropped
+    '''
+    global_mempool.clear()
+    for tx in txs:
+        if tx.txid in global_txs:
+            continue
+
+        try:
+            global_mempool.add(tx, global_utxos, global_spent)
+        except Exception:
+            pass
+
+    new_template(global_block_tree.tip.block_hash, global_block_tree.tip.height + 1)
+
+
+def connect_block(block: Block):
+    '''
+    Applies a block on top of our tip to the utxo cache,
+    tx cache, best block and difficulty, all or nothing. Keeps
+    an undo record so it can be disconnected again
+
+    (Also used to replay blocks from disk on startup)
+    '''
+    global global_best_block, global_txs, global_utxos
+
+    journal = UTXOJournal(global_utxos, global_address_index, global_spent)
+    txids = list(OrderedDict.fromkeys(
+        tx.txid for tx in block.transactions if tx.txid not in global_txs))
+
+    # Add coinbase to cache
+    new_coinbase = block.coinbase.txid not in global_txs
+    if new_coinbase:
+        mutils.add_coinbase_to_utxos(
+            block.coinbase, global_utxos, global_address_index, journal)
+
+    # Add txs, their signatures are verified all at once
+    # (the coinbase is rolled back with them if they're invalid)
+    global_best_block, global_txs, global_utxos = connect_txs(
+        block.transactions, global_best_block, global_txs, global_utxos,
+        global_address_index, global_spent, global_verifier, journal
+    )
 
-        # Auto adjust difficulty ever 10 blocks
-        # Should be around 300 seconds after 10 blocks
-        last_ten_blocks = []
-        for i in range(max(1, global_best_block.height - 10), global_best_block.height - 1):
-            if i in global_blockchain:
-                last_ten_blocks.append(global_blockchain[i])
+    if new_coinbase:
+        global_txs[block.coinbase.txid] = block.coinbase
+        txids.append(block.coinbase.txid)
 
-        if (len(global_blockchain) % 10 == 0):
-            lowest_timestamp = reduce(lambda x, y: min(
-                x, y.timestamp), last_ten_blocks, int(time.time()))
-            highest_timestamp = reduce(lambda x, y: max(
-                x, y.timestamp), last_ten_blocks, genesis_epoch)
-            
-            if (highest_timestamp - lowest_timestamp < 300):
-                global_difficulty = min(global_difficulty + 1, 64)
+    global_undo[block.block_hash] = (journal.entries, txids)
+    while len(global_undo) > UNDO_DEPTH:
+        global_undo.popitem(last=False)
 
-            if (highest_timestamp - lowest_timestamp > 300):
-                global_difficulty = max(global_difficulty - 1, 1)
+    index_block(block, txids, spent_outputs(journal.entries))
 
-            print('[UPDATE] Difficulty adjusted to {}'.format(global_difficulty))
+    # Difficulty of the next block
+    global_difficulty.connect(block)
+    if global_difficulty.next != block.difficulty:
+        print('[UPDATE] Difficulty adjusted to {}'.format(global_difficulty.next))
 
-        print('[INFO] Received mined block {}'.format(block.height))
+    # Persist spent outputs (if archive is on disk)
+    global_spent.flush()
+
+    # Mined txs leave the mempool, so do the ones
+    # that spend the same outputs
+    conflicts = global_mempool.remove_for_block(block.transactions)
+    if len(conflicts) > 0:
+        print('[INFO] Removed {} txs conflicting with block {} from the mempool'.format(
+            len(conflicts), block.height))
+
+    # Start building on top of it
+    new_template(block.block_hash, block.height + 1)
+
+    # Stop mining the stale template
+    if global_miner is not None:
+        global_miner.cancel()
+
+
+def index_block(block: Block, txids: List[str], spent: Dict):
+    '''
+    Adds the txs connecting block added (txids)
+    to the indexes we keep
+    '''
+    if global_tx_index is not None:
+        global_tx_index.connect(block.height, block, txids)
+    if global_address_history is not None:
+        global_address_history.connect(block.height, block, txids, spent)
+
+
+def build_indexes(end: int, tx_index: TxIndex = None, address_history: AddressHistory = None):
+    '''
+    Indexes the blocks in our store up to end (when an index
+    is turned on for a chain we already have)
+    '''
+    seen = set()
+    for height in range(1, end + 1):
+        block = global_store[height]
+        txids = [tx.txid for tx in block_txs(block) if tx.txid not in seen]
+        seen.update(txids)
+
+        if tx_index is not None:
+            tx_index.connect(height, block, txids)
+
+        if address_history is not None:
+            # Everything the block spent is in the archive by now
+            spent = {}
+            for tx in block.transactions:
+                for vin in tx.vins:
+                    utxo = global_spent.get(vin.txid, vin.index)
+                    if utxo is not None:
+                        spent[(vin.txid, vin.index)] = utxo
+
+            address_history.connect(height, block, txids, spent)
+
+
+def build_template(prev_block_hash: str, height: int) -> Tuple[Block, int]:
+    '''
+    Block on top of prev_block_hash filled with the highest
+    fee rate txs in the mempool, and the fees they pay
+    '''
+    txs, fees = global_mempool.select(MAX_TEMPLATE_TXS)
+    block = Block(
+        prev_block_hash=prev_block_hash,
+        transactions=txs,
+        height=height,
+        timestamp=int(time.time()),
+        difficulty=global_difficulty.expected(height),
+        nonce=0
+    )
+    return block, fees
+
+
+def new_template(prev_block_hash: str, height: int):
+    '''
+    Replaces global_best_block with a fresh template
+    on top of prev_block_hash
+    '''
+    global global_best_block, global_template_fees
+
+    global_best_block, global_template_fees = build_template(prev_block_hash, height)
+
+
+def save_chain_state(height: int):
+    '''
+    Snapshots everything needed to restart without
+    replaying the blocks up to height
+    '''
+    global_store.save_snapshot({
+        'height': height,
+        'block_hash': global_block_tree.tip.block_hash,
+        'block_tree': global_block_tree,
+        'undo': global_undo,
+        'difficulty': global_difficulty,
+        'tx_index': global_tx_index,
+        'address_history': global_address_history,
+        'utxos': global_utxos,
+        'address_index': global_address_index,
+        'txs': global_txs,
+        'best_block': global_best_block,
+        # On disk archive persists itself
+        'spent': global_spent if global_spent.path is None else None
+    })
+
+
+def load_chain(datadir: str) -> bool:
+    '''
+    Opens the block store in datadir, loads the last snapshot
+    and replays only the blocks stored after it. Returns False
+    if datadir was written by an older version
+    '''
+    return global_chain.submit(_load_chain, datadir)
+
+
+def _load_chain(datadir: str) -> bool:
+    global global_store, global_blockchain, global_best_block, global_txs, \
+        global_utxos, global_address_index, global_spent, global_difficulty, \
+        global_block_tree, global_undo, global_tx_index, global_address_history
+
+    store = BlockStore(datadir)
+    if store.version() != BYTES_VERSION:
+        print('[ERROR] {} was written by an older version of misocoin (block format {}, '
+              'we use {}), resync into a fresh datadir'.format(
+                  datadir, store.version(), BYTES_VERSION))
+        store.close()
+        return False
+
+    global_store = store
+    global_blockchain = global_store
+
+    start = 1
+    state = global_store.load_snapshot()
+
+    # Our chain got reorged below the snapshot
+    if state is not None and \
+            state['block_hash'] != global_store[state['height']].block_hash:
+        state = None
+
+    if state is not None:
+        global_difficulty = state['difficulty']
+        global_utxos = state['utxos']
+        global_address_index = state['address_index']
+        global_txs = state['txs']
+        global_best_block = state['best_block']
+        if state['spent'] is not None:
+            global_spent = state['spent']
+        start = state['height'] + 1
+
+        global_block_tree = state['block_tree']
+        global_block_tree.tip = global_block_tree.get(state['block_hash'])
+        global_undo = state['undo']
+
+        # Indexes turned on since the snapshot was
+        # taken are built from the blocks in the store
+        tx_index, address_history = None, None
+        if global_tx_index is not None:
+            if state.get('tx_index') is None:
+                tx_index = global_tx_index
+            else:
+                global_tx_index = state['tx_index']
+
+        if global_address_history is not None:
+            if state.get('address_history') is None:
+                address_history = global_address_history
+            else:
+                global_address_history = state['address_history']
+
+        build_indexes(start - 1, tx_index, address_history)
+
+    for height in range(start, len(global_store) + 1):
+        block = global_store[height]
+        entry = global_block_tree.add(block)
+        connect_block(block)
+        entry.block = None
+        global_block_tree.tip = entry
+
+    print('[INFO] Loaded {} blocks from {} ({} replayed)'.format(
+        len(global_store), datadir, len(global_store) - start + 1))
+    return True
 
 
 def mine_block(block: Block, address: str):
     '''
     Mines a block and returns its mined hash
     '''
-    global global_best_block
-
-    # Oh wow state mutation :(
-    # Too pleb to do this in a pure way
     while True:
-        global_best_block.nonce += 1
-
-        if global_best_block.mined:
-            # Find fees in the block
-            fees = reduce(lambda x, y: x + mutils.get_fees(y, global_utxos),
-                          global_best_block.transactions, 0)
-            reward_amount = 15 + fees
-
-            # Reward miner who found the right nonce
-            # With 15 misocoin + fees in the block
-            coinbase = Coinbase(
-                global_best_block.prev_block_hash, address, reward_amount
-            )
-            global_best_block.coinbase = coinbase
-
-            # Add coinbase to utxo and txs
-            # Coinbase's vout will only contain
-            # 1 item
-            global_utxos[coinbase.txid] = {}
-            global_utxos[coinbase.txid][0] = {
-                'address': address,
-                'amount': reward_amount,
-                'spent': None
-            }
-            global_txs[coinbase.txid] = coinbase
-
-            # Add to blockchain
-            mined_block = copy.deepcopy(global_best_block)
-            add_to_blockchain(mined_block)
+        # Mine a copy of a fresh template (with the txs that came
+        # in since the last one), only hash the transactions once
+        # per template, the workers just hash the nonce and timestamp
+        template, generation = global_chain.submit(_take_template)
+
+        nonce = global_miner.mine(
+            template.mining_hasher(), template.difficulty,
+            template.timestamp, template.nonce + 1, generation
+        )
+
+        # Got cancelled (new block arrived), mine the new one
+        if nonce is None:
+            continue
+
+        print('[INFO] Hashrate {:.0f} H/s'.format(global_miner.hashrate))
+
+        mined_block = global_chain.submit(
+            _add_mined_block, template, nonce, address)
+
+        # Template changed underneath us
+        if mined_block is not None:
             return mined_block
 
 
+def refresh_template() -> Block:
+    '''
+    Refills the best block from the mempool,
+    returns a copy of it
+    '''
+    return global_chain.submit(_refresh_template)
+
+
+def _refresh_template() -> Block:
+    new_template(global_best_block.prev_block_hash, global_best_block.height)
+    return copy.copy(global_best_block)
+
+
+def _take_template() -> Tuple[Block, int]:
+    '''
+    Fresh template to mine, with the miner's generation at the
+    time (cancels for new blocks happen on this thread too, so
+    any that come after it make mine() give up on the template)
+    '''
+    return _refresh_template(), global_miner.generation
+
+
+def _add_mined_block(template: Block, nonce: int, address: str):
+    '''
+    Adds the best block, mined with nonce, to the blockchain.
+    Returns None if the best block isn't template anymore
+    '''
+    global global_best_block
+
+    # Same header as the best block (the txs through the merkle
+    # root), so the nonce solves it too
+    if template.prev_block_hash != global_best_block.prev_block_hash or \
+            template.timestamp != global_best_block.timestamp or \
+            template.merkle_root != global_best_block.merkle_root:
+        return None
+
+    block = global_best_block
+    block.nonce = nonce
+
+    # Reward miner who found the right nonce
+    # With 15 misocoin + fees in the block
+    reward_amount = 15 + global_template_fees
+    coinbase = Coinbase(
+        block.prev_block_hash, address, reward_amount
+    )
+    block.coinbase = coinbase
+
+    # Add to blockchain (connecting it adds the
+    # coinbase and txs to the utxos)
+    mined_block = copy.deepcopy(block)
+    add_to_blockchain(mined_block)
+    return mined_block
+
+
 @dispatcher.add_method
 def get_balance():
-    global global_utxos
+    # Read on the writer, so a block being connected
+    # doesn't show up in one of them and not the other
+    return global_chain.submit(_balance, account_address)
 
-    total = 0
-    for txid in global_utxos:
-        for index in global_utxos[txid]:
-            if global_utxos[txid][index]['address'] == account_address:
-                if global_utxos[txid][index]['spent'] is None:
-                    total += global_utxos[txid][index]['amount']
 
-    return {'address': account_address, 'amount': total}
+def _balance(address: str) -> Dict:
+    # amount counts txs in the mempool, pending
+    # is how much of it they account for
+    pending = global_mempool.balance(address)
+    return {
+        'address': address,
+        'amount': global_address_index.balance(address) + pending,
+        'pending': pending
+    }
+
+
+def _spendable(address: str) -> List[Tuple[str, int, int]]:
+    '''
+    (txid, index, amount) of address' outputs that no
+    mempool tx spends, including ones created by mempool txs
+    '''
+    confirmed = [utxo for utxo in global_address_index.unspent(address)
+                 if not global_mempool.is_spent(utxo[0], utxo[1])]
+    return confirmed + global_mempool.unspent(address)
 
 
 @dispatcher.add_method
-def send_misocoin(to_address: str, amount: int):
-    global global_utxos
-    # I know this is slow in recovering the utxos, but ceebs
+def send_misocoin(to_address: str, amount: int, coin_selection: str = None):
+    '''
+    coin_selection overrides -coin_selection for this tx
+    '''
     try:
-        accumulated_amount = 0
         send_amount = int(amount)
-        vins: List[Vin] = []
         vouts: List[Vout] = [Vout(to_address, send_amount)]
 
         # Check that the to_address is valid sha1 hash
         if len(to_address.encode('utf-8')) != 40: # hex lenght of sha1 hash
             return {'error': 'The destination address is not valid'}
 
-        # Construct vins and vouts
-        for txid in global_utxos:
-            for index in global_utxos[txid]:
-                if global_utxos[txid][index]['address'] == account_address:
-                    if global_utxos[txid][index]['spent'] is None:
-                        accumulated_amount += global_utxos[txid][index]['amount']
-                        vins.append(Vin(txid, index))
-
-                        if (accumulated_amount >= send_amount):
-                            break
+        if send_amount <= 0:
+            return {'error': 'Can only send a positive amount'}
 
-            if (accumulated_amount >= send_amount):
-                break
-
-        if (accumulated_amount < send_amount):
-            return {'error': 'You\'re trying to send {} misocoin when you have {} misocoin'.format(send_amount, accumulated_amount)}
+        # Construct vins and vouts
+        # Only need to look at our own unspent coins
+        coins = select_coins(
+            global_chain.submit(_spendable, account_address), send_amount,
+            coin_selection or global_coin_selection
+        )
+        vins: List[Vin] = [Vin(txid, index) for txid, index, _ in coins]
+        accumulated_amount = sum(coin[2] for coin in coins)
 
         # Send remaining to self
         if (accumulated_amount > send_amount):
             vouts.append(
                 Vout(account_address, accumulated_amount - send_amount))
 
-        # Create tx object and sign it
-        tx = Transaction(vins, vouts)
-
-        for i in range(len(tx.vins)):
-            tx = mutils.sign_tx(tx, i, account_priv_key)
+        # Create tx object and sign all of it at once
+        tx = sign_all(Transaction(vins, vouts), account_key)
 
         # Send raw tx and return the txid
         return send_raw_tx(json.dumps(tx.toJSON()))
@@ -287,16 +914,19 @@ def send_misocoin(to_address: str, amount: int):
 
 @dispatcher.add_method
 def get_info():
+    snapshot = global_chain.snapshot
     return {
-        'height': len(global_blockchain),
+        'height': snapshot.height,
         'connections': len(global_nodes),
-        'difficulty': global_difficulty
+        'difficulty': snapshot.difficulty,
+        'mempool': len(global_mempool),
+        'hashrate': 0 if global_miner is None else global_miner.hashrate
     }
 
 
 @dispatcher.add_method
 def get_best_block():
-    return global_best_block.toJSON()
+    return global_chain.snapshot.best_block.toJSON()
 
 
 @dispatcher.add_method
@@ -309,6 +939,84 @@ def get_block(i: int):
     return {'error': 'Block not found'}
 
 
+def get_block_by_hash(block_hash: str) -> Block:
+    '''
+    Block in our chain or a competing one, None if we don't have it
+    '''
+    entry = global_block_tree.get(block_hash)
+    if entry is None or entry.height == 0:
+        return None
+
+    block = entry.block
+    if block is None:
+        try:
+            block = global_blockchain[entry.height]
+        except KeyError:
+            return None
+    return block if block.block_hash == block_hash else None
+
+
+@dispatcher.add_method
+def get_block_template():
+    '''
+    Fresh block template (with the best paying txs
+    in the mempool) for an outside miner. Our own
+    miner's template is left alone
+    '''
+    return global_chain.submit(_outside_template).toJSON()
+
+
+def _outside_template() -> Block:
+    tip = global_block_tree.tip
+    return build_template(tip.block_hash, tip.height + 1)[0]
+
+
+@dispatcher.add_method
+def get_block_raw(i: int):
+    try:
+        return encode_block(global_blockchain[int(i)])
+
+    except Exception as e:
+        return {'error': str(e)}
+
+
+@dispatcher.add_method
+def get_blocks(start: int, count: int):
+    '''
+    Up to MAX_BLOCKS_PER_REQUEST blocks from height start
+    onwards, in the same format as get_block_raw
+    '''
+    try:
+        start = int(start)
+        end = min(start + min(int(count), MAX_BLOCKS_PER_REQUEST),
+                  global_chain.snapshot.height + 1)
+        return [encode_block(global_blockchain[i]) for i in range(max(start, 1), end)]
+
+    except Exception as e:
+        return {'error': str(e)}
+
+
+@dispatcher.add_method
+def get_headers(start: int, count: int):
+    '''
+    Up to MAX_HEADERS_PER_REQUEST block headers from
+    height start onwards
+    '''
+    try:
+        start = int(start)
+        end = min(start + min(int(count), MAX_HEADERS_PER_REQUEST),
+                  global_chain.snapshot.height + 1)
+
+        headers = []
+        for i in range(max(start, 1), end):
+            block = global_blockchain[i]
+            headers.append({**block.header(), 'block_hash': block.block_hash})
+        return headers
+
+    except Exception as e:
+        return {'error': str(e)}
+
+
 @dispatcher.add_method
 def create_raw_tx(vins, vouts):
     try:
@@ -332,42 +1040,195 @@ def sign_raw_tx(tx: str, idx: int, pk: str):
         return {'error': str(e)}
 
 
+@dispatcher.add_method
+def sign_raw_tx_all(tx: str, pk: str = None):
+    '''
+    Signs every vin of tx with pk (our own
+    key if there's none) in one go
+    '''
+    try:
+        tx = Transaction.fromJSON(json.loads(tx))
+        key = account_key if pk is None else Key(pk)
+        return sign_all(tx, key).toJSON()
+
+    except Exception as e:
+        return {'error': str(e)}
+
+
 @dispatcher.add_method
 def get_tx(txid: str):
     txid = str(txid)
     if txid in global_txs:
         return global_txs[txid].toJSON()
+
+    tx = global_mempool.get(txid)
+    if tx is not None:
+        return tx.toJSON()
     return {'error': 'txid not found'}
 
 
 @dispatcher.add_method
-def send_raw_tx(tx: str):
-    global global_best_block, global_txs, global_utxos
+def get_tx_location(txid: str):
+    '''
+    Block (height and hash) a tx is in, and its position
+    in it (0 is the coinbase). Needs -txindex=1
+    '''
+    if global_tx_index is None:
+        return {'error': 'Tx index is off, start the node with -txindex=1'}
+
+    txid = str(txid)
+    location = global_tx_index.get(txid)
+    if location is None:
+        if txid in global_mempool:
+            return {'txid': txid, 'height': None, 'position': None, 'block_hash': None}
+        return {'error': 'txid not found'}
 
+    height, position = location
     try:
-        # Original tx
-        _tx_og = copy.deepcopy(tx)
+        block_hash = global_blockchain[height].block_hash
+    except KeyError:
+        # Got disconnected in the meantime
+        return {'error': 'txid not found'}
 
-        # Create new tx from the json dump
-        tx = Transaction.fromJSON(json.loads(tx))
+    return {'txid': txid, 'height': height, 'position': position, 'block_hash': block_hash}
+
+
+def _page(offset, limit):
+    offset = max(0, int(offset))
+    limit = min(max(0, int(limit)), MAX_HISTORY_PER_REQUEST)
+    return offset, limit
+
+
+@dispatcher.add_method
+def get_address_history(address: str, offset: int = 0, limit: int = 100):
+    '''
+    Txs in our chain that paid or spent from address, oldest
+    first, limit (at most MAX_HISTORY_PER_REQUEST) of them
+    starting at offset. Needs -addressindex=1
+    '''
+    if global_address_history is None:
+        return {'error': 'Address index is off, start the node with -addressindex=1'}
+
+    try:
+        offset, limit = _page(offset, limit)
+        entries = global_address_history.get(address, offset, limit)
+        return {
+            'address': address,
+            'total': global_address_history.count(address),
+            'offset': offset,
+            'history': [
+                {'height': height, 'txid': txid, 'received': received, 'sent': sent}
+                for height, txid, received, sent in entries
+            ]
+        }
+
+    except Exception as e:
+        return {'error': str(e)}
+
+
+def _address_utxos(address: str, offset: int, limit: int):
+    outpoints = global_address_index.outpoints.get(address, {})
+    return len(outpoints), [
+        {'txid': txid, 'index': index, 'amount': amount}
+        for (txid, index), amount in itertools.islice(outpoints.items(), offset, offset + limit)
+    ]
+
+
+@dispatcher.add_method
+def get_address_utxos(address: str, offset: int = 0, limit: int = 100):
+    '''
+    Confirmed unspent outputs of address, limit (at most
+    MAX_HISTORY_PER_REQUEST) of them starting at offset
+    '''
+    try:
+        offset, limit = _page(offset, limit)
+        total, utxos = global_chain.submit(_address_utxos, address, offset, limit)
+        return {'address': address, 'total': total, 'offset': offset, 'utxos': utxos}
 
-        # If is new tx then add it to block
-        if tx.txid not in global_txs:
-            # Add tx to global best block
-            global_best_block, global_txs, global_utxos = mutils.add_tx_to_block(
-                tx, global_best_block, global_txs, global_utxos
-            )
+    except Exception as e:
+        return {'error': str(e)}
 
-            print('[INFO] txid {} added to block {}'.format(
-                tx.txid, global_best_block.height))
 
+@dispatcher.add_method
+def get_tx_proof(txid: str, height: int = None):
+    '''
+    Merkle branch from txid to the merkle root of the block
+    it's in, with the block's header. The block is found with
+    -txindex=1, or is the one at height.
+
+    Check it with misocoin.merkle.verify_tx_proof
+    '''
+    try:
+        txid = str(txid)
+        if height is None:
+            if global_tx_index is None:
+                return {'error': 'Tx index is off, start the node with -txindex=1 '
+                                 '(or give the height of the tx\'s block)'}
+
+            location = global_tx_index.get(txid)
+            if location is None:
+                return {'error': 'txid not found'}
+            height = location[0]
+
+        block = global_blockchain[int(height)]
+        if block.coinbase is not None and block.coinbase.txid == txid:
+            return {'error': 'Coinbases aren\'t in the merkle tree'}
+
+        txids = block.txids()
+        if txid not in txids:
+            return {'error': 'Tx {} isn\'t in block {}'.format(txid, block.height)}
+
+        return {
+            'txid': txid,
+            'block_hash': block.block_hash,
+            'header': block.header(),
+            'branch': merkle_branch(txids, txids.index(txid))
+        }
+
+    except KeyError:
+        return {'error': 'Block {} not found'.format(height)}
+
+    except Exception as e:
+        return {'error': str(e)}
+
+
+@dispatcher.add_method
+def get_mempool():
+    '''
+    Txids waiting to be mined, highest ancestor
+    fee rate first
+    '''
+    return global_mempool.txids()
+
+
+@dispatcher.add_method
+def get_txout(txid: str, index: int):
+    txid = str(txid)
+    index = int(index)
+
+    # Outputs are archived before they leave the utxo
+    # cache, so looking at the cache first never misses one
+    utxo = global_utxos.get(txid, {}).get(index)
+    if utxo is not None:
+        return {**utxo, 'spent': None}
+
+    utxo = global_spent.get(txid, index)
+    if utxo is not None:
+        return utxo
+    return {'error': 'txout not found'}
+
+
+@dispatcher.add_method
+def send_raw_tx(tx: str, origin: str = None):
+    try:
+        # Create new tx from the json dump
+        tx = Transaction.fromJSON(json.loads(tx))
+
+        # If is new tx then add it to the mempool
+        if global_chain.submit(_add_tx, tx):
             # Broadcast transaction to connected nodes
-            for node in global_nodes:
-                try:
-                    misocoin_cli('send_raw_tx', [
-                                 json.dumps(tx.toJSON())], **node)
-                except Exception as e:
-                    pass
+            relay(['tx', tx.txid], 'send_raw_tx',
+                  [json.dumps(tx.toJSON())], origin)
 
         return {'txid': tx.txid}
 
@@ -375,23 +1236,148 @@ def send_raw_tx(tx: str):
         return {'error': str(e)}
 
 
-@dispatcher.add_method
-def receive_mined_block(block_str: str):
-    global global_best_block, global_blockchain
+def _add_tx(tx: Transaction) -> bool:
+    '''
+    Adds tx to the mempool, returns False if we already have it
+    '''
+    if tx.txid in global_txs or tx.txid in global_mempool:
+        return False
+
+    global_mempool.add(tx, global_utxos, global_spent)
+
+    print('[INFO] txid {} added to the mempool'.format(tx.txid))
+    return True
+
+
+def _add_txs(txs: List[Transaction]) -> List[Tuple[Transaction, str]]:
+    '''
+    Adds a batch of txs to the mempool, returns
+    (tx, error) for every one we didn't have
+    '''
+    added = add_txs_to_mempool(
+        txs, global_mempool, global_txs, global_utxos,
+        global_spent, global_verifier
+    )
+
+    for tx, error in added:
+        if error is None:
+            print('[INFO] txid {} added to the mempool'.format(tx.txid))
+    return added
+
 
+@dispatcher.add_method
+def receive_mined_block(block_str: str, origin: str = None):
     try:
-        block: Block = Block.fromJSON(json.loads(block_str))
-        add_to_blockchain(block)
+        block: Block = decode_block(block_str)
+        add_to_blockchain(block, origin=origin)
         return {'success': True}
 
     except Exception as e:
         return {'error': str(e)}
 
 
+@dispatcher.add_method
+def inv(items: List, origin: str):
+    '''
+    origin ('host:port') has the txs and blocks in items
+    (see relay), fetches the ones we don't have from it
+    '''
+    wanted = []
+
+    with global_requested_lock:
+        for item in items:
+            global_broadcaster.mark_seen(item[1], origin)
+
+            if item[1] in global_requested:
+                continue
+
+            if (item[0] == 'tx' and item[1] not in global_txs and item[1] not in global_mempool) or \
+                    (item[0] == 'block' and item[1] not in global_block_tree):
+                global_requested.add(item[1])
+                wanted.append(item)
+
+    if len(wanted) > 0:
+        global_broadcaster.request(
+            key_node(origin), 'get_data', [wanted],
+            partial(receive_data, wanted, origin)
+        )
+
+    return {'success': True}
+
+
+def receive_data(wanted: List, origin: str, data: List):
+    '''
+    Adds the txs and blocks we asked origin for
+    '''
+    try:
+        data = data if isinstance(data, list) else []
+
+        # Txs are added as a batch
+        txs = []
+        for entry in data:
+            try:
+                if 'tx' in entry:
+                    txs.append(Transaction.fromJSON(json.loads(entry['tx'])))
+            except Exception:
+                pass
+
+        for tx, error in global_chain.submit(_add_txs, txs):
+            if error is None:
+                relay(['tx', tx.txid], 'send_raw_tx',
+                      [json.dumps(tx.toJSON())], origin)
+
+        for entry in data:
+            if 'block' in entry:
+                receive_mined_block(entry['block'], origin)
+
+    finally:
+        # If we didn't get them, the next node
+        # that announces them can send them
+        with global_requested_lock:
+            for item in wanted:
+                global_requested.discard(item[1])
+
+
+@dispatcher.add_method
+def get_data(items: List):
+    '''
+    Returns the txs and blocks in items (see relay) we have
+    '''
+    data = []
+    for item in items:
+        if item[0] == 'tx':
+            tx = global_txs.get(item[1]) or global_mempool.get(item[1])
+            if tx is not None:
+                data.append({'tx': json.dumps(tx.toJSON())})
+
+        elif item[0] == 'block':
+            block = get_block_by_hash(item[1])
+            if block is not None:
+                data.append({'block': encode_block(block)})
+
+    return data
+
+
+@dispatcher.add_method
+def get_net_totals():
+    with global_net_totals_lock:
+        return dict(global_net_totals)
+
+
+def count_request(bytes_recv: int, bytes_sent: int):
+    with global_net_totals_lock:
+        global_net_totals['requests'] += 1
+        global_net_totals['bytes_recv'] += bytes_recv
+        global_net_totals['bytes_sent'] += bytes_sent
+
+
 @Request.application
 def misocoin_app(request):
     response = JSONRPCResponseManager.handle(request.data, dispatcher)
-    return Response(response.json, mimetype='application/json')
+    response_json = response.json
+
+    count_request(len(request.data), len(response_json))
+    return Response(response_json, mimetype='application/json')
 
 
 # Block management
@@ -411,26 +1397,17 @@ def block_management():
         # if 30 seconds has passed since last mining
         if (time.time() - last_mined_time > 30):
             # Mine block
-            mined_block = mine_block(global_best_block, account_address)
+            try:
+                mined_block = mine_block(global_best_block, account_address)
+            except Exception as e:
+                print('[ERROR] Mining failed: {}'.format(e))
+                continue
 
+            # add_to_blockchain has already broadcasted it
             if (mined_block.coinbase.reward_address == account_address):
                 print('[SUCCESS] You found the nonce for block {}'.format(
                     mined_block.height))
 
-            # Broadcast block to nodes
-            mined_block_str = json.dumps(mined_block.toJSON())
-            for node in global_nodes:
-                # If node['host'] is in black list then continue
-                if node['host'] in global_blacklisted_nodes:
-                    continue
-
-                try:
-                    misocoin_cli('receive_mined_block', [
-                                 mined_block_str], **node)
-
-                except:
-                    pass
-
 
 @dispatcher.add_method
 def init_connection(host, port):
@@ -438,8 +1415,9 @@ def init_connection(host, port):
 
     # Check if we already have the node,
     # add it if we dont
-    has_node = reduce(lambda x, y: x and (
-        y['host'] == host), global_nodes, False)
+    # (the same node announces itself every time it starts)
+    has_node = any(node_key(x) == '{}:{}'.format(host, port)
+                   for x in global_nodes)
     if not has_node:
         global_nodes.append({'host': host, 'port': port})
     return json.dumps(global_nodes)
@@ -452,7 +1430,7 @@ def sync_with_nodes():
     global global_nodes
 
     # Init connection
-    for node in global_nodes:
+    for node in list(global_nodes):
         try:
             misocoin_cli('init_connection', [global_host, global_port], **node)
         except:
@@ -483,31 +1461,58 @@ def sync_with_nodes():
 
         # Syncs with that node
         if longest_node is not None:
-            latest_block_dict: Dict = misocoin_cli(
-                'get_block', [best_height], **longest_node)
-            latest_block: Block = Block.fromJSON(latest_block_dict)
+            try:
+                catch_up(longest_node, best_height)
 
-            # Append to latest blockchain
-            add_to_blockchain(latest_block)
+            except Exception as e:
+                print('[ERROR] Syncing with {}:{} failed: {}'.format(
+                    longest_node['host'], longest_node['port'], e))
 
         time.sleep(10)
 
 
-def run_misocoin(host='localhost', port=4000, nodes=['localhost:4000'], **kwargs):
-    t1 = threading.Thread(target=partial(
-        run_simple, threaded=True, request_handler=MisocoinRequestHandler), args=(host, port, misocoin_app))
+def run_misocoin(host='localhost', port=4000, nodes=['localhost:4000'], miners=1,
+                 rpc='werkzeug', rpc_concurrency=16, verifiers=os.cpu_count(),
+                 datadir=None, **kwargs):
+    global global_miner, global_verifier
+
+    # Start the mining and signature verifying processes
+    # before any threads (forking copies only the calling
+    # thread). The chain writer's thread only starts with
+    # the first change to the chain, e.g. loading it below
+    port = int(port)
+    miners = int(miners)
+    if miners > 0:
+        global_miner = Miner(miners)
+    global_verifier = SignatureVerifier(int(verifiers))
+
+    # Persistent block store
+    if datadir is not None and not load_chain(datadir):
+        sys.exit(1)
+
+    # -rpc=async serves requests from an event loop
+    # (with at most -rpc_concurrency running at once)
+    # instead of a thread per request
+    if rpc == 'async':
+        server = AsyncRPCServer(
+            dispatcher, host, port, rpc_concurrency, on_request=count_request)
+        t1 = threading.Thread(target=server.serve_forever)
+    else:
+        t1 = threading.Thread(target=partial(
+            run_simple, threaded=True, request_handler=MisocoinRequestHandler), args=(host, port, misocoin_app))
     t1.daemon = True
     t1.start()
 
     t2 = threading.Thread(target=sync_with_nodes, args=())
     t2.start()
 
-    t3 = threading.Thread(target=block_management, args=())
-    t3.start()    
+    # Only mine if we have miners
+    if global_miner is not None:
+        t3 = threading.Thread(target=block_management, args=())
+        t3.start()
+        t3.join()
 
-    t1.join()    
     t2.join()
-    t3.join()
 
 
 if __name__ == '__main__':
@@ -528,8 +1533,34 @@ if __name__ == '__main__':
         ':')[0], 'port': x.split(':')[1]}, global_nodes))
 
     # account private key
-    account_priv_key = config_kwargs.get('priv_key', get_new_priv_key())
-    account_address = get_address(get_pub_key(account_priv_key))    
+    account_key = global_keystore.add(config_kwargs.get('priv_key', get_new_priv_key()))
+    account_priv_key = account_key.priv_key
+    account_address = account_key.address
+
+    # Timeouts when talking to other nodes
+    set_timeouts(config_kwargs.get('connect_timeout'),
+                 config_kwargs.get('read_timeout'))
+
+    # On-disk spent output archive
+    if 'spent_db' in config_kwargs:
+        global_spent = SpentArchive(config_kwargs['spent_db'])
+
+    global_relay = config_kwargs.get('relay', global_relay)
+    global_coin_selection = config_kwargs.get('coin_selection', global_coin_selection)
+
+    if config_kwargs.get('txindex') == '1':
+        global_tx_index = TxIndex()
+    if config_kwargs.get('addressindex') == '1':
+        global_address_history = AddressHistory()
+    if config_kwargs.get('broadcast') == 'serial':
+        global_broadcaster = Broadcaster(background=False)
+
+    if 'mempool_size' in config_kwargs:
+        global_mempool.max_size = int(config_kwargs['mempool_size']) * 1000 * 1000
+
+    # Persistent block store (loaded by run_misocoin)
+    global_snapshot_every = int(config_kwargs.get(
+        'snapshot_every', global_snapshot_every))
 
     print('** [Welcome] Your misocoin address is {}'.format(account_address))
 